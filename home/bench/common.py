@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import create_app
+from src.models.user import db
+
+ADMIN_HEADERS = {"X-Admin-Auth": "SUPER_SECRET_ADMIN_KEY"}
+
+def make_app(database_uri="sqlite://", **config):
+    """The real application (create_app) against a local database, for benchmarks."""
+    settings = {
+        "SQLALCHEMY_DATABASE_URI": database_uri,
+        "SECRET_KEY": "bench-secret",
+        "PLATFORM_FEE_PERCENTAGE": 15.0,
+        "STRIPE_WEBHOOK_SECRET": "whsec_bench",
+        "UPLOAD_FOLDER": os.path.join(os.getcwd(), "uploads")
+    }
+    settings.update(config)
+    app = create_app(settings)
+    with app.app_context():
+        db.create_all(bind_key=None)
+    return app
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
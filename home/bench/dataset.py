@@ -0,0 +1,195 @@
+"""Seed a database with a synthetic, reproducible dataset across the src/models tables.
+
+Users (1% coaches), content spread over those coaches, subscriptions (80% still active),
+pay-per-view purchases, a transaction ledger with fees and refunds, completed payouts, and
+the earnings and revenue rollups built from the ledger. Same arguments and --seed, same rows
+(timestamps are relative to when it runs).
+Writes a manifest (id ranges, counts, the shared password) that bench/load.py reads:
+
+    python -m bench.dataset --database sqlite:////tmp/bench.db --users 1000000 --contents 5000000 \\
+        --transactions 20000000 --manifest /tmp/bench-dataset.json
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from array import array
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+from bench.common import make_app
+from bench.search_index import random_text
+from src.models.user import User, db
+from src.models.content import Content
+from src.models.monetization import Subscription, PayPerViewPurchase
+from src.models.finance import Transaction, Payout
+
+PASSWORD = "bench-password" # Every seeded user's password, so the load test can log in
+COACH_RATIO = 0.01
+FEE_PERCENTAGE = 15.0
+
+def _batches(total, batch_size):
+    for start in range(0, total, batch_size):
+        yield start, min(start + batch_size, total)
+
+def _insert(model, total, batch_size, make_row, log):
+    started = time.perf_counter()
+    for start, end in _batches(total, batch_size):
+        rows = [make_row(i) for i in range(start, end)]
+        # One executemany needs one key set: rows that leave a nullable column out get NULL
+        keys = set().union(*rows)
+        db.session.execute(insert(model.__table__), [{key: row.get(key) for key in keys} for row in rows])
+        db.session.commit()
+        if end % (batch_size * 50) == 0 or end == total:
+            log(f"{model.__tablename__}: {end:,}/{total:,} ({end / (time.perf_counter() - started):,.0f} rows/s)")
+
+def generate(users, contents, transactions, subscriptions=None, purchases=None, payouts=None, days=365,
+             seed=0, batch_size=10000, rollups=True, search_index=False, log=print):
+    """Insert the dataset into the current app's database; returns its manifest.
+
+    Ids are assigned here, not by the database: coaches are users 1..coaches, fans the rest,
+    and content/transactions are numbered from 1, so the manifest describes them as ranges.
+    """
+    rng = random.Random(seed)
+    coaches = max(1, int(users * COACH_RATIO))
+    fans = users - coaches
+    if fans < 1 or contents < 1:
+        raise ValueError("Need at least one fan and one content item")
+    subscriptions = fans if subscriptions is None else subscriptions
+    purchases = fans // 2 if purchases is None else purchases
+    payouts = coaches * 3 if payouts is None else payouts
+    now = datetime.utcnow().replace(microsecond=0)
+    horizon = days * 24 * 3600
+
+    def ago():
+        return now - timedelta(seconds=rng.randrange(horizon))
+    def fan():
+        return coaches + 1 + rng.randrange(fans)
+    def coach():
+        return 1 + rng.randrange(coaches)
+
+    password_hash = generate_password_hash(PASSWORD) # Hashing once keeps a 1M-user seed fast
+    _insert(User, users, batch_size, lambda i: {
+        "id": i + 1, "email": f"user{i + 1}@bench", "password_hash": password_hash,
+        "role": "coach" if i < coaches else "fan", "username": f"user{i + 1}",
+        "bio": random_text(rng, 12) if i < coaches else None,
+        "stripe_account_id": f"acct_bench{i + 1}" if i < coaches else None, "version": 1}, log)
+
+    content_coach = array("I") # content id - 1 -> coach id, to attribute PPV sales
+    def content_row(i):
+        coach_id = coach()
+        content_coach.append(coach_id)
+        created_at = ago()
+        content_type = rng.choices(("text", "image", "video"), (80, 15, 5))[0]
+        row = {"id": i + 1, "coach_id": coach_id, "title": random_text(rng, 5), "description": random_text(rng, 25),
+               "content_type": content_type, "access_setting": "paywall" if rng.random() < 0.6 else "free",
+               "created_at": created_at, "updated_at": created_at}
+        if content_type == "text":
+            row["text_content"] = random_text(rng, 60)
+        else:
+            # No files behind these keys: detail views sign URLs, nothing is served
+            key = f"bench/{uuid.UUID(int=rng.getrandbits(128)).hex}"
+            row.update({"file_url": f"{key}.{'jpg' if content_type == 'image' else 'mp4'}",
+                        "thumbnail_key": f"{key}.thumb.jpg", "web_key": f"{key}.web.jpg",
+                        "processing_status": "ready", "file_size": rng.randrange(10 ** 5, 10 ** 8),
+                        "width": 1920, "height": 1080,
+                        "duration_seconds": rng.uniform(30, 3600) if content_type == "video" else None})
+        return row
+    _insert(Content, contents, batch_size, content_row, log)
+
+    def subscription_row(i):
+        start_date = ago()
+        yearly = rng.random() < 0.2
+        end_date = start_date + timedelta(days=365 if yearly else 30)
+        if rng.random() < 0.8 and end_date <= now:
+            end_date = now + timedelta(days=rng.randrange(1, 30)) # Renewed: still active
+        return {"id": i + 1, "fan_id": fan(), "coach_id": coach(), "subscription_type": "yearly" if yearly else "monthly",
+                "start_date": start_date, "end_date": end_date, "is_active": end_date > now}
+    _insert(Subscription, subscriptions, batch_size, subscription_row, log)
+
+    owned = set() # uq_ppv_fan_content
+    def purchase_row(i):
+        while True:
+            pair = (fan(), 1 + rng.randrange(contents))
+            if pair not in owned:
+                owned.add(pair)
+                return {"id": i + 1, "fan_id": pair[0], "content_id": pair[1], "purchase_date": ago(), "amount_paid": 5.0}
+    _insert(PayPerViewPurchase, purchases, batch_size, purchase_row, log)
+    owned.clear()
+
+    def transaction_row(i):
+        created_at = ago()
+        row = {"id": i + 1, "user_id": fan(), "currency": "usd", "created_at": created_at, "updated_at": created_at,
+               "stripe_payment_intent_id": f"pi_bench_{i + 1}",
+               "status": rng.choices(("succeeded", "refunded", "failed"), (97, 2, 1))[0]}
+        if rng.random() < 0.6:
+            row.update(transaction_type="subscription_payment", coach_id=coach(), amount=rng.choice((10.0, 100.0)))
+        else:
+            content_id = 1 + rng.randrange(contents)
+            row.update(transaction_type="ppv_purchase", coach_id=content_coach[content_id - 1], content_id=content_id,
+                       amount=5.0)
+        row["platform_fee"] = round(row["amount"] * FEE_PERCENTAGE / 100, 2)
+        row["net_amount"] = round(row["amount"] - row["platform_fee"], 2)
+        return row
+    _insert(Transaction, transactions, batch_size, transaction_row, log)
+
+    def payout_row(i):
+        requested_at = ago()
+        amount_cents = rng.randrange(1000, 500000)
+        return {"id": i + 1, "coach_id": coach(), "amount": amount_cents / 100, "amount_cents": amount_cents,
+                "currency": "usd", "status": "completed", "requested_at": requested_at,
+                "processed_at": requested_at + timedelta(minutes=5), "stripe_transfer_id": f"tr_bench_{i + 1}",
+                "transaction_count": rng.randrange(1, 500), "run_id": f"bench{requested_at:%Y%m%d}",
+                "idempotency_key": f"payout-bench-{i + 1}", "attempts": 1}
+    _insert(Payout, payouts, batch_size, payout_row, log)
+
+    if rollups:
+        from src.services.earnings import rebuild
+        started = time.perf_counter()
+        log(f"coach_earnings_daily: {rebuild(log=lambda message: None):,} rows ({time.perf_counter() - started:.1f}s)")
+        from src.services.revenue import refresh
+        started = time.perf_counter()
+        log(f"revenue_bucket: {refresh(log=lambda message: None):,} ledger groups ({time.perf_counter() - started:.1f}s)")
+    if search_index:
+        from src.services.search import rebuild_index
+        started = time.perf_counter()
+        log(f"content_search_term: {rebuild_index(log=lambda message: None):,} items ({time.perf_counter() - started:.1f}s)")
+
+    return {
+        "seed": seed, "generated_at": now.isoformat(), "password": PASSWORD, "search_index": search_index,
+        "coach_ids": [1, coaches], "fan_ids": [coaches + 1, users], "content_ids": [1, contents],
+        "counts": {"users": users, "coaches": coaches, "contents": contents, "subscriptions": subscriptions,
+                   "purchases": purchases, "transactions": transactions, "payouts": payouts}
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", required=True, help="SQLAlchemy URL of an empty database")
+    parser.add_argument("--manifest", default="bench-dataset.json")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--contents", type=int, default=500000)
+    parser.add_argument("--transactions", type=int, default=2000000)
+    parser.add_argument("--subscriptions", type=int, default=None, help="Defaults to one per fan")
+    parser.add_argument("--purchases", type=int, default=None, help="Defaults to one per two fans")
+    parser.add_argument("--payouts", type=int, default=None, help="Defaults to three per coach")
+    parser.add_argument("--days", type=int, default=365, help="History that timestamps are spread over")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--skip-rollups", action="store_true", help="Don't build the earnings and revenue rollups")
+    parser.add_argument("--search-index", action="store_true", help="Also build the full-text index (slow)")
+    args = parser.parse_args()
+
+    app = make_app(args.database)
+    started = time.perf_counter()
+    with app.app_context():
+        manifest = generate(args.users, args.contents, args.transactions, args.subscriptions, args.purchases,
+                            args.payouts, args.days, args.seed, args.batch_size, not args.skip_rollups,
+                            args.search_index)
+    manifest["database"] = args.database
+    with open(args.manifest, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s, manifest written to {args.manifest}")
+
+if __name__ == "__main__":
+    main()
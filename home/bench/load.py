@@ -0,0 +1,428 @@
+"""Replay a weighted request mix against every blueprint; report throughput and p50/p95/p99 per endpoint.
+
+Drives the real app in-process (one Flask test client per worker thread) on a database seeded
+by bench/dataset.py, or a running server with --url. PaymentIntent calls go to the local Stripe
+stand-in (bench/stripe_server.py) and webhook deliveries are signed like Stripe's. Results can
+be written as JSON and compared against a stored baseline; a regression beyond --tolerance
+exits non-zero:
+
+    python -m bench.dataset --database sqlite:////tmp/bench.db --manifest /tmp/bench-dataset.json
+    python -m bench.load --dataset /tmp/bench-dataset.json --duration 60 --concurrency 8 \\
+        --output results.json --baseline bench/baselines/load.json
+
+Without --dataset, a small dataset is seeded into a temporary SQLite file first. With --url,
+run the server with STRIPE_API_BASE=http://127.0.0.1:<--stripe-port> and the same
+STRIPE_WEBHOOK_SECRET as --webhook-secret.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+from bench import fake_stripe, stripe_server
+from bench.common import make_app, percentile, ADMIN_HEADERS
+from bench.search_index import COMMON_WORDS
+
+MIN_SAMPLES = 100 # Endpoints with fewer samples in either run are not compared
+MIN_DELTA_MS = 5.0 # Smaller latency changes are scheduling noise, whatever the percentage
+
+class AppClient:
+    """A worker's connection to the in-process app."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, headers, body):
+        response = self.client.open(path, method=method, headers=headers, data=body)
+        return response.status_code, response.get_data()
+
+class HTTPClient:
+    """A worker's keep-alive connection to a running server."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.connection = None
+
+    def request(self, method, path, headers, body):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            self.connection = None # Reconnect on the next request
+            raise
+
+SCENARIOS = {} # endpoint label -> function(worker) making one request
+
+def scenario(endpoint):
+    def register(f):
+        SCENARIOS[endpoint] = f
+        return f
+    return register
+
+class Worker:
+    """One virtual client: a fan session, a coach session, a seeded RNG and its own samples."""
+
+    def __init__(self, client, manifest, rng, webhook_secret, measuring):
+        self.client = client
+        self.manifest = manifest
+        self.rng = rng
+        self.webhook_secret = webhook_secret
+        self.measuring = measuring
+        self.endpoint = None
+        self.samples = {} # endpoint -> [ms]
+        self.statuses = {} # endpoint -> {status: count}
+
+    def _pick(self, name):
+        first, last = self.manifest[name]
+        return self.rng.randint(first, last)
+
+    def fan_id(self):
+        return self._pick("fan_ids")
+
+    def coach_id(self):
+        return self._pick("coach_ids")
+
+    def content_id(self):
+        return self._pick("content_ids")
+
+    def call(self, method, path, json_body=None, form=None, body=None, headers=None):
+        headers = dict(headers or {})
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif form is not None:
+            body = urlencode(form).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        started = time.perf_counter()
+        try:
+            status, data = self.client.request(method, path, headers, body)
+        except Exception:
+            status, data = "error", b""
+        elapsed = (time.perf_counter() - started) * 1000
+        if self.measuring.is_set():
+            self.samples.setdefault(self.endpoint, []).append(elapsed)
+            statuses = self.statuses.setdefault(self.endpoint, {})
+            statuses[status] = statuses.get(status, 0) + 1
+        return status, json.loads(data) if data and status != "error" and data[:1] in b"{[" else None
+
+    def run(self, endpoint):
+        self.endpoint = endpoint
+        SCENARIOS[endpoint](self)
+
+    def log_in(self, user_id):
+        status, body = self.call("POST", "/api/user/login",
+                                 {"email": f"user{user_id}@bench", "password": self.manifest["password"]})
+        if status != 200:
+            raise RuntimeError(f"Could not log in user {user_id}: {status} {body}")
+        return {"id": user_id, "access": body["access_token"], "refresh": body["refresh_token"]}
+
+    def start(self):
+        """Log in this worker's fan and coach (not measured)."""
+        self.fan = self.log_in(self.fan_id())
+        self.coach = self.log_in(self.coach_id())
+
+    def auth(self, session):
+        return {"Authorization": f"Bearer {session['access']}"}
+
+@scenario("POST /api/user/login")
+def login(w):
+    w.call("POST", "/api/user/login", {"email": f"user{w.fan_id()}@bench", "password": w.manifest["password"]})
+
+@scenario("POST /api/user/register")
+def register(w):
+    w.call("POST", "/api/user/register", {"email": f"load-{uuid.uuid4().hex}@bench", "password": "load-password"})
+
+@scenario("POST /api/user/token/refresh")
+def refresh(w):
+    # Refresh tokens are single use: keep the rotated one
+    status, body = w.call("POST", "/api/user/token/refresh", {"refresh_token": w.fan["refresh"]})
+    if status == 200:
+        w.fan.update(access=body["access_token"], refresh=body["refresh_token"])
+
+@scenario("GET /api/profile/<id>")
+def view_profile(w):
+    w.call("GET", f"/api/profile/{w.rng.choice((w.fan_id, w.coach_id))()}")
+
+@scenario("PUT /api/profile/<id>")
+def update_profile(w):
+    w.call("PUT", f"/api/profile/{w.fan['id']}", {"bio": f"Updated {uuid.uuid4().hex[:8]}"})
+
+@scenario("GET /api/content/<id>")
+def view_content(w):
+    w.call("GET", f"/api/content/{w.content_id()}?fan_id={w.fan['id']}")
+
+@scenario("GET /api/content/coach/<id>")
+def coach_listing(w):
+    w.call("GET", f"/api/content/coach/{w.coach_id()}")
+
+@scenario("GET /api/content/coach/<id>?fan_id=")
+def coach_listing_for_fan(w):
+    w.call("GET", f"/api/content/coach/{w.coach_id()}?fan_id={w.fan['id']}")
+
+@scenario("GET /api/content/search")
+def search(w):
+    terms = w.rng.sample(COMMON_WORDS, w.rng.choice((1, 1, 2)))
+    w.call("GET", f"/api/content/search?{urlencode({'q': ' '.join(terms), 'limit': 20})}")
+
+@scenario("GET /api/content/feed/<fan_id>")
+def feed(w):
+    w.call("GET", f"/api/content/feed/{w.fan['id']}?limit=20", headers=w.auth(w.fan))
+
+@scenario("POST /api/content/upload")
+def upload(w):
+    w.call("POST", "/api/content/upload", headers=w.auth(w.coach), form={
+        "title": f"Load test session {uuid.uuid4().hex[:8]}", "content_type": "text",
+        "text_content": "Warm up, three rounds, cool down.", "access_setting": w.rng.choice(("free", "paywall"))})
+
+@scenario("GET /api/monetization/check_access/<fan_id>/<id>")
+def check_access(w):
+    w.call("GET", f"/api/monetization/check_access/{w.fan['id']}/{w.content_id()}")
+
+@scenario("POST /api/monetization/check_access/<fan_id>")
+def check_access_batch(w):
+    w.call("POST", f"/api/monetization/check_access/{w.fan['id']}",
+           {"content_ids": [w.content_id() for _ in range(20)]})
+
+@scenario("POST /api/monetization/create_payment_intent")
+def create_payment_intent(w):
+    w.call("POST", "/api/monetization/create_payment_intent",
+           {"item_id": w.content_id(), "item_type": "content_ppv", "fan_id": w.fan["id"]})
+
+@scenario("POST /api/monetization/subscribe")
+def subscribe(w):
+    # Not in the ledger yet, so verified against the Stripe stand-in
+    w.call("POST", "/api/monetization/subscribe", headers=w.auth(w.fan), json_body={
+        "coach_id": w.coach_id(), "subscription_type": "monthly", "payment_intent_id": f"pi_load_{uuid.uuid4().hex}"})
+
+@scenario("POST /api/monetization/purchase_content")
+def purchase(w):
+    w.call("POST", "/api/monetization/purchase_content", headers=w.auth(w.fan),
+           json_body={"content_id": w.content_id(), "payment_intent_id": f"pi_load_{uuid.uuid4().hex}"})
+
+@scenario("POST /api/monetization/stripe_webhook")
+def webhook(w):
+    if w.rng.random() < 0.5:
+        intent = fake_stripe.payment_intent(w.fan_id(), w.coach_id(), "subscription_monthly", 1000)
+    else:
+        intent = fake_stripe.payment_intent(w.fan_id(), w.content_id(), "content_ppv", 500)
+    payload, headers = fake_stripe.signed_delivery(fake_stripe.event("payment_intent.succeeded", intent),
+                                                   w.webhook_secret)
+    w.call("POST", "/api/monetization/stripe_webhook", body=payload, headers=headers)
+
+@scenario("GET /api/monetization/earnings")
+def coach_earnings(w):
+    w.call("GET", "/api/monetization/earnings", headers=w.auth(w.coach))
+
+def _admin_get(path):
+    return lambda w: w.call("GET", path, headers=ADMIN_HEADERS)
+
+for _path in ("/api/admin/users", "/api/admin/content", "/api/admin/transactions", "/api/admin/payouts",
+              "/api/admin/earnings", "/api/admin/metrics"):
+    scenario(f"GET {_path}")(_admin_get(_path))
+
+# Relative weights; "default" is read-heavy like production, with every blueprint's writes in it
+MIXES = {
+    "default": {
+        "GET /api/content/<id>": 14, "GET /api/content/feed/<fan_id>": 12, "GET /api/profile/<id>": 10,
+        "GET /api/content/coach/<id>": 8, "GET /api/monetization/check_access/<fan_id>/<id>": 8,
+        "GET /api/content/coach/<id>?fan_id=": 6, "GET /api/content/search": 6,
+        "POST /api/monetization/stripe_webhook": 6, "POST /api/monetization/check_access/<fan_id>": 3,
+        "GET /api/monetization/earnings": 2, "POST /api/monetization/create_payment_intent": 2,
+        "POST /api/monetization/subscribe": 1, "POST /api/monetization/purchase_content": 1,
+        "POST /api/content/upload": 1, "PUT /api/profile/<id>": 1, "POST /api/user/token/refresh": 1,
+        "POST /api/user/login": 1, "POST /api/user/register": 0.5,
+        "GET /api/admin/users": 0.5, "GET /api/admin/content": 0.5, "GET /api/admin/transactions": 0.5,
+        "GET /api/admin/payouts": 0.5, "GET /api/admin/earnings": 0.5, "GET /api/admin/metrics": 0.5,
+    },
+}
+MIXES["read"] = {endpoint: weight for endpoint, weight in MIXES["default"].items() if endpoint.startswith("GET ")}
+MIXES["write"] = {endpoint: weight for endpoint, weight in MIXES["default"].items()
+                  if not endpoint.startswith("GET ") and endpoint != "POST /api/user/login"}
+
+def run(clients, manifest, mix, duration, warmup=5.0, seed=0, webhook_secret="whsec_bench"):
+    """Drive `clients` (one thread each) with `mix` for `duration` seconds; returns (workers, measured seconds)."""
+    measuring = threading.Event()
+    stop = threading.Event()
+    workers = [Worker(client, manifest, random.Random(seed * 1000 + i), webhook_secret, measuring)
+               for i, client in enumerate(clients)]
+    for worker in workers:
+        worker.start()
+    endpoints, weights = zip(*mix.items())
+
+    def loop(worker):
+        while not stop.is_set():
+            worker.run(worker.rng.choices(endpoints, weights)[0])
+    threads = [threading.Thread(target=loop, args=(worker,), daemon=True) for worker in workers]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    measuring.set()
+    started = time.perf_counter()
+    time.sleep(duration)
+    measuring.clear()
+    measured = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return workers, measured
+
+def _summary(samples, statuses, seconds):
+    errors = sum(count for status, count in statuses.items() if status == "error" or status >= 500)
+    return {
+        "requests": len(samples), "throughput": len(samples) / seconds,
+        "p50_ms": statistics.median(samples), "p95_ms": percentile(samples, 95), "p99_ms": percentile(samples, 99),
+        "max_ms": max(samples), "error_rate": errors / len(samples),
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)}
+    }
+
+def summarize(workers, seconds):
+    samples, statuses = {}, {}
+    for worker in workers:
+        for endpoint, timings in worker.samples.items():
+            samples.setdefault(endpoint, []).extend(timings)
+            for status, count in worker.statuses[endpoint].items():
+                merged = statuses.setdefault(endpoint, {})
+                merged[status] = merged.get(status, 0) + count
+    all_statuses = {}
+    for counts in statuses.values():
+        for status, count in counts.items():
+            all_statuses[status] = all_statuses.get(status, 0) + count
+    return {
+        "total": _summary([ms for timings in samples.values() for ms in timings], all_statuses, seconds),
+        "endpoints": {endpoint: _summary(samples[endpoint], statuses[endpoint], seconds) for endpoint in sorted(samples)}
+    }
+
+def compare(results, baseline, tolerance):
+    """[(endpoint, metric, baseline value, current value)] for every regression beyond `tolerance`."""
+    regressions = []
+    current = dict(results["endpoints"], total=results["total"])
+    for endpoint, base in dict(baseline["endpoints"], total=baseline["total"]).items():
+        now = current.get(endpoint)
+        if now is None or min(now["requests"], base["requests"]) < MIN_SAMPLES:
+            continue
+        if now["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append((endpoint, "throughput", base["throughput"], now["throughput"]))
+        for metric in ("p50_ms", "p95_ms"): # p99 of a few hundred samples is mostly noise
+            if now[metric] > base[metric] * (1 + tolerance) and now[metric] - base[metric] > MIN_DELTA_MS:
+                regressions.append((endpoint, metric, base[metric], now[metric]))
+        if now["error_rate"] > base["error_rate"] + 0.01:
+            regressions.append((endpoint, "error_rate", base["error_rate"], now["error_rate"]))
+    return regressions
+
+def report(results):
+    print(f"{'endpoint':<50} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}  statuses")
+    for endpoint, stats in list(results["endpoints"].items()) + [("total", results["total"])]:
+        statuses = " ".join(f"{status}:{count}" for status, count in stats["statuses"].items())
+        print(f"{endpoint:<50} {stats['requests']:>8} {stats['throughput']:>8.1f} {stats['p50_ms']:>8.2f} "
+              f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['error_rate']:>7.1%}  {statuses}")
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def seed_small_dataset(workdir):
+    """A dataset that seeds in seconds, for runs without --dataset."""
+    from bench.dataset import generate
+    database = f"sqlite:///{os.path.join(workdir, 'app.db')}"
+    app = make_app(database)
+    with app.app_context():
+        manifest = generate(users=2000, contents=10000, transactions=50000, search_index=True, log=lambda message: None)
+    manifest["database"] = database
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", help="Manifest written by bench.dataset (default: seed a small one)")
+    parser.add_argument("--url", help="Load a running server instead of the in-process app")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="default")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of load before measuring")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stripe-port", type=int, default=0, help="Port of the Stripe stand-in (0: any free port)")
+    parser.add_argument("--stripe-delay-ms", type=float, default=0.0)
+    parser.add_argument("--webhook-secret", default="whsec_bench")
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--baseline", help="Compare against this results file; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative change before it counts")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline instead")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="load-bench-")
+    if args.dataset:
+        with open(args.dataset) as f:
+            manifest = json.load(f)
+    else:
+        print("Seeding a small dataset (use bench.dataset and --dataset for a large one)...")
+        manifest = seed_small_dataset(workdir)
+    if not manifest.get("search_index"):
+        print("Note: the dataset has no search index, so search requests return no results")
+
+    stripe, stripe_url = stripe_server.start(args.stripe_port, args.stripe_delay_ms / 1000.0)
+    if args.url:
+        clients = [HTTPClient(args.url) for _ in range(args.concurrency)]
+        target = args.url
+        print(f"Stripe stand-in on {stripe_url}: the server needs STRIPE_API_BASE={stripe_url}")
+    else:
+        app = make_app(manifest["database"], STRIPE_SECRET_KEY="sk_test_bench", STRIPE_API_BASE=stripe_url,
+                       STRIPE_WEBHOOK_SECRET=args.webhook_secret, UPLOAD_FOLDER=os.path.join(workdir, "uploads"),
+                       WEBHOOK_OUTBOX_PATH=os.path.join(workdir, "outbox.sqlite3"),
+                       DB_POOL_SIZE=args.concurrency)
+        clients = [AppClient(app) for _ in range(args.concurrency)]
+        target = "in-process"
+
+    mix = MIXES[args.mix]
+    workers, seconds = run(clients, manifest, mix, args.duration, args.warmup, args.seed, args.webhook_secret)
+    stripe.shutdown()
+    results = {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(timespec="seconds"), "commit": _git_commit(), "target": target,
+            "mix": args.mix, "weights": mix, "concurrency": args.concurrency, "duration": seconds,
+            "warmup": args.warmup, "seed": args.seed, "stripe_delay_ms": args.stripe_delay_ms,
+            "dataset": manifest["counts"], "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count()
+        },
+        **summarize(workers, seconds)
+    }
+    report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key in ("target", "mix", "concurrency", "dataset"):
+            if baseline["meta"].get(key) != results["meta"][key]:
+                print(f"Warning: {key} differs from the baseline ({baseline['meta'].get(key)} vs {results['meta'][key]})")
+        regressions = compare(results, baseline, args.tolerance)
+        for endpoint, metric, before, after in regressions:
+            print(f"REGRESSION {endpoint}: {metric} {before:.2f} -> {after:.2f}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Latency of /api/monetization/subscribe when the payment intent is in the local ledger,
+when it has to be fetched from a (local, artificially slow) Stripe, and when Stripe hangs.
+
+    python -m bench.payment_latency --requests 200 --stripe-delay-ms 150
+"""
+import argparse
+import statistics
+import time
+from bench.common import make_app, percentile
+from bench import stripe_server
+from src.models.user import User, db
+from src.models.finance import Transaction
+from src.models.monetization import Subscription
+from src.services.payments import configure_stripe, get_stripe, stripe_breaker
+from src.services.auth import issue_token
+
+def run(client, fan_tokens, coach_id, intent_prefix, n):
+    timings = []
+    statuses = {}
+    for i in range(n):
+        body = {"coach_id": coach_id, "subscription_type": "monthly", "payment_intent_id": f"{intent_prefix}{i}"}
+        headers = {"Authorization": f"Bearer {fan_tokens[i % len(fan_tokens)]}"}
+        started = time.perf_counter()
+        response = client.post("/api/monetization/subscribe", json=body, headers=headers)
+        timings.append((time.perf_counter() - started) * 1000)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return timings, statuses
+
+def report(name, timings, statuses):
+    print(f"{name:<22} p50 {statistics.median(timings):8.2f} ms  p95 {percentile(timings, 95):8.2f} ms  "
+          f"p99 {percentile(timings, 99):8.2f} ms  statuses {statuses}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--stripe-delay-ms", type=float, default=150.0)
+    args = parser.parse_args()
+
+    server, url = stripe_server.start(delay=args.stripe_delay_ms / 1000.0)
+    hung_server, hung_url = stripe_server.start(delay=30.0)
+    app = make_app(STRIPE_SECRET_KEY="sk_test_bench", STRIPE_API_BASE=url, STRIPE_READ_TIMEOUT=1.0)
+
+    with app.app_context():
+        coach = User(email="coach@bench", password_hash="x", role="coach")
+        fans = [User(email=f"fan{i}@bench", password_hash="x", role="fan") for i in range(args.requests)]
+        db.session.add_all([coach] + fans)
+        db.session.commit()
+        fan_ids = [fan.id for fan in fans]
+        coach_id = coach.id
+        db.session.add_all([Transaction(transaction_type="subscription_payment", user_id=fan_id, coach_id=coach_id,
+                                        amount=10.0, stripe_payment_intent_id=f"pi_ledger_{i}", status="succeeded")
+                            for i, fan_id in enumerate(fan_ids)])
+        db.session.commit()
+        fan_tokens = [issue_token(fan_id, "fan") for fan_id in fan_ids]
+    for i, fan_id in enumerate(fan_ids):
+        for prefix in ("pi_remote_", "pi_hung_"):
+            stripe_server.register_intent(f"{prefix}{i}", {"user_id": fan_id, "item_type": "subscription_monthly",
+                                                           "item_id": coach_id})
+
+    client = app.test_client()
+
+    def reset():
+        with app.app_context():
+            Subscription.query.delete()
+            db.session.commit()
+
+    report("ledger hit", *run(client, fan_tokens, coach_id, "pi_ledger_", args.requests))
+    reset()
+    report(f"stripe ({args.stripe_delay_ms:.0f} ms)", *run(client, fan_tokens, coach_id, "pi_remote_", args.requests))
+    reset()
+    app.config["STRIPE_API_BASE"] = hung_url
+    with app.app_context():
+        configure_stripe(app, get_stripe())
+    report("stripe hung (breaker)", *run(client, fan_tokens, coach_id, "pi_hung_", min(args.requests, 20)))
+    print(f"breaker state: {stripe_breaker.state}")
+    server.shutdown()
+    hung_server.shutdown()
+
+if __name__ == "__main__":
+    main()
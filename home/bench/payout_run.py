@@ -0,0 +1,72 @@
+"""Time a full payout run (compute + transfers) and check a rerun pays nobody twice.
+
+    python -m bench.payout_run --coaches 50000 --transactions-per-coach 4 --delay-ms 50
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+from sqlalchemy import insert, func
+from bench.common import make_app
+from bench.fake_stripe import FakeTransferClient
+from src.models.user import User, db
+from src.models.finance import Transaction, Payout
+from src.services.payouts import compute_payouts, execute_payouts
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--coaches", type=int, default=50000)
+    parser.add_argument("--transactions-per-coach", type=int, default=4)
+    parser.add_argument("--delay-ms", type=float, default=50.0, help="Simulated transfer API latency")
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="payout-bench-")
+    app = make_app(f"sqlite:///{os.path.join(workdir, 'app.db')}")
+    rng = random.Random(0)
+    with app.app_context():
+        now = datetime.utcnow()
+        db.session.execute(insert(User), [{"email": f"coach{i}@bench", "password_hash": "x", "role": "coach",
+                                           "stripe_account_id": f"acct_{i}" if i % 100 else None}
+                                          for i in range(args.coaches)])
+        coach_ids = [user_id for (user_id,) in db.session.query(User.id)]
+        rows = []
+        for coach_id in coach_ids:
+            for _ in range(args.transactions_per_coach):
+                amount = rng.choice([5.0, 10.0, 100.0])
+                rows.append({"transaction_type": "subscription_payment", "coach_id": coach_id, "amount": amount,
+                             "platform_fee": amount * 0.15, "net_amount": amount * 0.85, "currency": "usd",
+                             "status": "succeeded", "created_at": now, "updated_at": now})
+        for start in range(0, len(rows), 10000):
+            db.session.execute(insert(Transaction), rows[start:start + 10000])
+        db.session.commit()
+        owed = db.session.query(func.sum(func.round(Transaction.net_amount * 100))).scalar()
+
+        client = FakeTransferClient(delay=args.delay_ms / 1000.0)
+        started = time.perf_counter()
+        run_id, created = compute_payouts()
+        compute_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        totals = execute_payouts(client, concurrency=args.concurrency, log=lambda message: None)
+        transfer_seconds = time.perf_counter() - started
+
+        # Simulate a crash that left payouts claimed: rerunning must not create new transfers
+        transfers_before = len(client.transfers)
+        crashed = [payout_id for (payout_id,) in db.session.query(Payout.id).filter(Payout.status == "completed").limit(100)]
+        Payout.query.filter(Payout.id.in_(crashed)).update(
+            {Payout.status: "processing", Payout.stripe_transfer_id: None, Payout.claimed_at: datetime(2000, 1, 1)},
+            synchronize_session=False)
+        db.session.commit()
+        rerun = execute_payouts(client, concurrency=args.concurrency, log=lambda message: None)
+        paid = sum(transfer["amount"] for transfer in client.transfers.values())
+
+    print(f"transactions:      {len(rows)} for {args.coaches} coaches")
+    print(f"compute:           {created} payouts in {compute_seconds:.2f}s")
+    print(f"transfers:         {totals} in {transfer_seconds:.2f}s ({created / transfer_seconds:,.0f}/s)")
+    print(f"rerun:             {rerun}, new transfers: {len(client.transfers) - transfers_before}")
+    print(f"paid:              {paid} of {int(owed)} cents owed (rest: coaches without accounts)")
+
+if __name__ == "__main__":
+    main()
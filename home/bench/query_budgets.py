@@ -0,0 +1,89 @@
+"""Query budget check: seeds a small dataset and fails if any endpoint issues more queries
+than its budget (or repeats one statement shape, the N+1 signature).
+
+    python -m bench.query_budgets
+
+Runs on every push and pull request (.github/workflows/checks.yml); exits 1 on any failure.
+"""
+import io
+import sys
+from datetime import datetime, timedelta
+from bench.common import make_app, ADMIN_HEADERS
+from src.models.user import User, db
+from src.models.content import Content
+from src.models.monetization import Subscription, PayPerViewPurchase
+from src.models.finance import Transaction, Payout
+from src.services.sql_profiler import assert_query_budget
+from src.services.entitlements import entitlement_cache
+from src.services.auth import issue_token
+from src.services.feed import feed_cache
+from src.services.response_cache import get_response_cache
+
+ITEMS_PER_COACH = 50
+
+def seed(app):
+    with app.app_context():
+        coaches = [User(email=f"coach{i}@bench", password_hash="x", role="coach") for i in range(3)]
+        fan = User(email="fan@bench", password_hash="x", role="fan")
+        db.session.add_all(coaches + [fan])
+        db.session.commit()
+        for coach in coaches:
+            db.session.add_all([Content(coach_id=coach.id, title=f"item {i}", content_type="text", text_content="...",
+                                        access_setting="paywall" if i % 2 else "free") for i in range(ITEMS_PER_COACH)])
+        db.session.commit()
+        db.session.add_all([Subscription(fan_id=fan.id, coach_id=coach.id, subscription_type="monthly",
+                                         end_date=datetime.utcnow() + timedelta(days=30)) for coach in (coaches[0], coaches[2])])
+        paid = Content.query.filter_by(coach_id=coaches[1].id, access_setting="paywall").limit(5).all()
+        db.session.add_all([PayPerViewPurchase(fan_id=fan.id, content_id=c.id, amount_paid=5.0) for c in paid])
+        db.session.add_all([Transaction(transaction_type="ppv_purchase", user_id=fan.id, coach_id=coaches[1].id,
+                                        content_id=c.id, amount=5.0, status="succeeded",
+                                        stripe_payment_intent_id=f"pi_{c.id}") for c in paid])
+        db.session.add(Payout(coach_id=coaches[1].id, amount=10.0))
+        db.session.commit()
+        return fan.id, [c.id for c in coaches], paid[0].id
+
+def budgets(fan_id, coach_ids, content_id, fan_headers):
+    """(label, method, url, kwargs, max queries)"""
+    coach_id = coach_ids[1]
+    return [
+        ("fan feed", "get", f"/api/content/feed/{fan_id}?limit=20", {"headers": fan_headers}, 4),
+        ("coach listing", "get", f"/api/content/coach/{coach_id}", {}, 2),
+        ("coach listing for fan", "get", f"/api/content/coach/{coach_id}?fan_id={fan_id}", {}, 4),
+        ("content detail", "get", f"/api/content/{content_id}?fan_id={fan_id}", {}, 3),
+        ("check access", "get", f"/api/monetization/check_access/{fan_id}/{content_id}", {}, 4),
+        ("batch check access", "post", f"/api/monetization/check_access/{fan_id}",
+         {"json": {"content_ids": list(range(1, 3 * ITEMS_PER_COACH + 1))}}, 4),
+        ("profile", "get", f"/api/profile/{coach_id}", {}, 1),
+        ("admin users", "get", "/api/admin/users", {"headers": ADMIN_HEADERS}, 1),
+        ("admin content", "get", "/api/admin/content", {"headers": ADMIN_HEADERS}, 1),
+        ("admin transactions", "get", "/api/admin/transactions", {"headers": ADMIN_HEADERS}, 1),
+        ("admin payouts", "get", "/api/admin/payouts", {"headers": ADMIN_HEADERS}, 1),
+    ]
+
+def main():
+    app = make_app()
+    fan_id, coach_ids, content_id = seed(app)
+    with app.app_context():
+        fan_headers = {"Authorization": f"Bearer {issue_token(fan_id, 'fan')}"}
+    client = app.test_client()
+    failures = 0
+    for label, method, url, kwargs, budget in budgets(fan_id, coach_ids, content_id, fan_headers):
+        entitlement_cache.clear() # Budgets are for a cold cache
+        feed_cache.clear()
+        get_response_cache(app).clear()
+        try:
+            with assert_query_budget(budget, label) as sql_profile:
+                response = getattr(client, method)(url, **kwargs)
+            if response.status_code >= 400:
+                raise AssertionError(f"{label}: status {response.status_code}")
+            if sql_profile.max_repeat() > 1:
+                raise AssertionError(f"{label}: statement repeated {sql_profile.max_repeat()} times")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {e}")
+            continue
+        print(f"ok   {label:<24} {sql_profile.count}/{budget} queries  status {response.status_code}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Minimal in-memory Redis stand-in (RESP2), enough for the response cache's shared tier.
+
+Supports PING, GET, MGET, SET (EX/PX/NX/XX), INCR/INCRBY, DEL, EXISTS, DBSIZE, FLUSHDB/FLUSHALL and
+accepts CLIENT/SELECT, so redis-py can talk to it without a real Redis server:
+
+    python -m bench.redis_server --port 16379 --delay-ms 0.2
+    RESPONSE_CACHE_URL=redis://127.0.0.1:16379/0 flask --app src.main run
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+_lock = threading.Lock()
+_data = {} # key -> (value, expires_at or None)
+
+def _live(key, now):
+    entry = _data.get(key)
+    if entry is None:
+        return None
+    value, expires_at = entry
+    if expires_at is not None and expires_at <= now:
+        del _data[key]
+        return None
+    return value
+
+def _set(args, now):
+    key, value = args[0], args[1]
+    expires_at = None
+    nx = xx = False
+    options = [arg.upper() for arg in args[2:]]
+    i = 0
+    while i < len(options):
+        if options[i] == b"EX":
+            expires_at = now + int(options[i + 1])
+            i += 1
+        elif options[i] == b"PX":
+            expires_at = now + int(options[i + 1]) / 1000.0
+            i += 1
+        elif options[i] == b"NX":
+            nx = True
+        elif options[i] == b"XX":
+            xx = True
+        i += 1
+    exists = _live(key, now) is not None
+    if (nx and exists) or (xx and not exists):
+        return None
+    _data[key] = (value, expires_at)
+    return "OK"
+
+def execute(command, args):
+    """Run one command; returns a RESP-encodable value (str = status, Exception = error)."""
+    now = time.monotonic()
+    with _lock:
+        if command == b"PING":
+            return "PONG"
+        if command == b"GET":
+            return _live(args[0], now)
+        if command == b"MGET":
+            return [_live(key, now) for key in args]
+        if command == b"SET":
+            return _set(args, now)
+        if command in (b"INCR", b"INCRBY"):
+            expires_at = _data[args[0]][1] if _live(args[0], now) is not None else None
+            value = int(_live(args[0], now) or 0) + (int(args[1]) if len(args) > 1 else 1)
+            _data[args[0]] = (str(value).encode(), expires_at)
+            return value
+        if command == b"DEL":
+            return sum(1 for key in args if _live(key, now) is not None and _data.pop(key))
+        if command == b"EXISTS":
+            return sum(1 for key in args if _live(key, now) is not None)
+        if command == b"DBSIZE":
+            return len(_data)
+        if command in (b"FLUSHDB", b"FLUSHALL"):
+            _data.clear()
+            return "OK"
+        if command in (b"CLIENT", b"SELECT"):
+            return "OK"
+    return ValueError(f"ERR unknown command '{command.decode(errors='replace')}'")
+
+def _encode(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, Exception):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, list):
+        return f"*{len(value)}\r\n".encode() + b"".join(_encode(item) for item in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+class RedisHandler(socketserver.StreamRequestHandler):
+    delay = 0.0
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split() # Inline command, e.g. from telnet
+        parts = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            parts.append(self.rfile.read(length + 2)[:-2])
+        return parts
+
+    def handle(self):
+        while True:
+            parts = self._read_command()
+            if not parts:
+                return
+            if self.delay:
+                time.sleep(self.delay)
+            command = parts[0].upper()
+            if command == b"QUIT":
+                self.wfile.write(b"+OK\r\n")
+                return
+            self.wfile.write(_encode(execute(command, parts[1:])))
+
+class RedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def start(port=0, delay=0.0):
+    """Run the server on a daemon thread; returns (server, url)."""
+    handler = type("Handler", (RedisHandler,), {"delay": delay})
+    server = RedisServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"redis://127.0.0.1:{server.server_address[1]}/0"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=16379)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Artificial latency per command")
+    args = parser.parse_args()
+    handler = type("Handler", (RedisHandler,), {"delay": args.delay_ms / 1000.0})
+    with RedisServer(("127.0.0.1", args.port), handler) as server:
+        print(f"Redis stand-in on redis://127.0.0.1:{args.port}/0")
+        server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Response cache: throughput per tier, stampede protection and cross-worker invalidation.
+
+Two app instances stand in for two gunicorn workers; they share a SQLite file and a
+local Redis stand-in (bench/redis_server.py) as the shared tier.
+
+    python -m bench.response_cache --items 200 --requests 500 --stampede 100
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from bench import redis_server
+from bench.common import make_app
+from src.models.user import User, db
+from src.models.content import Content
+from src.services.auth import issue_token
+from src.services.response_cache import get_response_cache
+
+def seed(app, items):
+    with app.app_context():
+        coach = User(email="coach@bench", password_hash="x", role="coach", bio="Popular coach")
+        db.session.add(coach)
+        db.session.commit()
+        now = datetime.utcnow()
+        db.session.execute(insert(Content), [{
+            "coach_id": coach.id, "title": f"Session {i}", "description": "Forty minutes of mobility work " * 4,
+            "content_type": "text", "text_content": "...", "access_setting": "paywall" if i % 3 else "free",
+            "created_at": now - timedelta(minutes=i), "updated_at": now - timedelta(minutes=i)
+        } for i in range(items)])
+        db.session.commit()
+        return coach.id
+
+def throughput(app, urls, requests):
+    client = app.test_client()
+    for url in urls:
+        client.get(url) # warm up
+    started = time.perf_counter()
+    for i in range(requests):
+        response = client.get(urls[i % len(urls)])
+        assert response.status_code == 200, response.status_code
+    return requests / (time.perf_counter() - started)
+
+def stampede(apps, url, concurrency):
+    barrier = threading.Barrier(concurrency)
+    statuses = []
+    def worker(app):
+        client = app.test_client()
+        barrier.wait()
+        statuses.append(client.get(url).status_code)
+    threads = [threading.Thread(target=worker, args=(apps[i % len(apps)],)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert set(statuses) == {200}, statuses
+    return sum(get_response_cache(app).counts["loads"] for app in apps)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=200, help="Items in the popular coach's listing")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--stampede", type=int, default=100, help="Concurrent requests on a cold entry")
+    args = parser.parse_args()
+
+    server, redis_url = redis_server.start()
+    database = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='response-cache-bench-'), 'app.db')}"
+    uncached = make_app(database, RESPONSE_CACHE_LOCAL_TTL=0)
+    coach_id = seed(uncached, args.items)
+    urls = [f"/api/content/coach/{coach_id}", f"/api/profile/{coach_id}"]
+
+    modes = [
+        ("no cache", uncached),
+        ("local tier", make_app(database)),
+        ("shared tier only", make_app(database, RESPONSE_CACHE_LOCAL_TTL=0, RESPONSE_CACHE_URL=redis_url)),
+        ("local + shared", make_app(database, RESPONSE_CACHE_URL=redis_url)),
+    ]
+    for label, app in modes:
+        rate = throughput(app, urls, args.requests)
+        print(f"{label:<18} {rate:8,.0f} req/s (coach listing of {args.items} + profile)")
+
+    workers = [make_app(database, RESPONSE_CACHE_URL=redis_url) for _ in range(2)]
+    redis_server.execute(b"FLUSHALL", []) # Cold shared tier
+    loads = stampede(workers, urls[0], args.stampede)
+    print(f"stampede:          {args.stampede} concurrent requests on a cold entry over 2 workers -> {loads} load(s)")
+
+    # A write on one worker: the other sees it once its short local TTL lapses
+    writer, reader = workers
+    reader_client = reader.test_client()
+    with writer.app_context():
+        token = issue_token(coach_id, "coach")
+    response = writer.test_client().post("/api/content/upload", headers={"Authorization": f"Bearer {token}"},
+                                         data={"title": "Brand new", "content_type": "text", "text_content": "x"})
+    assert response.status_code == 201, response.json
+    written = time.monotonic()
+    while reader_client.get(urls[0]).json[0]["title"] != "Brand new":
+        time.sleep(0.05)
+    print(f"invalidation:      writer sees the upload immediately, other worker after {time.monotonic() - written:.2f}s "
+          f"(local TTL {reader.config['RESPONSE_CACHE_LOCAL_TTL']}s)")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Benchmark ranked content search on a large synthetic catalogue.
+
+Builds --rows Content items with Zipf-distributed vocabulary, indexes them with the same
+code as `flask rebuild-search-index`, then times /api/content/search for rare, common and
+filtered queries against the LIKE '%term%' scan it replaces:
+
+    python -m bench.search_index --rows 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from sqlalchemy import insert, or_
+from bench.common import make_app
+from src.models.user import User, db
+from src.models.content import Content
+from src.services.search import rebuild_index
+
+COMMON_WORDS = ("yoga flow strength cardio mobility stretch core pilates running marathon nutrition recovery "
+                "breathing meditation sleep posture kettlebell squat deadlift bench press hiit interval tempo "
+                "endurance balance beginner advanced morning evening routine plan weekly challenge habit focus "
+                "mindset protein mealprep hydration warmup cooldown glutes hamstrings shoulders back abs arms").split()
+SYLLABLES = "ka lo mi ne ru sa ti vo ze ba do fi gu ha je".split()
+# Real catalogues have a long tail: 50k synthetic words ranked after the common ones
+WORDS = COMMON_WORDS + ["".join(SYLLABLES[(i // 15 ** k) % 15] for k in range(4)) for i in range(50000)]
+
+def random_text(rng, n):
+    # Log-uniform ranks give Zipf's 1/rank frequencies: a few words are everywhere, most are rare
+    return " ".join(WORDS[int(len(WORDS) ** rng.random()) - 1] for _ in range(n))
+
+def timed(client, url, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.data
+    return statistics.median(timings), len(response.json)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="search-bench-")
+    app = make_app(f"sqlite:///{os.path.join(workdir, 'app.db')}")
+    rng = random.Random(0)
+    with app.app_context():
+        db.session.execute(insert(User), [{"email": f"coach{i}@bench", "password_hash": "x", "role": "coach"}
+                                          for i in range(1000)])
+        now = datetime.utcnow()
+        started = time.perf_counter()
+        for start in range(0, args.rows, 10000):
+            db.session.execute(insert(Content), [{
+                "coach_id": rng.randint(1, 1000), "title": random_text(rng, 5), "description": random_text(rng, 25),
+                "content_type": rng.choice(["text", "image", "video"]), "access_setting": rng.choice(["free", "paywall"]),
+                "created_at": now, "updated_at": now} for _ in range(start, min(start + 10000, args.rows))])
+        db.session.commit()
+        load_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        rebuild_index(batch_size=5000, log=lambda message: None)
+        index_seconds = time.perf_counter() - started
+
+    client = app.test_client()
+    print(f"rows:              {args.rows} (loaded in {load_seconds:.1f}s, indexed in {index_seconds:.1f}s)")
+    for label, url in (("rare term", f"/api/content/search?q={WORDS[3000]}&limit=20"),
+                       ("common term", "/api/content/search?q=yoga&limit=20"),
+                       ("two terms", "/api/content/search?q=yoga+glutes&limit=20"),
+                       ("two common terms", "/api/content/search?q=yoga+flow&limit=20"),
+                       ("filtered", "/api/content/search?q=strength+abs&content_type=video&access_setting=paywall&limit=20")):
+        median, count = timed(client, url, args.runs)
+        print(f"{label + ':':<19}{median:8.1f} ms median, {count} results")
+
+    with app.app_context():
+        started = time.perf_counter()
+        rare = WORDS[3000]
+        rows = Content.query.filter(or_(Content.title.like(f"%{rare}%"), Content.description.like(f"%{rare}%"))).all()
+        print(f"{'LIKE scan:':<19}{(time.perf_counter() - started) * 1000:8.1f} ms (rare term, unranked, {len(rows)} rows)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Measure cold start of the application (what each gunicorn worker boot or test run pays).
+
+Each sample is a fresh interpreter importing src.main, which builds the app via create_app().
+Exits non-zero when the median exceeds --max-seconds, so it can guard startup regressions:
+
+    python -m bench.startup_time --runs 10 --max-seconds 1.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import src.main
+total = time.perf_counter() - started
+metrics = src.main.telemetry.metrics
+print(json.dumps({"total": total, "phases": metrics.startup, "stripe_loaded": "stripe" in sys.modules}))
+"""
+
+def sample(home):
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=home, check=True, capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONDONTWRITEBYTECODE="")).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-seconds", type=float, default=None, help="Fail if the median startup exceeds this")
+    args = parser.parse_args()
+
+    home = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples = [sample(home) for _ in range(args.runs)]
+    totals = [s["total"] for s in samples]
+    median = statistics.median(totals)
+    print(f"runs:              {args.runs}")
+    print(f"startup:           median {median * 1000:.0f} ms, min {min(totals) * 1000:.0f} ms, max {max(totals) * 1000:.0f} ms")
+    for phase in sorted(samples[0]["phases"]):
+        print(f"  {phase + ':':<17}median {statistics.median(s['phases'][phase] for s in samples) * 1000:.0f} ms")
+    print(f"stripe imported:   {any(s['stripe_loaded'] for s in samples)}")
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"FAIL: median startup above {args.max_seconds:.2f}s")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
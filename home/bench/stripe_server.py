@@ -0,0 +1,124 @@
+"""Minimal local Stripe API stand-in.
+
+Serves POST /v1/payment_intents and GET /v1/payment_intents/<id> (every intent is reported
+as succeeded unless its id contains "fail"; metadata is that of the created or registered
+intent, else empty), plus POST/GET /v1/transfers with Idempotency-Key
+replay, with a configurable artificial latency, so Stripe-dependent paths can be timed
+without the network:
+
+    python -m bench.stripe_server --port 12111 --delay-ms 150
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+_transfers_lock = threading.Lock()
+_transfers = [] # created transfers, oldest first
+_transfers_by_key = {}
+_intents = {} # payment intent id -> metadata
+
+def register_intent(intent_id, metadata):
+    """Make GET /v1/payment_intents/<intent_id> report `metadata`, as if the intent had been created here."""
+    _intents[intent_id] = {key: str(value) for key, value in metadata.items()}
+
+class StripeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like api.stripe.com
+    delay = 0.0
+    amount = 1000
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        path, _, query = self.path.partition("?")
+        parts = path.strip("/").split("/")
+        if parts == ["v1", "transfers"]:
+            group = parse_qs(query).get("transfer_group", [None])[0]
+            with _transfers_lock:
+                data = [t for t in reversed(_transfers) if group is None or t["transfer_group"] == group]
+            self._send(200, {"object": "list", "url": "/v1/transfers", "has_more": False, "data": data[:1]})
+        elif len(parts) == 3 and parts[:2] == ["v1", "payment_intents"]:
+            intent_id = parts[2]
+            self._send(200, {
+                "id": intent_id,
+                "object": "payment_intent",
+                "amount": self.amount,
+                "currency": "usd",
+                "status": "requires_payment_method" if "fail" in intent_id else "succeeded",
+                "metadata": _intents.get(intent_id, {})
+            })
+        else:
+            self._send(404, {"error": {"type": "invalid_request_error", "message": "Unknown endpoint"}})
+
+    def do_POST(self):
+        time.sleep(self.delay)
+        length = int(self.headers.get("Content-Length") or 0)
+        params = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        path = self.path.split("?")[0].strip("/")
+        if path == "v1/payment_intents":
+            self._send(200, self._create_payment_intent(params))
+            return
+        if path != "v1/transfers":
+            self._send(404, {"error": {"type": "invalid_request_error", "message": "Unknown endpoint"}})
+            return
+        if not params.get("destination", "").startswith("acct_"):
+            self._send(400, {"error": {"type": "invalid_request_error", "param": "destination",
+                                       "message": f"No such destination: '{params.get('destination')}'"}})
+            return
+        key = self.headers.get("Idempotency-Key")
+        with _transfers_lock:
+            transfer = _transfers_by_key.get(key) if key else None
+            if transfer is None:
+                transfer = {"id": f"tr_{uuid.uuid4().hex[:24]}", "object": "transfer", "amount": int(params["amount"]),
+                            "currency": params.get("currency", "usd"), "destination": params["destination"],
+                            "transfer_group": params.get("transfer_group"), "metadata": {}}
+                _transfers.append(transfer)
+                if key:
+                    _transfers_by_key[key] = transfer
+        self._send(200, transfer)
+
+    def _create_payment_intent(self, params):
+        intent_id = f"pi_{uuid.uuid4().hex[:24]}"
+        metadata = {key[len("metadata["):-1]: value for key, value in params.items() if key.startswith("metadata[")}
+        register_intent(intent_id, metadata)
+        return {
+            "id": intent_id,
+            "object": "payment_intent",
+            "amount": int(params.get("amount", self.amount)),
+            "currency": params.get("currency", "usd"),
+            "status": "requires_payment_method",
+            "client_secret": f"{intent_id}_secret_{uuid.uuid4().hex[:24]}",
+            "metadata": metadata
+        }
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start(port=0, delay=0.0):
+    """Start the stand-in in a background thread; returns (server, base_url)."""
+    handler = type("ConfiguredStripeHandler", (StripeHandler,), {"delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--delay-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    server, url = start(args.port, args.delay_ms / 1000.0)
+    print(f"Stripe stand-in listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
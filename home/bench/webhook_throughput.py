@@ -0,0 +1,64 @@
+"""Measure webhook ingestion (request -> outbox) and worker (outbox -> Transaction) throughput.
+
+    python -m bench.webhook_throughput --events 5000 --duplicates 0.1
+"""
+import argparse
+import os
+import tempfile
+import time
+from bench.common import make_app
+from bench import fake_stripe
+from src.models.user import User, db
+from src.models.content import Content
+from src.models.finance import Transaction
+from src.services.webhook_worker import process_batch
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--duplicates", type=float, default=0.1, help="Fraction of redelivered events")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="webhook-bench-")
+    app = make_app(f"sqlite:///{os.path.join(workdir, 'app.db')}",
+                   WEBHOOK_OUTBOX_PATH=os.path.join(workdir, "outbox.sqlite3"))
+    secret = app.config["STRIPE_WEBHOOK_SECRET"]
+
+    with app.app_context():
+        coaches = [User(email=f"coach{i}@bench", password_hash="x", role="coach") for i in range(20)]
+        fans = [User(email=f"fan{i}@bench", password_hash="x", role="fan") for i in range(200)]
+        db.session.add_all(coaches + fans)
+        db.session.commit()
+        contents = [Content(coach_id=coaches[i % 20].id, title=f"c{i}", content_type="text", access_setting="paywall")
+                    for i in range(100)]
+        db.session.add_all(contents)
+        db.session.commit()
+        fan_ids = [u.id for u in fans]
+        coach_ids = [u.id for u in coaches]
+        content_ids = [c.id for c in contents]
+
+    deliveries = [fake_stripe.signed_delivery(evt, secret) for evt in
+                  fake_stripe.random_events(args.events, fan_ids, coach_ids, content_ids, args.duplicates)]
+
+    client = app.test_client()
+    started = time.perf_counter()
+    for payload, headers in deliveries:
+        response = client.post("/api/monetization/stripe_webhook", data=payload, headers=headers)
+        assert response.status_code == 200, response.data
+    ingest_seconds = time.perf_counter() - started
+
+    with app.app_context():
+        started = time.perf_counter()
+        while process_batch(batch_size=args.batch_size):
+            pass
+        worker_seconds = time.perf_counter() - started
+        transactions = Transaction.query.count()
+
+    print(f"deliveries:        {len(deliveries)}")
+    print(f"ingest:            {len(deliveries) / ingest_seconds:,.0f} events/s ({ingest_seconds:.2f}s)")
+    print(f"worker:            {len(deliveries) / worker_seconds:,.0f} events/s ({worker_seconds:.2f}s)")
+    print(f"transactions:      {transactions}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+
+def _bool(name, default="false"):
+    return os.getenv(name, default).lower() == "true"
+
+def config_from_env():
+    """Application settings read from the environment (see create_app in src/main.py)."""
+    config = {}
+    config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT') # Also signs auth and media tokens
+    # Auth tokens (src/services/auth.py) and the bounded password-hashing pool used by login
+    config['ACCESS_TOKEN_TTL'] = int(os.getenv('ACCESS_TOKEN_TTL', 3600))
+    config['REFRESH_TOKEN_TTL'] = int(os.getenv('REFRESH_TOKEN_TTL', 14 * 24 * 3600))
+    config['LOGIN_HASH_WORKERS'] = int(os.getenv('LOGIN_HASH_WORKERS', 4))
+    config['LOGIN_HASH_QUEUE'] = int(os.getenv('LOGIN_HASH_QUEUE', 16))
+
+    # Warnings and errors also go to this file when set; otherwise only to stderr
+    config['LOG_FILE'] = os.getenv('LOG_FILE')
+
+    # Configure upload folder for content
+    config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', os.path.join(os.getcwd(), "uploads"))
+    config['STORAGE_BACKEND'] = os.getenv('STORAGE_BACKEND', 'local')
+    # Lifetime of signed media URLs, and optional nginx internal location that serves UPLOAD_FOLDER
+    config['MEDIA_URL_TTL'] = int(os.getenv('MEDIA_URL_TTL', 300))
+    config['MEDIA_ACCEL_REDIRECT_PREFIX'] = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX')
+
+    # Stripe Configuration - Replace with your actual keys in a secure way (e.g., environment variables)
+    config['STRIPE_PUBLIC_KEY'] = os.getenv('STRIPE_PUBLIC_KEY', 'pk_test_YOUR_STRIPE_PUBLIC_KEY')
+    config['STRIPE_SECRET_KEY'] = os.getenv('STRIPE_SECRET_KEY', 'sk_test_YOUR_STRIPE_SECRET_KEY')
+    config['STRIPE_WEBHOOK_SECRET'] = os.getenv('STRIPE_WEBHOOK_SECRET', 'whsec_YOUR_WEBHOOK_SECRET')
+    # Optional override so a local Stripe stand-in can be used (see bench/stripe_server.py)
+    config['STRIPE_API_BASE'] = os.getenv('STRIPE_API_BASE')
+    config['STRIPE_CONNECT_TIMEOUT'] = float(os.getenv('STRIPE_CONNECT_TIMEOUT', 2.0))
+    config['STRIPE_READ_TIMEOUT'] = float(os.getenv('STRIPE_READ_TIMEOUT', 5.0))
+    config['STRIPE_POOL_SIZE'] = int(os.getenv('STRIPE_POOL_SIZE', 10))
+    # Local durable queue between the webhook endpoint and `flask process-webhooks`
+    config['WEBHOOK_OUTBOX_PATH'] = os.getenv('WEBHOOK_OUTBOX_PATH', os.path.join(os.getcwd(), "webhook_outbox.sqlite3"))
+
+    # Platform Fee Configuration (default to 15%)
+    config['PLATFORM_FEE_PERCENTAGE'] = float(os.getenv('PLATFORM_FEE_PERCENTAGE', 15.0))
+    # Payout engine: coaches owed less than the minimum roll over to the next run
+    config['PAYOUT_MINIMUM_CENTS'] = int(os.getenv('PAYOUT_MINIMUM_CENTS', 100))
+    config['PAYOUT_CONCURRENCY'] = int(os.getenv('PAYOUT_CONCURRENCY', 10))
+    # Deleted content is purged for good (`flask purge-content`) only after this many seconds
+    config['CONTENT_PURGE_GRACE'] = int(os.getenv('CONTENT_PURGE_GRACE', 3 * 24 * 3600))
+
+    config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL') or f"mysql+pymysql://{os.getenv('DB_USERNAME', 'root')}:{os.getenv('DB_PASSWORD', 'password')}@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '3306')}/{os.getenv('DB_NAME', 'mydb')}"
+    config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    config['SQLALCHEMY_ECHO'] = _bool('SQLALCHEMY_ECHO') # Log every SQL statement (debugging only)
+    # Connection pool per engine and worker process. Size it to the worker's thread count:
+    # a thread holds at most one connection, so a larger pool only idles connections.
+    config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', os.getenv('WORKER_THREADS', 4)))
+    config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 2))
+    config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    # Recycle before MySQL's wait_timeout (or a proxy's idle timeout) closes the connection
+    config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    config['DB_POOL_PRE_PING'] = _bool('DB_POOL_PRE_PING', 'true')
+    # Comma-separated read replica URLs for @read_replica views (src/services/db_routing.py)
+    config['DB_REPLICA_URLS'] = [url.strip() for url in os.getenv('DB_REPLICA_URLS', '').split(',') if url.strip()]
+
+    # Cache for coach listings and profiles (src/services/response_cache.py): a short-lived local
+    # tier per worker, plus a shared tier on a Redis server when RESPONSE_CACHE_URL is set
+    config['RESPONSE_CACHE_URL'] = os.getenv('RESPONSE_CACHE_URL') # e.g. redis://localhost:6379/0
+    config['RESPONSE_CACHE_LOCAL_SIZE'] = int(os.getenv('RESPONSE_CACHE_LOCAL_SIZE', 10000))
+    config['RESPONSE_CACHE_LOCAL_TTL'] = float(os.getenv('RESPONSE_CACHE_LOCAL_TTL', 5))
+    config['RESPONSE_CACHE_TTL'] = int(os.getenv('RESPONSE_CACHE_TTL', 300))
+    config['RESPONSE_CACHE_LOCK_TIMEOUT'] = float(os.getenv('RESPONSE_CACHE_LOCK_TIMEOUT', 2.0))
+
+    # Request metrics at /api/admin/metrics; bodies are only logged for a sampled fraction of requests
+    config['LOG_BODIES_SAMPLE_RATE'] = float(os.getenv('LOG_BODIES_SAMPLE_RATE', 0.0))
+    # Per-request query counts; X-SQL-* debug headers are off unless SQL_PROFILER_HEADERS=true
+    config['SQL_PROFILER_HEADERS'] = _bool('SQL_PROFILER_HEADERS')
+    return config
+
+def apply_database_settings(config):
+    """Derive engine options and replica binds from the DB_* settings, after any overrides."""
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    options = {'pool_pre_ping': config.get('DB_POOL_PRE_PING', True)}
+    if not uri.startswith('sqlite'):
+        # SQLite uses its own pool classes, which take none of these
+        options.update({
+            'pool_size': config.get('DB_POOL_SIZE', 4),
+            'max_overflow': config.get('DB_MAX_OVERFLOW', 2),
+            'pool_timeout': config.get('DB_POOL_TIMEOUT', 10),
+            'pool_recycle': config.get('DB_POOL_RECYCLE', 1800)
+        })
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', options)
+
+    binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+    replica_keys = []
+    for i, url in enumerate(config.get('DB_REPLICA_URLS') or [], start=1):
+        binds[f'replica_{i}'] = url
+        replica_keys.append(f'replica_{i}')
+    config['SQLALCHEMY_BINDS'] = binds
+    config['DB_REPLICA_BINDS'] = replica_keys
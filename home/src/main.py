@@ -1,71 +1,65 @@
 import os
 import sys
-import stripe # Import stripe
+import time
+
+_import_started = time.perf_counter()
 
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory, logging, request # Import logging
-from src.models.user import db 
+import click
+from flask import Flask, send_from_directory, current_app
+from src.config import config_from_env, apply_database_settings
+from src.models.user import db
 from src.routes.user import user_bp
 from src.routes.profile import profile_bp
 from src.routes.content import content_bp
 from src.routes.monetization import monetization_bp
 from src.routes.admin import admin_bp # Import the admin blueprint
+from src.services.storage import UploadRequest
+from src.services import telemetry, entitlements, response_cache, sql_profiler, db_routing, subscription_expiry
+
+# Creating the app does no I/O: no database connection, no DDL, no Stripe import. Tables are
+# created and migrated by `flask upgrade-schema`, Stripe is loaded on first use.
+
+def create_app(config=None):
+    """Build the application from the environment; `config` overrides individual settings."""
+    started = time.perf_counter()
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.request_class = UploadRequest # Stream uploaded files straight into storage
+    app.config.update(config_from_env())
+    if config:
+        app.config.update(config)
+
+    if app.config.get('LOG_FILE'):
+        import logging
+        file_handler = logging.FileHandler(app.config['LOG_FILE'])
+        file_handler.setLevel(logging.WARNING)
+        app.logger.addHandler(file_handler)
+
+    app.register_blueprint(user_bp, url_prefix='/api/user')
+    app.register_blueprint(profile_bp, url_prefix='/api/profile')
+    app.register_blueprint(content_bp, url_prefix='/api/content')
+    app.register_blueprint(monetization_bp, url_prefix='/api/monetization')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin') # Register admin blueprint
+    apply_database_settings(app.config)
+    db.init_app(app)
+    db_routing.init_app(app, db)
+
+    telemetry.init_app(app)
+    telemetry.metrics.register_collector(entitlements.metric_lines)
+    telemetry.metrics.register_collector(response_cache.metric_lines)
+    telemetry.metrics.register_collector(subscription_expiry.metric_lines)
+    sql_profiler.init_app(app)
+    register_commands(app)
+    app.add_url_rule('/', 'serve', serve, defaults={'path': ''})
+    app.add_url_rule('/<path:path>', 'serve', serve)
+
+    telemetry.metrics.record_startup("create_app", time.perf_counter() - started)
+    return app
 
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
-
-# Add basic logging
-if not app.debug:
-    import logging
-    file_handler = logging.FileHandler('/home/ubuntu/flask_production.log')
-    file_handler.setLevel(logging.WARNING)
-    app.logger.addHandler(file_handler)
-
-# Configure upload folder for content
-app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), "uploads") 
-
-# Stripe Configuration - Replace with your actual keys in a secure way (e.g., environment variables)
-app.config['STRIPE_PUBLIC_KEY'] = os.getenv('STRIPE_PUBLIC_KEY', 'pk_test_YOUR_STRIPE_PUBLIC_KEY')
-app.config['STRIPE_SECRET_KEY'] = os.getenv('STRIPE_SECRET_KEY', 'sk_test_YOUR_STRIPE_SECRET_KEY')
-app.config['STRIPE_WEBHOOK_SECRET'] = os.getenv('STRIPE_WEBHOOK_SECRET', 'whsec_YOUR_WEBHOOK_SECRET')
-stripe.api_key = app.config['STRIPE_SECRET_KEY']
-
-# Platform Fee Configuration (default to 15%)
-app.config['PLATFORM_FEE_PERCENTAGE'] = float(os.getenv('PLATFORM_FEE_PERCENTAGE', 15.0))
-
-app.register_blueprint(user_bp, url_prefix='/api/user')
-app.register_blueprint(profile_bp, url_prefix='/api/profile')
-app.register_blueprint(content_bp, url_prefix='/api/content')
-app.register_blueprint(monetization_bp, url_prefix='/api/monetization')
-app.register_blueprint(admin_bp, url_prefix='/api/admin') # Register admin blueprint
-
-app.config['SQLALCHEMY_DATABASE_URI'] = f"mysql+pymysql://{os.getenv('DB_USERNAME', 'root')}:{os.getenv('DB_PASSWORD', 'password')}@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '3306')}/{os.getenv('DB_NAME', 'mydb')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = True # Enable SQLAlchemy logging
-db.init_app(app)
-
-# Test: Comment out db.create_all() to see if it's the blocking call
-with app.app_context():
-    app.logger.info("Attempting to create database tables...")
-    db.create_all()
-    app.logger.info("Database tables created (or already exist).")
-
-@app.before_request
-def log_request_info():
-    app.logger.debug('Headers: %s', request.headers)
-    app.logger.debug('Body: %s', request.get_data())
-
-@app.after_request
-def log_response_info(response):
-    app.logger.debug('Response: %s', response.get_data())
-    return response
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
 def serve(path):
-    static_folder_path = app.static_folder
+    static_folder_path = current_app.static_folder
     if static_folder_path is None:
             return "Static folder not configured", 404
 
@@ -78,10 +72,149 @@ def serve(path):
         else:
             return "index.html not found", 404
 
+def register_commands(app):
+    @app.cli.command("ensure-indexes")
+    def ensure_indexes_command():
+        """Create indexes declared on the models that an existing database is missing."""
+        from src.services.schema import ensure_indexes
+        created = ensure_indexes()
+        print(f"Created {len(created)} index(es)")
+
+    @app.cli.command("upgrade-schema")
+    def upgrade_schema_command():
+        """Create missing tables, columns and indexes; adopt pre-engine payouts. Run on deploy, the app never does DDL itself."""
+        from src.services.schema import ensure_columns, ensure_collations, ensure_indexes
+        from src.services.payouts import adopt_legacy_payouts
+        db.create_all(bind_key=None) # Primary only: replica binds are never written to
+        added = ensure_columns()
+        converted = ensure_collations()
+        created = ensure_indexes()
+        print(f"Added {len(added)} column(s), converted {len(converted)} collation(s), created {len(created)} index(es)")
+        adopt_legacy_payouts() # Before the first compute run, which would pay their transactions again
+
+    @app.cli.command("check-query-plans")
+    def check_query_plans_command():
+        """EXPLAIN the hot query shapes and fail if any falls back to a full table scan."""
+        from src.services.query_plans import check_query_plans
+        failures = check_query_plans()
+        for name, tables in failures.items():
+            print(f"FULL SCAN: {name} ({', '.join(tables)})")
+        if failures:
+            sys.exit(1)
+        print("All hot query shapes use an index")
+
+    @app.cli.command("process-webhooks")
+    @click.option("--batch-size", default=500, show_default=True)
+    @click.option("--once", is_flag=True, help="Drain a single batch and exit.")
+    def process_webhooks_command(batch_size, once):
+        """Turn queued Stripe webhook events into Transaction rows."""
+        from src.services.webhook_worker import process_batch, run_worker
+        if once:
+            print(f"Processed {process_batch(batch_size=batch_size)} event(s)")
+        else:
+            run_worker(batch_size=batch_size)
+
+    @app.cli.command("purge-content")
+    @click.option("--batch-size", default=500, show_default=True)
+    @click.option("--once", is_flag=True, help="Purge everything past the grace period and exit.")
+    @click.option("--grace", type=int, default=None, help="Seconds deleted content is kept [default: CONTENT_PURGE_GRACE].")
+    def purge_content_command(batch_size, once, grace):
+        """Remove soft-deleted content with its purchases, ledger links and files, in batches."""
+        from src.services.content_purge import purge_pending, run_purger
+        if once:
+            print(f"Purged {purge_pending(batch_size=batch_size, grace=grace)} item(s)")
+        else:
+            run_purger(batch_size=batch_size, grace=grace)
+
+    @app.cli.command("expire-subscriptions")
+    @click.option("--batch-size", default=1000, show_default=True)
+    @click.option("--once", is_flag=True, help="Expire everything overdue now and exit.")
+    def expire_subscriptions_command(batch_size, once):
+        """Mark subscriptions past their end_date inactive and notify the expiry handlers."""
+        from src.services.subscription_expiry import expire_overdue, run_sweeper
+        if once:
+            print(f"Expired {expire_overdue(batch_size=batch_size)} subscription(s)")
+        else:
+            run_sweeper(batch_size=batch_size)
+
+    @app.cli.command("rebuild-earnings")
+    @click.option("--since", default=None, help="First day to rebuild (YYYY-MM-DD).")
+    @click.option("--until", default=None, help="Day to stop before (YYYY-MM-DD).")
+    @click.option("--coach-id", default=None, type=int)
+    def rebuild_earnings_command(since, until, coach_id):
+        """Recompute the per-coach daily earnings rollups from the Transaction ledger."""
+        from datetime import date
+        from src.services.earnings import rebuild
+        rebuilt = rebuild(since=date.fromisoformat(since) if since else None,
+                          until=date.fromisoformat(until) if until else None,
+                          coach_id=coach_id)
+        print(f"Rebuilt {rebuilt} rollup row(s)")
+
+    @app.cli.command("refresh-revenue")
+    def refresh_revenue_command():
+        """Fold transactions created since the last run into the revenue analytics buckets. Run from cron."""
+        from src.services.revenue import refresh
+        print(f"Folded {refresh()} group(s)")
+
+    @app.cli.command("rebuild-revenue")
+    @click.option("--since", default=None, help="First month to rebuild (YYYY-MM-DD), default all.")
+    def rebuild_revenue_command(since):
+        """Recompute the revenue analytics buckets behind the watermark from Transaction."""
+        from datetime import date
+        from src.services.revenue import rebuild
+        print(f"Rebuilt {rebuild(since=date.fromisoformat(since) if since else None)} group(s)")
+
+    @app.cli.command("rebuild-search-index")
+    @click.option("--batch-size", default=1000, show_default=True)
+    def rebuild_search_index_command(batch_size):
+        """Rebuild the content full-text index (ContentSearchTerm) from Content."""
+        from src.services.search import rebuild_index
+        print(f"Indexed {rebuild_index(batch_size=batch_size)} item(s)")
+
+    @app.cli.command("export-ledger")
+    @click.argument("kind", type=click.Choice(["transactions", "payouts"]))
+    @click.option("--since", default=None, help="First timestamp included (ISO 8601).")
+    @click.option("--until", default=None, help="Timestamp to stop before (ISO 8601).")
+    @click.option("--coach-id", default=None, type=int)
+    @click.option("--format", "fmt", default="csv", type=click.Choice(["csv", "ndjson"]), show_default=True)
+    @click.option("--gzip", "compress", is_flag=True, help="Gzip the output.")
+    @click.option("--output", default="-", help="File to write (default: stdout).")
+    def export_ledger_command(kind, since, until, coach_id, fmt, compress, output):
+        """Stream Transaction or Payout rows as CSV/NDJSON in constant memory."""
+        from datetime import datetime
+        from src.services.ledger_export import export
+        pieces = export(kind, fmt, compress, since=datetime.fromisoformat(since) if since else None,
+                        until=datetime.fromisoformat(until) if until else None, coach_id=coach_id)
+        with click.open_file(output, "wb") as f:
+            for piece in pieces:
+                f.write(piece)
+
+    @app.cli.command("run-payouts")
+    @click.option("--skip-compute", is_flag=True, help="Only send transfers for payouts that already exist.")
+    @click.option("--concurrency", default=None, type=int, help="Transfers in flight (defaults to PAYOUT_CONCURRENCY).")
+    def run_payouts_command(skip_compute, concurrency):
+        """Compute what every coach is owed and send the transfers. Safe to rerun after a crash."""
+        from src.services.payouts import compute_payouts, execute_payouts
+        if not skip_compute:
+            run_id, created = compute_payouts()
+            print(f"Run {run_id}: created {created} payout(s)")
+        print(f"Transfers: {execute_payouts(concurrency=concurrency)}")
+
+    @app.cli.command("process-media")
+    @click.option("--workers", default=None, type=int, help="Pool size (defaults to the CPU count).")
+    @click.option("--batch-size", default=50, show_default=True)
+    def process_media_command(workers, batch_size):
+        """Generate thumbnails/variants and extract metadata for uploaded media."""
+        from src.services.media_worker import run_worker
+        run_worker(workers=workers, batch_size=batch_size)
+# Module import time (mostly Flask, SQLAlchemy and the routes), reported next to create_app
+telemetry.metrics.record_startup("import", time.perf_counter() - _import_started)
+
+# For `gunicorn src.main:app` and `flask --app src.main`
+app = create_app()
+
 if __name__ == '__main__':
-    # Ensure the logger is configured for debug level if app.debug is True
-    if app.debug:
-        app.logger.setLevel(logging.DEBUG)
+    import logging
+    app.logger.setLevel(logging.DEBUG)
     app.logger.info("Starting Flask application...")
     app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False) # use_reloader=False to avoid issues with debugger and multiple processes
-
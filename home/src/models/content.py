@@ -1,5 +1,6 @@
 from .user import db # Assuming db is initialized in user.py or a shared models.py
 from datetime import datetime
+from sqlalchemy.dialects.mysql import VARCHAR
 
 class Content(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -14,7 +15,62 @@ class Content(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Filled in by the media worker (src/services/media_worker.py) after upload
+    processing_status = db.Column(db.String(20), nullable=True) # None for text, else "pending", "ready" or "failed"
+    processing_error = db.Column(db.String(255), nullable=True)
+    processing_claimed_at = db.Column(db.DateTime, nullable=True) # Lease of the dispatcher working on it
+    file_size = db.Column(db.BigInteger, nullable=True) # bytes
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    duration_seconds = db.Column(db.Float, nullable=True) # videos only
+    thumbnail_key = db.Column(db.String(255), nullable=True) # storage keys of generated variants
+    web_key = db.Column(db.String(255), nullable=True)
+
+    # Set on delete: read paths skip the row at once, `flask purge-content` removes it later
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    purge_id = db.Column(db.Integer, db.ForeignKey("content_purge.id"), nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_content_coach_created", "coach_id", "created_at"),
+        db.Index("ix_content_created", "created_at"),
+        db.Index("ix_content_processing_status", "processing_status"),
+        # The purger's queue (a plain deleted_at index on MySQL)
+        db.Index("ix_content_deleted", "deleted_at", "id",
+                 sqlite_where=deleted_at.isnot(None), postgresql_where=deleted_at.isnot(None)),
+        # Identical uploads share a stored file: the purger checks before deleting one
+        db.Index("ix_content_file_url", "file_url"),
+    )
+
     coach = db.relationship("User", backref=db.backref("contents", lazy=True))
 
     def __repr__(self):
         return f"<Content {self.id} - {self.title} by Coach {self.coach_id}>"
+
+class ContentSearchTerm(db.Model):
+    # Inverted index over Content.title and description, one row per (term, content).
+    # Maintained on upload/delete by src/services/search.py; `flask rebuild-search-index` rebuilds it.
+    # Binary on MySQL: its default collation equates "café" and "cafe", which tokenize() keeps apart
+    term = db.Column(db.String(64).with_variant(VARCHAR(64, collation="utf8mb4_bin"), "mysql"), primary_key=True)
+    content_id = db.Column(db.Integer, db.ForeignKey("content.id"), primary_key=True)
+    weight = db.Column(db.Integer, nullable=False) # Title hits count triple
+
+    __table_args__ = (
+        db.Index("ix_content_search_term_content", "content_id"),
+        db.Index("ix_content_search_term_rank", "term", "weight", "content_id"), # top-k for one-term queries
+    )
+
+    def __repr__(self):
+        return f"<ContentSearchTerm {self.term} -> {self.content_id}>"
+
+class ContentPurge(db.Model):
+    # One delete request (a single item or a bulk delete) and how far the purger has got with it
+    id = db.Column(db.Integer, primary_key=True)
+    requested_at = db.Column(db.DateTime, default=datetime.utcnow)
+    content_count = db.Column(db.Integer, nullable=False)
+    purged_count = db.Column(db.Integer, nullable=False, default=0)
+    rows_removed = db.Column(db.Integer, nullable=False, default=0) # purchases deleted, transactions detached
+    files_removed = db.Column(db.Integer, nullable=False, default=0)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<ContentPurge {self.id}: {self.purged_count}/{self.content_count}>"
@@ -9,6 +9,7 @@ class Transaction(db.Model):
     content_id = db.Column(db.Integer, db.ForeignKey("content.id"), nullable=True)
     subscription_id = db.Column(db.Integer, db.ForeignKey("subscription.id"), nullable=True)
     purchase_id = db.Column(db.Integer, db.ForeignKey("pay_per_view_purchase.id"), nullable=True)
+    payout_id = db.Column(db.Integer, db.ForeignKey("payout.id"), nullable=True) # Set once the coach's share is included in a payout
     amount = db.Column(db.Float, nullable=False)  # Gross amount of the transaction
     platform_fee = db.Column(db.Float, nullable=True, default=0.0)
     net_amount = db.Column(db.Float, nullable=True) # Amount after platform fee, relevant for coach earnings
@@ -18,6 +19,14 @@ class Transaction(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_transaction_created", "created_at"),
+        db.Index("ix_transaction_coach_status", "coach_id", "status"),
+        db.Index("ix_transaction_coach_created", "coach_id", "created_at"), # per-coach ledger exports
+        db.Index("ix_transaction_content", "content_id"), # Detaching a purged content item
+        db.Index("ix_transaction_payout", "payout_id", "status", "coach_id", "currency"),
+    )
+
     # Relationships (optional, but can be useful)
     user = db.relationship("User", foreign_keys=[user_id], backref=db.backref("transactions_as_user", lazy="dynamic"))
     coach_involved = db.relationship("User", foreign_keys=[coach_id], backref=db.backref("transactions_as_coach", lazy="dynamic"))
@@ -36,10 +45,72 @@ class Payout(db.Model):
     requested_at = db.Column(db.DateTime, default=datetime.utcnow)
     processed_at = db.Column(db.DateTime, nullable=True)
     stripe_transfer_id = db.Column(db.String(255), nullable=True, unique=True)
-    # Potentially link to transactions included in this payout
+    # Set by the payout engine (src/services/payouts.py)
+    amount_cents = db.Column(db.BigInteger, nullable=True)
+    transaction_count = db.Column(db.Integer, nullable=True)
+    run_id = db.Column(db.String(32), nullable=True)
+    idempotency_key = db.Column(db.String(255), nullable=True) # Sent with every transfer attempt for this payout
+    attempts = db.Column(db.Integer, nullable=True, default=0)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    failure_reason = db.Column(db.String(255), nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_payout_requested", "requested_at"),
+        db.Index("ix_payout_status", "status", "id"),
+        db.Index("ix_payout_run", "run_id", "coach_id", "currency"),
+        db.Index("uq_payout_idempotency_key", "idempotency_key", unique=True),
+    )
+
+    transactions = db.relationship("Transaction", backref="payout", lazy="dynamic")
 
     coach = db.relationship("User", backref=db.backref("payouts_received", lazy="dynamic"))
 
     def __repr__(self):
         return f"<Payout {self.id} - Coach {self.coach_id}, Amount: {self.amount} {self.currency}, Status: {self.status}>"
 
+
+class CoachEarningsDaily(db.Model):
+    # Per-coach, per-day totals of succeeded transactions in integer minor units (cents).
+    # Maintained by the webhook worker; `flask rebuild-earnings` recomputes it from Transaction.
+    coach_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    currency = db.Column(db.String(10), primary_key=True)
+    gross_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    fee_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    net_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<CoachEarningsDaily Coach {self.coach_id} {self.day} {self.net_cents} {self.currency}>"
+
+
+class RevenueBucket(db.Model):
+    # Totals of succeeded transactions in cents per period, at two grains ("day", "month"), both
+    # per coach and platform-wide (coach_id 0; -1 collects transactions without a coach).
+    # Covers the ledger up to RollupWatermark "revenue", see src/services/revenue.py.
+    grain = db.Column(db.String(5), primary_key=True)
+    period = db.Column(db.Date, primary_key=True) # First day of the day or month
+    coach_id = db.Column(db.Integer, primary_key=True)
+    transaction_type = db.Column(db.String(50), primary_key=True)
+    currency = db.Column(db.String(10), primary_key=True)
+    gross_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    fee_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    net_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index("ix_revenue_bucket_coach", "coach_id", "grain", "period"),
+    )
+
+    def __repr__(self):
+        return f"<RevenueBucket {self.grain} {self.period} Coach {self.coach_id} {self.transaction_type} {self.net_cents} {self.currency}>"
+
+
+class RollupWatermark(db.Model):
+    # How far an incrementally maintained rollup has folded in the ledger: rows created
+    # before covered_until are in it, later ones are not yet.
+    name = db.Column(db.String(50), primary_key=True)
+    covered_until = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<RollupWatermark {self.name} {self.covered_until}>"
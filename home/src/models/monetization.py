@@ -9,6 +9,16 @@ class Subscription(db.Model):
     start_date = db.Column(db.DateTime, default=datetime.utcnow)
     end_date = db.Column(db.DateTime, nullable=False)
     is_active = db.Column(db.Boolean, default=True)
+    payment_intent_id = db.Column(db.String(255), nullable=True) # The payment that bought it; usable once
+
+    __table_args__ = (
+        db.Index("uq_subscription_payment_intent", "payment_intent_id", unique=True),
+        # Serves the active-subscription lookup in every access check
+        db.Index("ix_subscription_fan_coach_active_end", "fan_id", "coach_id", "is_active", "end_date"),
+        # The expiry sweeper's queue: only rows still marked active (a plain end_date index on MySQL)
+        db.Index("ix_subscription_active_end", "end_date",
+                 sqlite_where=is_active == True, postgresql_where=is_active == True),
+    )
 
     fan = db.relationship("User", foreign_keys=[fan_id], backref=db.backref("subscriptions_made", lazy=True))
     coach = db.relationship("User", foreign_keys=[coach_id], backref=db.backref("subscribers", lazy=True))
@@ -22,6 +32,14 @@ class PayPerViewPurchase(db.Model):
     content_id = db.Column(db.Integer, db.ForeignKey("content.id"), nullable=False)
     purchase_date = db.Column(db.DateTime, default=datetime.utcnow)
     amount_paid = db.Column(db.Float, nullable=False) # Store the amount paid at the time of purchase
+    payment_intent_id = db.Column(db.String(255), nullable=True) # The payment that bought it; usable once
+
+    __table_args__ = (
+        # A fan can buy a content item once; also serves the purchase lookup
+        db.Index("uq_ppv_fan_content", "fan_id", "content_id", unique=True),
+        db.Index("ix_ppv_content", "content_id"), # Purging a deleted item's purchases
+        db.Index("uq_ppv_payment_intent", "payment_intent_id", unique=True),
+    )
 
     fan = db.relationship("User", backref=db.backref("purchased_content_items", lazy=True))
     content = db.relationship("Content", backref=db.backref("purchases", lazy=True))
@@ -1,7 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
 from werkzeug.security import generate_password_hash, check_password_hash
+from src.services.db_routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession}) # Replica routing for @read_replica views
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -12,6 +15,9 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=True) # initially nullable, can be set up later
     profile_picture_url = db.Column(db.String(255), nullable=True)
     bio = db.Column(db.Text, nullable=True)
+    stripe_account_id = db.Column(db.String(255), nullable=True) # Coach's Stripe Connect account, payout destination
+    # Bumped on every ORM update (see below); User has no timestamps, so this is its HTTP validator
+    version = db.Column(db.Integer, nullable=True, default=1)
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -21,3 +27,16 @@ class User(db.Model):
 
     def __repr__(self):
         return f'<User {self.email}>'
+
+@event.listens_for(User, "before_update")
+def _bump_version(mapper, connection, target):
+    if object_session(target).is_modified(target, include_collections=False):
+        target.version = (target.version or 0) + 1
+
+class RevokedToken(db.Model):
+    # Logged-out / rotated auth tokens, kept until they would have expired anyway
+    jti = db.Column(db.String(36), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<RevokedToken {self.jti}>'
@@ -1,9 +1,15 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, url_for, Response, stream_with_context
 from src.models.user import User, db
-from src.models.content import Content
+from src.models.content import Content, ContentPurge
 from src.models.monetization import Subscription, PayPerViewPurchase
 from src.models.finance import Transaction, Payout # Import finance models
 from werkzeug.security import generate_password_hash
+from src.services.pagination import paginated_response, apply_date_range, parse_datetime_arg
+from src.services import entitlements, earnings, payouts, ledger_export, revenue, content_purge
+from src.services.webhook_outbox import get_outbox
+from src.services.telemetry import metrics
+from src.services.db_routing import read_replica
+from src.services.conditional import make_etag, conditional_response
 from datetime import datetime
 
 admin_bp = Blueprint("admin", __name__)
@@ -21,114 +27,308 @@ def admin_required(f):
     decorated_function.__name__ = f.__name__ # Preserve original function name for Flask
     return decorated_function
 
+def user_to_dict(user):
+    return {
+        "id": user.id,
+        "email": user.email,
+        "username": user.username,
+        "role": user.role,
+        "profile_picture_url": user.profile_picture_url
+    }
+
+def content_to_dict(item):
+    return {
+        "id": item.id,
+        "coach_id": item.coach_id,
+        "title": item.title,
+        "content_type": item.content_type,
+        "access_setting": item.access_setting,
+        "processing_status": item.processing_status,
+        "thumbnail_url": url_for("content.get_content_media", content_id=item.id, variant="thumbnail") if item.thumbnail_key else None,
+        "created_at": item.created_at.isoformat(),
+        "deleted_at": item.deleted_at.isoformat() if item.deleted_at else None
+    }
+
+def transaction_to_dict(t):
+    return {
+        "id": t.id,
+        "transaction_type": t.transaction_type,
+        "user_id": t.user_id,
+        "coach_id": t.coach_id,
+        "content_id": t.content_id,
+        "subscription_id": t.subscription_id,
+        "purchase_id": t.purchase_id,
+        "amount": t.amount,
+        "platform_fee": t.platform_fee,
+        "net_amount": t.net_amount,
+        "currency": t.currency,
+        "stripe_payment_intent_id": t.stripe_payment_intent_id,
+        "status": t.status,
+        "payout_id": t.payout_id,
+        "created_at": t.created_at.isoformat()
+    }
+
+def payout_to_dict(p):
+    return {
+        "id": p.id,
+        "coach_id": p.coach_id,
+        "amount": p.amount,
+        "amount_cents": p.amount_cents,
+        "transaction_count": p.transaction_count,
+        "currency": p.currency,
+        "status": p.status,
+        "failure_reason": p.failure_reason,
+        "requested_at": p.requested_at.isoformat(),
+        "processed_at": p.processed_at.isoformat() if p.processed_at else None,
+        "stripe_transfer_id": p.stripe_transfer_id
+    }
+
+# Validators for conditional GET: whatever changes when the serialized row would.
+# Payout has no timestamp, so its validator is the columns that move during a run.
+def user_version(user):
+    return (user.id, user.version)
+
+def content_version(item):
+    return (item.id, item.updated_at)
+
+def transaction_version(t):
+    return (t.id, t.updated_at)
+
+def payout_version(p):
+    return (p.id, p.status, p.amount_cents, p.processed_at, p.stripe_transfer_id, p.failure_reason)
+
+# Admin responses are for the admin key only: private, and varying on it
+ADMIN_CACHE = {"private": True, "vary": ("X-Admin-Auth",)}
+
+# List endpoints are keyset-paginated (see src/services/pagination.py):
+# ?limit=&cursor= for pages, ?format=ndjson|stream to stream the full result set.
+# JSON pages carry an ETag and answer If-None-Match with 304 (see src/services/conditional.py).
 @admin_bp.route("/users", methods=["GET"])
 @admin_required
+@read_replica
 def list_users():
-    users = User.query.all()
-    user_list = []
-    for user in users:
-        user_list.append({
-            "id": user.id,
-            "email": user.email,
-            "username": user.username,
-            "role": user.role,
-            "profile_picture_url": user.profile_picture_url
-        })
-    return jsonify(user_list), 200
+    query = User.query
+    role = request.args.get("role")
+    if role:
+        query = query.filter(User.role == role)
+    # User has no timestamp column, so pages are ordered by id alone
+    return paginated_response(query, None, User.id, user_to_dict, user_version, **ADMIN_CACHE)
 
 @admin_bp.route("/user/<int:user_id>", methods=["GET"])
 @admin_required
+@read_replica
 def get_user(user_id):
     user = User.query.get_or_404(user_id)
-    return jsonify({
+    return conditional_response(lambda: jsonify({
         "id": user.id,
         "email": user.email,
         "username": user.username,
         "role": user.role,
         "profile_picture_url": user.profile_picture_url,
         "bio": user.bio
-    }), 200
+    }), make_etag(*user_version(user)), **ADMIN_CACHE)
 
 @admin_bp.route("/content", methods=["GET"])
 @admin_required
+@read_replica
 def list_all_content():
-    content_items = Content.query.order_by(Content.created_at.desc()).all()
-    content_list = []
-    for item in content_items:
-        content_list.append({
-            "id": item.id,
-            "coach_id": item.coach_id,
-            "title": item.title,
-            "content_type": item.content_type,
-            "access_setting": item.access_setting,
-            "created_at": item.created_at.isoformat()
-        })
-    return jsonify(content_list), 200
+    # ?deleted=true lists the items deleted but not purged yet instead
+    deleted = request.args.get("deleted", "").lower() in ("1", "true")
+    query = Content.query.filter(Content.deleted_at.isnot(None) if deleted else Content.deleted_at.is_(None))
+    coach_id = request.args.get("coach_id", type=int)
+    content_type = request.args.get("type")
+    access_setting = request.args.get("access_setting")
+    if coach_id:
+        query = query.filter(Content.coach_id == coach_id)
+    if content_type:
+        query = query.filter(Content.content_type == content_type)
+    if access_setting:
+        query = query.filter(Content.access_setting == access_setting)
+    try:
+        query = apply_date_range(query, Content.created_at)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return paginated_response(query, Content.created_at, Content.id, content_to_dict, content_version,
+                              **ADMIN_CACHE)
 
+# Deletes are soft: the item disappears at once and `flask purge-content` removes it, its
+# purchases and its files later. Both endpoints answer 202 with the purge to poll.
 @admin_bp.route("/content/<int:content_id>", methods=["DELETE"])
 @admin_required
 def delete_content(content_id):
-    content_item = Content.query.get_or_404(content_id)
-    # Potentially add more checks, e.g., soft delete or archiving
-    db.session.delete(content_item)
-    db.session.commit()
-    return jsonify({"message": f"Content item {content_id} deleted"}), 200
+    purge, _ = content_purge.soft_delete([content_id])
+    if purge is None:
+        return jsonify({"error": "Content not found"}), 404
+    return jsonify({"message": f"Content item {content_id} deleted", "purge": content_purge.progress(purge)}), 202
+
+@admin_bp.route("/content/bulk_delete", methods=["POST"])
+@admin_required
+def bulk_delete_content():
+    data = request.get_json(silent=True) or {}
+    content_ids = data.get("content_ids")
+    if not isinstance(content_ids, list) or not content_ids:
+        return jsonify({"error": "content_ids must be a non-empty list"}), 400
+    if len(content_ids) > content_purge.MAX_BULK_DELETE:
+        return jsonify({"error": f"At most {content_purge.MAX_BULK_DELETE} content_ids per request"}), 400
+    try:
+        content_ids = {int(content_id) for content_id in content_ids}
+    except (TypeError, ValueError):
+        return jsonify({"error": "content_ids must be integers"}), 400
+    purge, deleted = content_purge.soft_delete(content_ids)
+    return jsonify({
+        "deleted": len(deleted),
+        "not_found": sorted(content_ids - set(deleted)), # Unknown or already deleted
+        "purge": content_purge.progress(purge) if purge else None
+    }), 202 if purge else 200
+
+@admin_bp.route("/content/purges/<int:purge_id>", methods=["GET"])
+@admin_required
+def get_content_purge(purge_id):
+    return jsonify(content_purge.progress(ContentPurge.query.get_or_404(purge_id))), 200
 
 @admin_bp.route("/transactions", methods=["GET"])
 @admin_required
+@read_replica
 def list_transactions():
-    transactions = Transaction.query.order_by(Transaction.created_at.desc()).all()
-    transaction_list = []
-    for t in transactions:
-        transaction_list.append({
-            "id": t.id,
-            "transaction_type": t.transaction_type,
-            "user_id": t.user_id,
-            "coach_id": t.coach_id,
-            "content_id": t.content_id,
-            "amount": t.amount,
-            "platform_fee": t.platform_fee,
-            "net_amount": t.net_amount,
-            "currency": t.currency,
-            "stripe_payment_intent_id": t.stripe_payment_intent_id,
-            "status": t.status,
-            "created_at": t.created_at.isoformat()
-        })
-    return jsonify(transaction_list), 200
+    query = Transaction.query
+    coach_id = request.args.get("coach_id", type=int)
+    user_id = request.args.get("user_id", type=int)
+    status = request.args.get("status")
+    transaction_type = request.args.get("type")
+    if coach_id:
+        query = query.filter(Transaction.coach_id == coach_id)
+    if user_id:
+        query = query.filter(Transaction.user_id == user_id)
+    if status:
+        query = query.filter(Transaction.status == status)
+    if transaction_type:
+        query = query.filter(Transaction.transaction_type == transaction_type)
+    try:
+        query = apply_date_range(query, Transaction.created_at)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return paginated_response(query, Transaction.created_at, Transaction.id, transaction_to_dict,
+                              transaction_version, **ADMIN_CACHE)
 
 @admin_bp.route("/payouts", methods=["GET"])
 @admin_required
+@read_replica
 def list_payouts():
-    payouts = Payout.query.order_by(Payout.requested_at.desc()).all()
-    payout_list = []
-    for p in payouts:
-        payout_list.append({
-            "id": p.id,
-            "coach_id": p.coach_id,
-            "amount": p.amount,
-            "currency": p.currency,
-            "status": p.status,
-            "requested_at": p.requested_at.isoformat(),
-            "processed_at": p.processed_at.isoformat() if p.processed_at else None,
-            "stripe_transfer_id": p.stripe_transfer_id
-        })
-    return jsonify(payout_list), 200
-
-# Placeholder for initiating/managing payouts - more complex with Stripe Connect
+    query = Payout.query
+    coach_id = request.args.get("coach_id", type=int)
+    status = request.args.get("status")
+    if coach_id:
+        query = query.filter(Payout.coach_id == coach_id)
+    if status:
+        query = query.filter(Payout.status == status)
+    try:
+        query = apply_date_range(query, Payout.requested_at)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return paginated_response(query, Payout.requested_at, Payout.id, payout_to_dict, payout_version,
+                              **ADMIN_CACHE)
+
+# Full ledger download for reconciliation, streamed in constant memory (see ledger_export.py):
+# ?since=&until=&coach_id=&format=csv|ndjson&gzip=1
+@admin_bp.route("/export/<kind>", methods=["GET"])
+@admin_required
+@read_replica
+def export_ledger(kind):
+    if kind not in ledger_export.EXPORTS:
+        return jsonify({"error": f"Unknown export. Must be one of: {', '.join(ledger_export.EXPORTS)}."}), 404
+    fmt = request.args.get("format", "csv")
+    if fmt not in ledger_export.FORMATS:
+        return jsonify({"error": f"Invalid format. Must be one of: {', '.join(ledger_export.FORMATS)}."}), 400
+    compress = request.args.get("gzip", "false").lower() in ("1", "true", "yes")
+    coach_id = request.args.get("coach_id", type=int)
+    try:
+        since = parse_datetime_arg("since")
+        until = parse_datetime_arg("until")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    body = ledger_export.export(kind, fmt, compress, since, until, coach_id)
+    response = Response(stream_with_context(body),
+                        mimetype="application/gzip" if compress else ledger_export.FORMATS[fmt])
+    name = ledger_export.filename(kind, fmt, compress, since, until, coach_id)
+    response.headers["Content-Disposition"] = f'attachment; filename="{name}"'
+    return response
+
+@admin_bp.route("/earnings", methods=["GET"])
+@admin_required
+@read_replica
+def get_earnings():
+    # Platform-wide, or one coach with ?coach_id=; amounts are integer cents
+    coach_id = request.args.get("coach_id", type=int)
+    try:
+        result = earnings.report(coach_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result["coach_id"] = coach_id
+    return jsonify(result), 200
+
+# Revenue by ?bucket=day|week|month and ?group_by=coach,type,currency, optionally filtered by
+# ?coach_id=&type=&currency= over ?since=&until= (dates); amounts are integer cents.
+# Served from pre-aggregated buckets plus the not yet folded tail (see src/services/revenue.py).
+@admin_bp.route("/analytics/revenue", methods=["GET"])
+@admin_required
+@read_replica
+def revenue_analytics():
+    bucket = request.args.get("bucket")
+    if bucket is not None and bucket not in revenue.BUCKETS:
+        return jsonify({"error": f"Invalid bucket. Must be one of: {', '.join(revenue.BUCKETS)}."}), 400
+    group_by = [dimension for dimension in request.args.get("group_by", "").split(",") if dimension]
+    if set(group_by) - set(revenue.DIMENSIONS):
+        return jsonify({"error": f"Invalid group_by. Use any of: {', '.join(revenue.DIMENSIONS)}."}), 400
+    try:
+        since = parse_datetime_arg("since")
+        until = parse_datetime_arg("until")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    since = since.date() if since else None
+    until = until.date() if until else None
+
+    rows, covered_until = revenue.revenue(since, until, bucket, group_by, request.args.get("coach_id", type=int),
+                                          request.args.get("type"), request.args.get("currency"))
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(row["currency"], {"currency": row["currency"], "gross_cents": 0, "fee_cents": 0,
+                                                    "net_cents": 0, "transaction_count": 0})
+        for counter in ("gross_cents", "fee_cents", "net_cents", "transaction_count"):
+            total[counter] += row[counter]
+    return jsonify({
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat() if until else None,
+        "bucket": bucket,
+        "group_by": group_by,
+        "covered_until": covered_until.isoformat() if covered_until else None,
+        "totals": [totals[currency] for currency in sorted(totals)],
+        "rows": rows
+    }), 200
+
+# Bulk payouts: compute here, send with `flask run-payouts` (see src/services/payouts.py)
+@admin_bp.route("/payouts/compute", methods=["POST"])
+@admin_required
+def compute_all_payouts():
+    data = request.get_json(silent=True) or {}
+    run_id, created = payouts.compute_payouts(data.get("minimum_cents"))
+    return jsonify({"run_id": run_id, "payouts_created": created}), 201
+
 @admin_bp.route("/payouts/process/<int:payout_id>", methods=["POST"])
 @admin_required
 def process_payout(payout_id):
     payout = Payout.query.get_or_404(payout_id)
     if payout.status != "pending":
         return jsonify({"error": "Payout not in pending state"}), 400
+    if not payout.idempotency_key:
+        return jsonify({"error": "Payout predates the payout engine; run `flask upgrade-schema` to adopt it"}), 400
 
-    # TODO: Integrate with Stripe Connect to create a Transfer to the coach's connected account
-    # This is a simplified placeholder for MVP
-    payout.status = "processing" # Or "completed" if direct
-    payout.processed_at = datetime.utcnow()
-    # payout.stripe_transfer_id = "simulated_transfer_id_" + str(payout.id) # Simulate Stripe transfer ID
-    db.session.commit()
-    return jsonify({"message": f"Payout {payout_id} marked as processing/completed", "payout_status": payout.status}), 200
+    totals = payouts.execute_payouts(payout_ids=[payout_id], concurrency=1, log=lambda message: None)
+    db.session.refresh(payout)
+    if totals["skipped"]:
+        return jsonify({"error": "Coach has no connected Stripe account", "payout_status": payout.status}), 409
+    return jsonify({"message": f"Payout {payout_id} {payout.status}", "payout_status": payout.status,
+                    "stripe_transfer_id": payout.stripe_transfer_id, "failure_reason": payout.failure_reason}), 200
 
 # Endpoint to configure platform fee (example)
 @admin_bp.route("/config/platform_fee", methods=["POST"])
@@ -144,3 +344,19 @@ def set_platform_fee():
     current_app.config["PLATFORM_FEE_PERCENTAGE"] = float(fee_percentage)
     return jsonify({"message": f"Platform fee set to {fee_percentage}%"}), 200
 
+
+@admin_bp.route("/cache/entitlements", methods=["GET"])
+@admin_required
+def entitlement_cache_stats():
+    return jsonify(entitlements.cache_stats()), 200
+
+@admin_bp.route("/webhooks/outbox", methods=["GET"])
+@admin_required
+def webhook_outbox_stats():
+    outbox = get_outbox()
+    return jsonify({"counts": outbox.counts(), "oldest_pending_seconds": outbox.oldest_pending_age()}), 200
+
+@admin_bp.route("/metrics", methods=["GET"])
+@admin_required
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -1,22 +1,16 @@
-from flask import Blueprint, request, jsonify
+from types import SimpleNamespace
+from flask import Blueprint, request, jsonify, g, abort
 from src.models.user import User, db
 from src.models.content import Content
-from src.models.monetization import Subscription, PayPerViewPurchase # Import monetization models
-from datetime import datetime
-import os
-from werkzeug.utils import secure_filename
-
-# Configure a directory for uploads
-# In a production environment, this should be an absolute path and ideally cloud storage.
-# For simplicity in the template, it defaults to a relative path.
-# Ensure this path is secure and appropriate for your deployment.
-UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads") 
-if not os.path.exists(UPLOAD_FOLDER):
-    try:
-        os.makedirs(UPLOAD_FOLDER)
-    except OSError as e:
-        # Handle error if directory creation fails, e.g., log it or raise an exception
-        print(f"Error creating upload folder: {e}")
+from src.services.entitlements import check_access, check_access_batch
+from src.services.storage import get_storage
+from src.services.auth import auth_required
+from src.services.db_routing import read_replica, primary
+from src.services.response_cache import get_response_cache, coach_content_key, invalidate_coach_content
+from src.services import search, feed
+from src.services.pagination import encode_cursor, decode_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from src.services.media import signed_media_url, read_media_token, send_media, variant_urls, signed_url_epoch
+from src.services.conditional import make_etag, conditional_response
 
 ALLOWED_EXTENSIONS = {"txt", "pdf", "png", "jpg", "jpeg", "gif", "mp4", "mov", "avi"}
 
@@ -26,49 +20,15 @@ def allowed_file(filename):
     return "." in filename and \
            filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Helper function to check access (can be expanded and moved to a utils module)
-def has_access_to_content(fan_id, content_id):
-    content = Content.query.get(content_id)
-    if not content:
-        return False, "Content not found"
-
-    if content.access_setting == "free":
-        return True, "Content is free"
-
-    if not fan_id:
-        return False, "User not identified for paid content"
-        
-    fan = User.query.get(fan_id)
-    if not fan:
-        return False, "Fan not found"
-
-    # Check for active subscription to the coach who owns the content
-    active_subscription = Subscription.query.filter_by(
-        fan_id=fan_id,
-        coach_id=content.coach_id,
-        is_active=True
-    ).filter(Subscription.end_date > datetime.utcnow()).first()
-
-    if active_subscription:
-        return True, "Active subscription to coach"
-
-    # Check for pay-per-view purchase
-    purchase = PayPerViewPurchase.query.filter_by(fan_id=fan_id, content_id=content_id).first()
-    if purchase:
-        return True, "Content purchased (pay-per-view)"
-
-    return False, "No active subscription or purchase"
+def _signed_urls_epoch(accessible_contents):
+    # Lists sign web_url for accessible items; such bodies must be rebuilt before the URLs expire
+    return signed_url_epoch() if any(item.web_key for item in accessible_contents) else None
 
 @content_bp.route("/upload", methods=["POST"])
+@auth_required("coach")
 def upload_content():
-    # TODO: Implement proper authentication to get coach_id from session/token
-    coach_id = request.form.get("coach_id") 
-    if not coach_id:
-        return jsonify({"error": "Coach ID is required"}), 400
-    
-    coach = User.query.get(coach_id)
-    if not coach or coach.role != "coach":
-        return jsonify({"error": "Invalid coach ID or user is not a coach"}), 403
+    # Identity and role come from the verified token, no user lookup needed
+    coach_id = g.current_user.id
 
     title = request.form.get("title")
     description = request.form.get("description")
@@ -101,36 +61,133 @@ def upload_content():
         if file.filename == "":
             return jsonify({"error": "No selected file"}), 400
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
+            # From the raw name: secure_filename drops non-ASCII stems ("видео.png" -> "png")
+            extension = file.filename.rsplit(".", 1)[1].lower()
             try:
-                file.save(file_path)
-                new_content.file_url = file_path 
+                # Stored by content hash; file_url holds the storage key, not a server path
+                new_content.file_url = get_storage().save(file, extension)
             except Exception as e:
                  return jsonify({"error": f"Could not save file: {e}"}), 500
+            new_content.processing_status = "pending" # Picked up by `flask process-media`
         else:
             return jsonify({"error": "File type not allowed"}), 400
     else:
         return jsonify({"error": "Invalid content type"}), 400
 
     db.session.add(new_content)
+    search.index_content(new_content)
     db.session.commit()
+    invalidate_coach_content(coach_id)
 
     return jsonify({"message": "Content uploaded successfully", "content_id": new_content.id}), 201
 
+@content_bp.route("/search", methods=["GET"])
+@read_replica
+def search_content():
+    # ?q= (all terms must match), optional content_type/access_setting/coach_id, ?limit=&cursor=
+    query_text = request.args.get("q", "").strip()
+    if not query_text:
+        return jsonify({"error": "Query parameter q is required"}), 400
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+    after = None
+    if request.args.get("cursor"):
+        try:
+            after = decode_cursor(request.args["cursor"], sort_is_datetime=False)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        # Scores are integers; the single-term path does arithmetic on the cursor's
+        if isinstance(after[0], bool) or not isinstance(after[0], int):
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    results, next_after = search.search(query_text,
+                                        content_type=request.args.get("content_type"),
+                                        access_setting=request.args.get("access_setting"),
+                                        coach_id=request.args.get("coach_id", type=int),
+                                        after=after, limit=limit)
+    items = []
+    for content_item, score in results:
+        item = {
+            "id": content_item.id,
+            "coach_id": content_item.coach_id,
+            "title": content_item.title,
+            "description": content_item.description,
+            "content_type": content_item.content_type,
+            "access_setting": content_item.access_setting,
+            "created_at": content_item.created_at.isoformat(),
+            "score": score
+        }
+        item.update(variant_urls(content_item, False))
+        items.append(item)
+    response = jsonify(items)
+    if next_after:
+        response.headers["X-Next-Cursor"] = encode_cursor(*next_after)
+    return response, 200
+
+@content_bp.route("/feed/<int:fan_id>", methods=["GET"])
+@auth_required("fan")
+@read_replica
+def get_feed(fan_id):
+    # Newest content from every coach the fan subscribes to; ?limit=&cursor= as elsewhere
+    if fan_id != g.current_user.id:
+        return jsonify({"error": "fan_id does not match the authenticated user"}), 403
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+    after = None
+    if request.args.get("cursor"):
+        try:
+            after = decode_cursor(request.args["cursor"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    page, next_after = feed.feed_page(fan_id, after=after, limit=limit)
+    def build():
+        items = []
+        for content_item, (accessible, reason) in page:
+            item = {
+                "id": content_item.id,
+                "coach_id": content_item.coach_id,
+                "title": content_item.title,
+                "description": content_item.description,
+                "content_type": content_item.content_type,
+                "access_setting": content_item.access_setting,
+                "created_at": content_item.created_at.isoformat(),
+                "accessible": accessible,
+                "access_reason": reason
+            }
+            item.update(variant_urls(content_item, accessible))
+            items.append(item)
+        response = jsonify(items)
+        if next_after:
+            response.headers["X-Next-Cursor"] = encode_cursor(*next_after)
+        return response
+    etag = make_etag(fan_id, next_after, [(item.id, item.updated_at, access) for item, access in page],
+                     _signed_urls_epoch(item for item, (accessible, _) in page if accessible))
+    return conditional_response(build, etag, private=True, vary=("Authorization",))
+
 @content_bp.route("/<int:content_id>", methods=["GET"])
+@read_replica
 def get_content(content_id):
     # TODO: Implement proper authentication to get fan_id from session/token
     # For now, expecting fan_id as a query parameter for testing access control
     fan_id = request.args.get("fan_id", type=int) 
 
-    content = Content.query.get_or_404(content_id)
+    content = Content.query.filter_by(id=content_id, deleted_at=None).first_or_404()
 
-    can_access, reason = has_access_to_content(fan_id, content_id)
+    can_access, reason = check_access(fan_id, content)
 
     if not can_access:
         return jsonify({"error": "Access denied", "reason": reason}), 403
 
+    # Only signed media URLs can go stale without the row changing
+    epoch = signed_url_epoch() if content.file_url else None
+    last_modified = max(filter(None, [content.updated_at, epoch]), default=None)
+    return conditional_response(lambda: jsonify(_content_detail(content)), make_etag(content.id, content.updated_at, epoch),
+                                last_modified, private=content.access_setting != "free")
+
+def _content_detail(content):
     content_data = {
         "id": content.id,
         "coach_id": content.coach_id,
@@ -144,27 +201,105 @@ def get_content(content_id):
     if content.content_type == "text":
         content_data["text_content"] = content.text_content
     elif content.file_url:
-        content_data["file_url"] = content.file_url # In a real app, this might be a signed URL
-        
-    return jsonify(content_data), 200
+        content_data["file_url"] = signed_media_url(content) # Short-lived, see get_content_media
+        content_data.update(variant_urls(content, accessible=True))
+        content_data.update({
+            "processing_status": content.processing_status,
+            "file_size": content.file_size,
+            "width": content.width,
+            "height": content.height,
+            "duration_seconds": content.duration_seconds
+        })
+    return content_data
+
+@content_bp.route("/<int:content_id>/media", methods=["GET"])
+@read_replica
+def get_content_media(content_id):
+    # A signed token from get_content proves access and names the file: no DB queries.
+    # Without one, fall back to a single entitlement check with fan_id.
+    # ?variant=thumbnail of free content is a public preview; everything else is gated.
+    token = request.args.get("token")
+    variant = request.args.get("variant", "original")
+    if variant not in ("original", "thumbnail", "web"):
+        return jsonify({"error": "Invalid variant. Must be 'original', 'thumbnail' or 'web'."}), 400
+    public = False
+    if token:
+        media = read_media_token(token, content_id)
+        if media is None:
+            return jsonify({"error": "Invalid or expired media token"}), 403
+        file_key, updated_at = media
+    else:
+        content = Content.query.filter_by(id=content_id, deleted_at=None).first_or_404()
+        public = variant == "thumbnail" and content.access_setting == "free"
+        if not public:
+            fan_id = request.args.get("fan_id", type=int)
+            can_access, reason = check_access(fan_id, content)
+            if not can_access:
+                return jsonify({"error": "Access denied", "reason": reason}), 403
+        file_key = {"original": content.file_url, "thumbnail": content.thumbnail_key, "web": content.web_key}[variant]
+        if not file_key:
+            return jsonify({"error": "Media not available"}), 404
+        updated_at = content.updated_at
+
+    storage = get_storage()
+    if not storage.exists(file_key):
+        return jsonify({"error": "Media file not found"}), 404
+    response = send_media(storage, content_id, file_key, updated_at, public=public)
+    if response is None:
+        return jsonify({"error": "Storage backend cannot serve media directly"}), 501
+    return response
+
+# Content columns a coach listing needs: the item fields, access and media variants
+LISTING_COLUMNS = ("id", "coach_id", "title", "content_type", "access_setting", "description",
+                   "created_at", "updated_at", "file_url", "thumbnail_key", "web_key")
+
+def _coach_listing(coach_id):
+    # Cached (see response_cache.py), so read the primary: a lagging replica must not seed it
+    with primary():
+        coach = User.query.get(coach_id)
+        if coach is None:
+            return None
+        rows = []
+        if coach.role == "coach":
+            rows = db.session.query(*[getattr(Content, column) for column in LISTING_COLUMNS]).filter(
+                Content.coach_id == coach_id, Content.deleted_at.is_(None)).order_by(Content.created_at.desc()).all()
+    return {"role": coach.role, "items": [dict(row._mapping) for row in rows]}
 
 @content_bp.route("/coach/<int:coach_id>", methods=["GET"])
+@read_replica
 def get_coach_content(coach_id):
-    coach = User.query.get_or_404(coach_id)
-    if coach.role != "coach":
+    listing = get_response_cache().get_or_load(coach_content_key(coach_id), lambda: _coach_listing(coach_id))
+    if listing is None:
+        abort(404)
+    if listing["role"] != "coach":
          return jsonify({"error": "User is not a coach"}), 403
 
-    # TODO: Potentially filter content list based on fan's access if fan_id is provided
-    contents = Content.query.filter_by(coach_id=coach_id).order_by(Content.created_at.desc()).all()
-    content_list = []
-    for content_item in contents:
-        content_list.append({
-            "id": content_item.id,
-            "title": content_item.title,
-            "content_type": content_item.content_type,
-            "access_setting": content_item.access_setting,
-            "description": content_item.description, # Adding description to the list view
-            "created_at": content_item.created_at.isoformat()
-        })
-    return jsonify(content_list), 200
+    # Optional fan_id marks each item as accessible or locked for that fan
+    fan_id = request.args.get("fan_id", type=int)
+
+    # Plain records with Content's attribute names: instantiating mapped objects would cost more than the cache saves
+    contents = [SimpleNamespace(**row) for row in listing["items"]]
+    access = check_access_batch(fan_id, contents) if fan_id else None
+    def accessible(content_item):
+        return access[content_item.id][0] if access is not None else content_item.access_setting == "free"
 
+    def build():
+        content_list = []
+        for content_item in contents:
+            item = {
+                "id": content_item.id,
+                "title": content_item.title,
+                "content_type": content_item.content_type,
+                "access_setting": content_item.access_setting,
+                "description": content_item.description, # Adding description to the list view
+                "created_at": content_item.created_at.isoformat()
+            }
+            if access is not None:
+                item["accessible"] = accessible(content_item)
+            item.update(variant_urls(content_item, accessible(content_item)))
+            content_list.append(item)
+        return jsonify(content_list)
+    # Validated by each item's version and (for a fan) its entitlement; ?fan_id= responses are per fan
+    etag = make_etag(coach_id, fan_id, [(item.id, item.updated_at, accessible(item)) for item in contents],
+                     _signed_urls_epoch(item for item in contents if accessible(item)))
+    return conditional_response(build, etag, private=fan_id is not None)
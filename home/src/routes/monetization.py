@@ -1,10 +1,15 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, g
 from src.models.user import User, db
 from src.models.content import Content
 from src.models.monetization import Subscription, PayPerViewPurchase
 from src.models.finance import Transaction # Import Transaction model
+from src.services import entitlements, earnings, feed
+from src.services.entitlements import check_access, check_access_batch
+from src.services.webhook_outbox import get_outbox
+from src.services.payments import get_stripe, retrieve_payment_intent, CircuitOpenError
+from src.services.auth import auth_required
 from datetime import datetime, timedelta
-import stripe
+from sqlalchemy.exc import IntegrityError
 
 monetization_bp = Blueprint("monetization", __name__)
 
@@ -16,7 +21,7 @@ def calculate_order_amount(item_id, item_type):
     elif item_type == "content_ppv":
         # In a real app, fetch price from DB based on content_id
         # For now, using a fixed price for PPV content for calculation
-        content = Content.query.get(item_id)
+        content = Content.query.filter_by(id=item_id, deleted_at=None).first()
         if content: # Assuming a price attribute or a fixed price for demo
             return 500 # 5.00 USD in cents
     return 0
@@ -38,7 +43,7 @@ def create_payment():
         if amount == 0:
             return jsonify(error="Invalid item_type or item_id for amount calculation"), 400
 
-        intent = stripe.PaymentIntent.create(
+        intent = get_stripe().PaymentIntent.create(
             amount=amount,
             currency=currency,
             automatic_payment_methods={"enabled": True},
@@ -55,9 +60,12 @@ def create_payment():
         return jsonify(error=str(e)), 403
 
 @monetization_bp.route("/subscribe", methods=["POST"])
+@auth_required("fan")
 def subscribe_to_coach():
     data = request.get_json()
-    fan_id = data.get("fan_id") 
+    fan_id = g.current_user.id
+    if data.get("fan_id") not in (None, fan_id):
+        return jsonify({"error": "fan_id does not match the authenticated user"}), 403
     coach_id = data.get("coach_id")
     subscription_type = data.get("subscription_type")
     payment_intent_id = data.get("payment_intent_id") # Client should send this after successful payment confirmation
@@ -65,23 +73,29 @@ def subscribe_to_coach():
     if not all([fan_id, coach_id, subscription_type, payment_intent_id]):
         return jsonify({"error": "Fan ID, Coach ID, subscription type, and payment_intent_id are required"}), 400
 
-    fan = User.query.get(fan_id)
     coach = User.query.get(coach_id)
-    if not fan or fan.role != "fan": return jsonify({"error": "Invalid fan"}), 403
     if not coach or coach.role != "coach": return jsonify({"error": "Invalid coach"}), 403
 
-    # Verify payment intent status with Stripe (important for security)
+    # Verify payment intent status (ledger first, then Stripe) - important for security
     try:
-        payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        payment_intent = retrieve_payment_intent(payment_intent_id, fan_id, f"subscription_{subscription_type}", coach_id)
+        if payment_intent is None:
+            return jsonify({"error": "Payment intent does not belong to this subscription"}), 403
         if payment_intent.status != "succeeded":
             return jsonify({"error": "Payment not successful or still processing"}), 402
-        # Further check if amount and currency match expected values for the subscription
-    except stripe.error.StripeError as e:
+        # The ledger does not record the plan, so check the amount covers it
+        if payment_intent.amount < calculate_order_amount(coach_id, f"subscription_{subscription_type}"):
+            return jsonify({"error": "Payment amount does not match the subscription"}), 402
+    except CircuitOpenError:
+        return jsonify({"error": "Payment verification temporarily unavailable, please retry"}), 503
+    except get_stripe().error.StripeError as e:
         return jsonify({"error": f"Stripe error: {str(e)}"}), 500
 
     existing_subscription = Subscription.query.filter_by(fan_id=fan_id, coach_id=coach_id, is_active=True).first()
     if existing_subscription and existing_subscription.end_date > datetime.utcnow():
         return jsonify({"message": "Already subscribed and active"}), 200
+    if Subscription.query.filter_by(payment_intent_id=payment_intent_id).first():
+        return jsonify({"error": "Payment intent already used"}), 409
     if existing_subscription:
         existing_subscription.is_active = False # Deactivate old one before creating new
 
@@ -94,50 +108,69 @@ def subscribe_to_coach():
     
     new_subscription = Subscription(
         fan_id=fan_id, coach_id=coach_id, subscription_type=subscription_type,
-        end_date=end_date, is_active=True
+        end_date=end_date, is_active=True, payment_intent_id=payment_intent_id
     )
     db.session.add(new_subscription)
     # Transaction record is now handled by webhook
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # A concurrent request spent the intent first (uq_subscription_payment_intent); re-raise anything else
+        if Subscription.query.filter_by(payment_intent_id=payment_intent_id).first() is None:
+            raise
+        return jsonify({"error": "Payment intent already used"}), 409
+    entitlements.invalidate_subscription(fan_id, coach_id)
+    feed.invalidate_fan(fan_id)
     return jsonify({"message": "Subscription successful", "subscription_id": new_subscription.id}), 201
 
 @monetization_bp.route("/purchase_content", methods=["POST"])
+@auth_required("fan")
 def purchase_content_item():
     data = request.get_json()
-    fan_id = data.get("fan_id")
+    fan_id = g.current_user.id
+    if data.get("fan_id") not in (None, fan_id):
+        return jsonify({"error": "fan_id does not match the authenticated user"}), 403
     content_id = data.get("content_id")
     payment_intent_id = data.get("payment_intent_id")
 
     if not all([fan_id, content_id, payment_intent_id]):
         return jsonify({"error": "Fan ID, Content ID, and payment_intent_id are required"}), 400
 
-    fan = User.query.get(fan_id)
-    content = Content.query.get(content_id)
-    if not fan or fan.role != "fan": return jsonify({"error": "Invalid fan"}), 403
+    content = Content.query.filter_by(id=content_id, deleted_at=None).first()
     if not content: return jsonify({"error": "Content not found"}), 404
 
     if content.access_setting != "paywall":
         return jsonify({"error": "Content not for individual purchase or access already granted"}), 400
 
     try:
-        payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        payment_intent = retrieve_payment_intent(payment_intent_id, fan_id, "content_ppv", content_id)
+        if payment_intent is None:
+            return jsonify({"error": "Payment intent does not belong to this purchase"}), 403
         if payment_intent.status != "succeeded":
             return jsonify({"error": "Payment not successful or still processing"}), 402
-    except stripe.error.StripeError as e:
+    except CircuitOpenError:
+        return jsonify({"error": "Payment verification temporarily unavailable, please retry"}), 503
+    except get_stripe().error.StripeError as e:
         return jsonify({"error": f"Stripe error: {str(e)}"}), 500
 
-    existing_purchase = PayPerViewPurchase.query.filter_by(fan_id=fan_id, content_id=content_id).first()
-    if existing_purchase:
-        return jsonify({"message": "Content already purchased"}), 200
-
     amount_for_item = payment_intent.amount / 100.0 # Amount from successful PI
 
     new_purchase = PayPerViewPurchase(
-        fan_id=fan_id, content_id=content_id, amount_paid=amount_for_item
+        fan_id=fan_id, content_id=content_id, amount_paid=amount_for_item, payment_intent_id=payment_intent_id
     )
     db.session.add(new_purchase)
     # Transaction record is now handled by webhook
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # Only a uq_ppv_fan_content violation means the fan already owns this item. Drivers
+        # word constraint errors differently, so look the purchase up instead of parsing them.
+        if PayPerViewPurchase.query.filter_by(fan_id=fan_id, content_id=content_id).first() is None:
+            raise
+        return jsonify({"message": "Content already purchased"}), 200
+    entitlements.invalidate_purchase(fan_id, content_id)
     return jsonify({"message": "Content purchased successfully", "purchase_id": new_purchase.id}), 201
 
 @monetization_bp.route("/stripe_webhook", methods=["POST"])
@@ -146,92 +179,65 @@ def stripe_webhook():
     sig_header = request.headers.get("Stripe-Signature")
     endpoint_secret = current_app.config["STRIPE_WEBHOOK_SECRET"]
     event = None
+    stripe = get_stripe()
 
     try:
         event = stripe.Webhook.construct_event(payload, sig_header, endpoint_secret)
     except ValueError as e: return jsonify(error=str(e)), 400
     except stripe.error.SignatureVerificationError as e: return jsonify(error=str(e)), 400
 
-    if event.type == "payment_intent.succeeded":
-        payment_intent = event.data.object
-        metadata = payment_intent.metadata
-        item_id = metadata.get("item_id")
-        item_type = metadata.get("item_type")
-        fan_id = metadata.get("user_id") # This is the fan's ID
-        
-        gross_amount = payment_intent.amount / 100.0 # Convert from cents
-        platform_fee_percentage = current_app.config.get("PLATFORM_FEE_PERCENTAGE", 15.0) / 100.0
-        platform_fee_amount = gross_amount * platform_fee_percentage
-        net_amount_for_coach = gross_amount - platform_fee_amount
-
-        coach_id_for_transaction = None
-        content_id_for_transaction = None
-        subscription_id_for_transaction = None
-        purchase_id_for_transaction = None
-        transaction_type_str = "unknown_payment"
-
-        if item_type in ["subscription_monthly", "subscription_yearly"]:
-            coach_id_for_transaction = item_id # item_id is coach_id for subscriptions
-            transaction_type_str = "subscription_payment"
-            # Find the subscription to link it, if needed, though this webhook is the source of truth for payment
-            # sub = Subscription.query.filter_by(fan_id=fan_id, coach_id=coach_id_for_transaction, is_active=True).order_by(Subscription.start_date.desc()).first()
-            # if sub: subscription_id_for_transaction = sub.id
-
-        elif item_type == "content_ppv":
-            content_id_for_transaction = item_id # item_id is content_id for PPV
-            content_item = Content.query.get(content_id_for_transaction)
-            if content_item:
-                coach_id_for_transaction = content_item.coach_id
-            transaction_type_str = "ppv_purchase"
-            # Find the purchase to link it
-            # ppv = PayPerViewPurchase.query.filter_by(fan_id=fan_id, content_id=content_id_for_transaction).first()
-            # if ppv: purchase_id_for_transaction = ppv.id
-
-        # Create Transaction record
-        transaction = Transaction(
-            transaction_type=transaction_type_str,
-            user_id=fan_id,
-            coach_id=coach_id_for_transaction,
-            content_id=content_id_for_transaction,
-            # subscription_id=subscription_id_for_transaction, # Link if found
-            # purchase_id=purchase_id_for_transaction, # Link if found
-            amount=gross_amount,
-            platform_fee=platform_fee_amount,
-            net_amount=net_amount_for_coach,
-            currency=payment_intent.currency,
-            stripe_payment_intent_id=payment_intent.id,
-            status="succeeded"
-        )
-        db.session.add(transaction)
-        db.session.commit()
-
-    elif event.type == "payment_method.attached":
-        pass # payment_method = event.data.object
-    else:
-        print(f"Unhandled event type {event.type}")
+    # Record the verified event and acknowledge immediately; src/services/webhook_worker.py
+    # turns it into Transaction rows. Redelivered events are deduplicated by event id.
+    try:
+        fee_percentage = current_app.config.get("PLATFORM_FEE_PERCENTAGE", 15.0)
+        recorded = get_outbox().append(event.id, event.type, payload.decode("utf-8"), fee_percentage)
+    except Exception as e:
+        current_app.logger.error("Could not record webhook event %s: %s", event.id, e)
+        return jsonify(error="Could not record event"), 500
 
-    return jsonify(success=True), 200
+    return jsonify(success=True, duplicate=not recorded), 200
 
-@monetization_bp.route("/check_access/<int:fan_id>/<int:content_id>", methods=["GET"])
-def check_content_access(fan_id, content_id):
-    fan = User.query.get_or_404(fan_id)
-    content = Content.query.get_or_404(content_id)
+MAX_BATCH_ACCESS_CHECKS = 1000
 
-    if content.access_setting == "free":
-        return jsonify({"access": True, "reason": "Content is free"}), 200
+@monetization_bp.route("/check_access/<int:fan_id>", methods=["POST"])
+def check_content_access_batch(fan_id):
+    data = request.get_json(silent=True) or {}
+    content_ids = data.get("content_ids")
+    if not isinstance(content_ids, list) or not content_ids:
+        return jsonify({"error": "content_ids must be a non-empty list"}), 400
+    if len(content_ids) > MAX_BATCH_ACCESS_CHECKS:
+        return jsonify({"error": f"At most {MAX_BATCH_ACCESS_CHECKS} content_ids per request"}), 400
+    try:
+        content_ids = {int(content_id) for content_id in content_ids}
+    except (TypeError, ValueError):
+        return jsonify({"error": "content_ids must be integers"}), 400
 
-    active_subscription = Subscription.query.filter_by(
-        fan_id=fan_id,
-        coach_id=content.coach_id,
-        is_active=True
-    ).filter(Subscription.end_date > datetime.utcnow()).first()
+    User.query.get_or_404(fan_id)
+    contents = Content.query.filter(Content.id.in_(content_ids), Content.deleted_at.is_(None)).all()
+    access = check_access_batch(fan_id, contents)
 
-    if active_subscription:
-        return jsonify({"access": True, "reason": "Active subscription to coach"}), 200
+    results = {}
+    for content_id in content_ids:
+        can_access, reason = access.get(content_id, (False, "Content not found"))
+        results[str(content_id)] = {"access": can_access, "reason": reason}
+    return jsonify({"fan_id": fan_id, "results": results}), 200
 
-    purchase = PayPerViewPurchase.query.filter_by(fan_id=fan_id, content_id=content_id).first()
-    if purchase:
-        return jsonify({"access": True, "reason": "Content purchased (pay-per-view)"}), 200
+@monetization_bp.route("/check_access/<int:fan_id>/<int:content_id>", methods=["GET"])
+def check_content_access(fan_id, content_id):
+    # An unknown fan is a 404 even for free content; check_access reuses the loaded User
+    User.query.get_or_404(fan_id)
+    content = Content.query.filter_by(id=content_id, deleted_at=None).first_or_404()
 
-    return jsonify({"access": False, "reason": "No active subscription or purchase"}), 403
+    can_access, reason = check_access(fan_id, content)
+    return jsonify({"access": can_access, "reason": reason}), 200 if can_access else 403
 
+@monetization_bp.route("/earnings", methods=["GET"])
+@auth_required("coach")
+def get_my_earnings():
+    # Amounts are integer cents, read from the daily rollups
+    try:
+        result = earnings.report(g.current_user.id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result["coach_id"] = g.current_user.id
+    return jsonify(result), 200
@@ -1,22 +1,38 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, abort
 from src.models.user import User, db
+from src.services.db_routing import read_replica, primary
+from src.services.response_cache import get_response_cache, profile_key, invalidate_profile
+from src.services.conditional import make_etag, conditional_response
 # We might need to add authentication checks later (e.g., using Flask-Login or JWT)
 
 profile_bp = Blueprint("profile", __name__)
 
-@profile_bp.route("/<int:user_id>", methods=["GET"])
-def get_profile(user_id):
-    user = User.query.get_or_404(user_id)
+def _profile(user_id):
+    # Cached (see response_cache.py), so read the primary: a lagging replica must not seed it
+    with primary():
+        user = User.query.get(user_id)
+    if user is None:
+        return None
     # For MVP, we return basic info. This can be expanded.
-    profile_data = {
+    return {
         "id": user.id,
         "email": user.email, # May want to hide this depending on privacy settings
         "username": user.username,
         "role": user.role,
         "profile_picture_url": user.profile_picture_url,
-        "bio": user.bio
+        "bio": user.bio,
+        "version": user.version
     }
-    return jsonify(profile_data), 200
+
+@profile_bp.route("/<int:user_id>", methods=["GET"])
+@read_replica
+def get_profile(user_id):
+    profile_data = get_response_cache().get_or_load(profile_key(user_id), lambda: _profile(user_id))
+    if profile_data is None:
+        abort(404)
+    # User.version changes on every update, so polling clients get a 304 until then
+    return conditional_response(lambda: jsonify({key: value for key, value in profile_data.items() if key != "version"}),
+                                make_etag(user_id, profile_data["version"]))
 
 @profile_bp.route("/<int:user_id>", methods=["PUT"])
 def update_profile(user_id):
@@ -40,5 +56,6 @@ def update_profile(user_id):
         user.bio = data["bio"]
     
     db.session.commit()
+    invalidate_profile(user_id)
     return jsonify({"message": "Profile updated successfully"}), 200
 
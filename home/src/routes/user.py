@@ -1,5 +1,7 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, g
 from src.models.user import User, db
+from src.services.auth import (auth_required, issue_tokens, read_token, revoke, TokenError,
+                               get_password_verifier, LoginBusy)
 
 user_bp = Blueprint("user", __name__)
 
@@ -27,10 +29,39 @@ def login():
 
     user = User.query.filter_by(email=data["email"]).first()
 
-    if not user or not user.check_password(data["password"]):
+    try:
+        valid = user is not None and get_password_verifier().verify(user, data["password"])
+    except LoginBusy:
+        return jsonify({"error": "Too many concurrent logins, please retry"}), 503, {"Retry-After": "1"}
+    if not valid:
         return jsonify({"error": "Invalid email or password"}), 401
-    
-    # In a real application, you would generate and return a JWT token here
-    # For MVP, we'll just return a success message
-    return jsonify({"message": "Login successful", "user_id": user.id, "role": user.role}), 200
+
+    # Send the access token as "Authorization: Bearer <token>"
+    return jsonify({"message": "Login successful", "user_id": user.id, "role": user.role,
+                    **issue_tokens(user.id, user.role)}), 200
+
+@user_bp.route("/token/refresh", methods=["POST"])
+def refresh_token():
+    data = request.get_json(silent=True) or {}
+    if not data.get("refresh_token"):
+        return jsonify({"error": "refresh_token is required"}), 400
+    try:
+        token_data = read_token(data["refresh_token"], "refresh")
+    except TokenError as e:
+        return jsonify({"error": str(e)}), 401
+    # Refresh tokens are single use: rotate on every refresh
+    revoke(token_data)
+    return jsonify(issue_tokens(token_data["uid"], token_data["role"])), 200
+
+@user_bp.route("/logout", methods=["POST"])
+@auth_required()
+def logout():
+    revoke(g.token_data)
+    data = request.get_json(silent=True) or {}
+    if data.get("refresh_token"):
+        try:
+            revoke(read_token(data["refresh_token"], "refresh"))
+        except TokenError:
+            pass
+    return jsonify({"message": "Logged out"}), 200
 
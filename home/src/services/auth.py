@@ -0,0 +1,152 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, request, jsonify, g
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from src.models.user import db, RevokedToken
+
+# Signed, expiring tokens carry the user id and role, so authenticated requests are
+# verified in memory. Only logout/refresh and a periodic revocation-list reload touch the DB.
+
+ACCESS_TOKEN_TTL = 3600 # seconds
+REFRESH_TOKEN_TTL = 14 * 24 * 3600
+REVOCATION_RELOAD_SECONDS = 30
+
+class CurrentUser:
+    def __init__(self, user_id, role, jti):
+        self.id = user_id
+        self.role = role
+        self.jti = jti
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"], salt="auth-token")
+
+def _ttl(token_type):
+    if token_type == "refresh":
+        return current_app.config.get("REFRESH_TOKEN_TTL", REFRESH_TOKEN_TTL)
+    return current_app.config.get("ACCESS_TOKEN_TTL", ACCESS_TOKEN_TTL)
+
+def issue_token(user_id, role, token_type="access"):
+    return _serializer().dumps({"uid": user_id, "role": role, "typ": token_type, "jti": uuid.uuid4().hex})
+
+def issue_tokens(user_id, role):
+    return {
+        "access_token": issue_token(user_id, role),
+        "refresh_token": issue_token(user_id, role, "refresh"),
+        "token_type": "Bearer",
+        "expires_in": _ttl("access")
+    }
+
+class TokenError(Exception):
+    pass
+
+def read_token(token, token_type="access"):
+    """Verify signature, expiry, type and revocation; returns the token payload."""
+    try:
+        data, issued_at = _serializer().loads(token, max_age=_ttl(token_type), return_timestamp=True)
+    except SignatureExpired:
+        raise TokenError("Token expired")
+    except BadSignature:
+        raise TokenError("Invalid token")
+    if data.get("typ") != token_type:
+        raise TokenError("Wrong token type")
+    if revocation_list.is_revoked(data["jti"]):
+        raise TokenError("Token revoked")
+    data["exp"] = issued_at.replace(tzinfo=None) + timedelta(seconds=_ttl(token_type))
+    return data
+
+def revoke(data):
+    """Revoke a verified token payload everywhere (other workers pick it up on their next reload)."""
+    db.session.merge(RevokedToken(jti=data["jti"], expires_at=data["exp"]))
+    db.session.commit()
+    revocation_list.add(data["jti"])
+
+class RevocationList:
+    """In-memory copy of unexpired RevokedToken ids, reloaded at most every few seconds."""
+
+    def __init__(self, reload_seconds=REVOCATION_RELOAD_SECONDS):
+        self.reload_seconds = reload_seconds
+        self._jtis = set()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def add(self, jti):
+        with self._lock:
+            self._jtis.add(jti)
+
+    def is_revoked(self, jti):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.reload_seconds:
+            self.reload()
+        return jti in self._jtis
+
+    def reload(self):
+        now = datetime.utcnow()
+        jtis = {jti for (jti,) in db.session.query(RevokedToken.jti).filter(RevokedToken.expires_at > now)}
+        with self._lock:
+            self._jtis = jtis
+            self._loaded_at = time.monotonic()
+
+revocation_list = RevocationList()
+
+def bearer_token():
+    header = request.headers.get("Authorization", "")
+    if header.startswith("Bearer "):
+        return header[len("Bearer "):].strip()
+    return None
+
+def auth_required(*roles):
+    """Require a valid access token (optionally with one of `roles`); sets g.current_user."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            token = bearer_token()
+            if not token:
+                return jsonify({"error": "Authentication required"}), 401
+            try:
+                data = read_token(token)
+            except TokenError as e:
+                return jsonify({"error": str(e)}), 401
+            if roles and data["role"] not in roles:
+                return jsonify({"error": f"Requires role: {', '.join(roles)}"}), 403
+            g.current_user = CurrentUser(data["uid"], data["role"], data["jti"])
+            g.token_data = data
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+# Password hashing is deliberately slow. Running it on a small bounded pool keeps a burst
+# of logins from occupying every request thread; excess attempts are rejected immediately.
+class LoginBusy(Exception):
+    pass
+
+class PasswordVerifier:
+    def __init__(self, workers=4, queue_size=16, timeout=10.0):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def verify(self, user, password):
+        if not self._slots.acquire(blocking=False):
+            raise LoginBusy()
+        try:
+            future = self._executor.submit(user.check_password, password)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise LoginBusy()
+
+def get_password_verifier(app=None):
+    app = app or current_app
+    verifier = app.extensions.get("password_verifier")
+    if verifier is None:
+        verifier = PasswordVerifier(workers=app.config.get("LOGIN_HASH_WORKERS", 4),
+                                    queue_size=app.config.get("LOGIN_HASH_QUEUE", 16))
+        app.extensions["password_verifier"] = verifier
+    return verifier
@@ -0,0 +1,36 @@
+import hashlib
+from flask import request, make_response, Response
+from werkzeug.http import is_resource_modified
+
+# Conditional GET for JSON views. A view computes a validator from data it already has
+# (updated_at, a version counter, the ids on a page) and passes a callable that builds the
+# body; when the client's If-None-Match / If-Modified-Since still matches, the body is
+# never built and a bodiless 304 goes out instead.
+#
+# ETags are weak: bodies may differ byte for byte (e.g. freshly signed media URLs) while
+# meaning the same thing. Responses are "no-cache": clients keep them but revalidate on
+# every use, which is what makes polling cheap without ever serving stale data.
+
+def make_etag(*parts):
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+def conditional_response(build, etag, last_modified=None, private=False, vary=()):
+    """Return a 304 if the request's validators match, else `build()` with validators set.
+
+    `private` marks per-user bodies that shared caches must not store; `vary` names the
+    request headers (e.g. Authorization) that select which user's body this is.
+    """
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response(build())
+    else:
+        response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    response.vary.update(vary)
+    return response
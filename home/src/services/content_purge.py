@@ -0,0 +1,171 @@
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update
+from src.models.user import db
+from src.models.content import Content, ContentPurge, ContentSearchTerm
+from src.models.monetization import PayPerViewPurchase
+from src.models.finance import Transaction
+from src.services.storage import get_storage
+from src.services.response_cache import invalidate_coach_content
+
+# Deleting content is two steps. soft_delete() stamps deleted_at (every read path filters on it)
+# and drops the search postings, in one short transaction per chunk of ids, and records a
+# ContentPurge for the request. `flask purge-content` then removes each item for good: its
+# purchases are deleted and its ledger rows detached (content_id/purchase_id set to NULL; the
+# ledger itself is kept) batch_size rows per committed statement, its stored files are deleted
+# unless another item shares them, and finally the row itself. Each purged item is counted on
+# its ContentPurge, which the admin API reports as progress.
+#
+# Items are only purged once deleted for CONTENT_PURGE_GRACE seconds: a payment started before
+# the delete can still succeed, and its webhook should find the item to link the ledger row to.
+
+DEFAULT_BATCH_SIZE = 500 # Dependent rows per statement, and items per purger batch
+DEFAULT_GRACE_SECONDS = 3 * 24 * 3600 # Stripe retries a webhook for up to three days
+RECENT_FILE_SECONDS = 600 # A file saved this recently may belong to an upload not yet committed
+DELETE_CHUNK_SIZE = 500 # Ids per soft-delete transaction
+MAX_BULK_DELETE = 10000
+
+def soft_delete(content_ids):
+    """Hide the live items among `content_ids` and queue them for purging.
+
+    Returns (ContentPurge, ids deleted); the purge is None when none of them was live.
+    """
+    content_ids = sorted(set(content_ids))
+    now = datetime.utcnow()
+    purge = None
+    deleted = []
+    for start in range(0, len(content_ids), DELETE_CHUNK_SIZE):
+        chunk = content_ids[start:start + DELETE_CHUNK_SIZE]
+        rows = db.session.query(Content.id, Content.coach_id).filter(
+            Content.id.in_(chunk), Content.deleted_at.is_(None)).all()
+        if not rows:
+            continue
+        if purge is None:
+            purge = ContentPurge(content_count=0)
+            db.session.add(purge)
+            db.session.flush()
+        ids = [row.id for row in rows]
+        db.session.execute(update(Content).where(Content.id.in_(ids), Content.deleted_at.is_(None)).values(
+            deleted_at=now, purge_id=purge.id))
+        ContentSearchTerm.query.filter(ContentSearchTerm.content_id.in_(ids)).delete(synchronize_session=False)
+        purge.content_count += len(ids)
+        db.session.commit()
+        invalidate_coach_content(*[row.coach_id for row in rows])
+        deleted += ids
+    return purge, deleted
+
+def _in_batches(select_ids, apply, batch_size):
+    """Run `apply(ids)` on successive batches from `select_ids(limit)`, committing each; returns the total."""
+    total = 0
+    while True:
+        ids = [row[0] for row in select_ids(batch_size)]
+        if ids:
+            apply(ids)
+            db.session.commit()
+            total += len(ids)
+        if len(ids) < batch_size:
+            return total
+
+def _shared(key, content_id):
+    # Storage is content-addressed: an identical upload on another item has the same key.
+    # Variants are derived from the original, so only originals are checked.
+    return db.session.query(Content.id).filter(Content.file_url == key, Content.id != content_id).first() is not None
+
+def purge_item(content, storage, batch_size=DEFAULT_BATCH_SIZE):
+    """Remove one soft-deleted item (a pending_query row), its dependent rows and its files.
+
+    Returns (rows removed, files removed).
+    """
+    content_id = content.id
+    rows = _in_batches(
+        lambda limit: db.session.query(Transaction.id).filter(Transaction.content_id == content_id).limit(limit),
+        lambda ids: db.session.execute(update(Transaction).where(Transaction.id.in_(ids)).values(
+            content_id=None, purchase_id=None)),
+        batch_size)
+    rows += _in_batches(
+        lambda limit: db.session.query(PayPerViewPurchase.id).filter(PayPerViewPurchase.content_id == content_id).limit(limit),
+        lambda ids: PayPerViewPurchase.query.filter(PayPerViewPurchase.id.in_(ids)).delete(synchronize_session=False),
+        batch_size)
+    # Normally gone already (soft_delete), unless the item was reindexed since
+    ContentSearchTerm.query.filter(ContentSearchTerm.content_id == content_id).delete(synchronize_session=False)
+
+    files = 0
+    if not (content.file_url and _shared(content.file_url, content_id)):
+        for key in {content.file_url, content.thumbnail_key, content.web_key} - {None}:
+            if not storage.exists(key):
+                continue
+            # An identical upload saves (and touches) the file before its row commits, so
+            # _shared() cannot see it yet: leave such a file to the item about to reference it
+            age = storage.age(key)
+            if age is not None and age < RECENT_FILE_SECONDS:
+                current_app.logger.warning("Not deleting %s of purged content %s: written %.0fs ago",
+                                           key, content_id, age)
+                continue
+            storage.delete(key)
+            files += 1
+
+    Content.query.filter(Content.id == content_id).delete(synchronize_session=False)
+    if content.purge_id:
+        db.session.execute(update(ContentPurge).where(ContentPurge.id == content.purge_id).values(
+            purged_count=ContentPurge.purged_count + 1, rows_removed=ContentPurge.rows_removed + rows,
+            files_removed=ContentPurge.files_removed + files))
+        db.session.execute(update(ContentPurge).where(
+            ContentPurge.id == content.purge_id, ContentPurge.purged_count >= ContentPurge.content_count,
+            ContentPurge.finished_at.is_(None)).values(finished_at=datetime.utcnow()))
+    db.session.commit()
+    return rows, files
+
+def grace_seconds():
+    return current_app.config.get("CONTENT_PURGE_GRACE", DEFAULT_GRACE_SECONDS)
+
+def pending_query(after_id=0, batch_size=DEFAULT_BATCH_SIZE, deleted_before=None):
+    # Plain rows, not Content instances: purge_item deletes the rows behind them
+    query = db.session.query(Content.id, Content.file_url, Content.thumbnail_key, Content.web_key,
+                             Content.purge_id).filter(Content.deleted_at.isnot(None), Content.id > after_id)
+    if deleted_before is not None:
+        query = query.filter(Content.deleted_at < deleted_before)
+    return query.order_by(Content.id).limit(batch_size)
+
+def purge_batch(batch_size=DEFAULT_BATCH_SIZE, after_id=0, grace=None):
+    """Purge up to `batch_size` items deleted over `grace` seconds ago, with ids above `after_id`.
+
+    Returns (items handled, last id handled); an item that fails is logged and left for a later run.
+    """
+    grace = grace_seconds() if grace is None else grace
+    items = pending_query(after_id, batch_size, datetime.utcnow() - timedelta(seconds=grace)).all()
+    storage = get_storage()
+    for content in items:
+        try:
+            purge_item(content, storage, batch_size)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning("Purging content %s failed: %s", content.id, e)
+    return len(items), items[-1].id if items else after_id
+
+def purge_pending(batch_size=DEFAULT_BATCH_SIZE, grace=None):
+    """Purge everything deleted over `grace` seconds ago. Returns the number of items handled."""
+    handled, last_id = 0, 0
+    while True:
+        count, last_id = purge_batch(batch_size, last_id, grace)
+        handled += count
+        if count < batch_size:
+            return handled
+
+def run_purger(batch_size=DEFAULT_BATCH_SIZE, poll_interval=30.0, stop=None, grace=None):
+    """Purge soft-deleted content until `stop()` returns True, sleeping when there is none."""
+    while not (stop and stop()):
+        purge_pending(batch_size, grace)
+        time.sleep(poll_interval)
+
+def progress(purge):
+    return {
+        "id": purge.id,
+        "requested_at": purge.requested_at.isoformat() if purge.requested_at else None,
+        "content_count": purge.content_count,
+        "purged_count": purge.purged_count,
+        "rows_removed": purge.rows_removed,
+        "files_removed": purge.files_removed,
+        "finished_at": purge.finished_at.isoformat() if purge.finished_at else None,
+        "status": "done" if purge.finished_at else "pending"
+    }
@@ -0,0 +1,123 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+from werkzeug.exceptions import NotFound
+
+# Read-only views decorated with @read_replica send their SELECTs to a replica bind
+# (DB_REPLICA_URLS, registered as binds "replica_1", "replica_2", ...), one replica per request
+# so all its reads see the same replication lag and reuse one pooled connection. Everything else,
+# including any read issued after the session has pending writes, goes to the primary.
+# A replica that errors is skipped for REPLICA_RETRY_SECONDS and the view is re-run on
+# the primary, so a dead replica costs one failed attempt, not failed requests. A 404 from a
+# replica is re-checked on the primary too, since the row may simply not have replicated yet.
+
+REPLICA_RETRY_SECONDS = 30
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and isinstance(clause, Select) and _use_replica() and not self._flushing \
+                and not (self.new or self.dirty or self.deleted):
+            engine = get_router().for_request()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def _use_replica():
+    return has_request_context() and g.get("db_use_replica", False)
+
+class ReplicaRouter:
+    def __init__(self, engines, retry_seconds=REPLICA_RETRY_SECONDS):
+        self.engines = engines # bind key -> Engine
+        self.retry_seconds = retry_seconds
+        self._down_until = {}
+        self._cycle = itertools.cycle(sorted(engines))
+        self._lock = threading.Lock()
+
+    def for_request(self):
+        """The replica engine of the current request, picked on its first read; None to use the primary."""
+        key = g.get("db_replica_key")
+        if key is not None:
+            return self.engines[key]
+        return self.pick()
+
+    def pick(self):
+        """Next healthy replica engine (round robin), or None to use the primary."""
+        now = time.monotonic()
+        with self._lock:
+            for _ in range(len(self.engines)):
+                key = next(self._cycle)
+                if self._down_until.get(key, 0) <= now:
+                    g.db_replica_key = key
+                    return self.engines[key]
+        return None
+
+    def mark_down(self, key):
+        with self._lock:
+            self._down_until[key] = time.monotonic() + self.retry_seconds
+
+    def status(self):
+        now = time.monotonic()
+        with self._lock:
+            return {key: "down" if self._down_until.get(key, 0) > now else "up" for key in sorted(self.engines)}
+
+def get_router(app=None):
+    app = app or current_app
+    return app.extensions["db_replica_router"]
+
+def init_app(app, db):
+    replica_keys = app.config.get("DB_REPLICA_BINDS") or []
+    with app.app_context():
+        engines = {key: db.engines[key] for key in replica_keys}
+    router = app.extensions["db_replica_router"] = ReplicaRouter(
+        engines, app.config.get("REPLICA_RETRY_SECONDS", REPLICA_RETRY_SECONDS))
+
+    for key, engine in engines.items():
+        def replica_error(context, key=key):
+            # Connection-level failures only; a bad query would fail on the primary too
+            if context.is_disconnect or context.connection is None or context.is_pre_ping:
+                if has_request_context():
+                    g.db_replica_failed = key
+                router.mark_down(key)
+        event.listen(engine, "handle_error", replica_error)
+
+def read_replica(f):
+    """Let a read-only view run its queries on a replica, falling back to the primary."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        router = get_router()
+        if not router.engines:
+            return f(*args, **kwargs)
+        g.db_use_replica = True
+        try:
+            return f(*args, **kwargs)
+        except NotFound:
+            if g.pop("db_replica_key", None) is None:
+                raise
+        except Exception:
+            failed = g.pop("db_replica_failed", None)
+            if failed is None:
+                raise
+            current_app.logger.warning("Replica %s failed, retrying %s on the primary", failed, f.__name__)
+        from src.models.user import db
+        db.session.rollback()
+        g.db_use_replica = False
+        return f(*args, **kwargs)
+    return decorated_function
+
+@contextmanager
+def primary():
+    """Force the primary inside a replica-routed view (e.g. for read-your-writes lookups)."""
+    previous = g.get("db_use_replica", False) if has_request_context() else False
+    if has_request_context():
+        g.db_use_replica = False
+    try:
+        yield
+    finally:
+        if has_request_context():
+            g.db_use_replica = previous
@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from flask import request
+from sqlalchemy import func, cast, text, Numeric
+from src.models.user import db
+from src.models.finance import Transaction, CoachEarningsDaily
+from src.services.pagination import parse_datetime_arg
+
+REBUILD_DAYS_PER_BATCH = 31
+UPSERT_BATCH_SIZE = 1000 # Rows per INSERT, within the bound-parameter limits of SQLite and MySQL
+
+def to_cents(amount):
+    # From the amount's decimal digits, half up: round() on the float would turn 0.285 into 28
+    return int((Decimal(str(amount or 0)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+def cents_sql(column):
+    """SQL twin of to_cents(), so rollups rebuilt in SQL match the ones added up in Python."""
+    if db.session.get_bind().dialect.name == "sqlite":
+        # SQLite's round() works on the decimal digits too, but only with a precision
+        return func.round(func.round(column, 2) * 100)
+    return func.round(cast(column, Numeric(18, 2)) * 100)
+
+def lock_rollup(table):
+    """Hold off increments to `table` until the current DB transaction ends.
+
+    Delete-and-recompute needs it: an increment committed between the recompute's read and its
+    upsert would be counted twice. PostgreSQL gets a table lock (readers are not blocked); on
+    SQLite the DELETE already holds the database's single write lock, and on MySQL the next-key
+    locks it takes on the deleted range do the same.
+    """
+    if db.session.get_bind().dialect.name == "postgresql":
+        db.session.execute(text(f"LOCK TABLE {table.name} IN SHARE ROW EXCLUSIVE MODE"))
+
+def add_to_rollup(table, values):
+    """Add `values` (row dicts) onto the rollup rows of `table` with the same primary key, creating missing ones.
+
+    Every column outside the primary key is a counter.
+    """
+    if len(values) > UPSERT_BATCH_SIZE:
+        for start in range(0, len(values), UPSERT_BATCH_SIZE):
+            add_to_rollup(table, values[start:start + UPSERT_BATCH_SIZE])
+        return
+    if not values:
+        return
+    keys = [column.name for column in table.primary_key.columns]
+    counters = [column.name for column in table.columns if column.name not in keys]
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table).values(values)
+        statement = statement.on_duplicate_key_update({c: table.c[c] + statement.inserted[c] for c in counters})
+    else:
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table).values(values)
+        statement = statement.on_conflict_do_update(
+            index_elements=keys, set_={c: table.c[c] + statement.excluded[c] for c in counters})
+    db.session.execute(statement)
+
+def _upsert(values):
+    add_to_rollup(CoachEarningsDaily.__table__, values)
+
+def record_transactions(rows):
+    """Fold newly inserted Transaction rows (dicts) into the rollups, in the caller's DB transaction."""
+    totals = {}
+    for row in rows:
+        if row.get("status") != "succeeded" or not row.get("coach_id"):
+            continue
+        key = (row["coach_id"], row["created_at"].date(), row["currency"])
+        gross = to_cents(row["amount"])
+        fee = to_cents(row["platform_fee"])
+        total = totals.setdefault(key, [0, 0, 0, 0])
+        total[0] += gross
+        total[1] += fee
+        total[2] += gross - fee
+        total[3] += 1
+    _upsert([{"coach_id": coach_id, "day": day, "currency": currency, "gross_cents": gross,
+              "fee_cents": fee, "net_cents": net, "transaction_count": count}
+             for (coach_id, day, currency), (gross, fee, net, count) in totals.items()])
+
+def rebuild(since=None, until=None, coach_id=None, log=print):
+    """Recompute rollups from Transaction for [since, until) days, a batch of days at a time."""
+    bounds = db.session.query(func.min(Transaction.created_at), func.max(Transaction.created_at)).one()
+    # Ends the read's transaction: on MySQL its snapshot would otherwise serve the first batch's
+    # read, missing transactions committed before the DELETE below removed their increments
+    db.session.commit()
+    if bounds[0] is None:
+        return 0
+    start = since or bounds[0].date()
+    end = until or bounds[1].date() + timedelta(days=1)
+    rebuilt = 0
+    while start < end:
+        batch_end = min(start + timedelta(days=REBUILD_DAYS_PER_BATCH), end)
+        # Each batch is one transaction: lock, DELETE, then the read that takes its snapshot
+        lock_rollup(CoachEarningsDaily.__table__)
+        deleted = CoachEarningsDaily.query.filter(CoachEarningsDaily.day >= start, CoachEarningsDaily.day < batch_end)
+        if coach_id:
+            deleted = deleted.filter(CoachEarningsDaily.coach_id == coach_id)
+        deleted.delete(synchronize_session=False)
+
+        day = func.date(Transaction.created_at)
+        gross = func.sum(cents_sql(Transaction.amount))
+        fee = func.sum(cents_sql(func.coalesce(Transaction.platform_fee, 0)))
+        query = db.session.query(Transaction.coach_id, day, Transaction.currency, gross, fee, func.count()).filter(
+            Transaction.status == "succeeded",
+            Transaction.coach_id.isnot(None),
+            Transaction.created_at >= datetime.combine(start, datetime.min.time()),
+            Transaction.created_at < datetime.combine(batch_end, datetime.min.time())
+        )
+        if coach_id:
+            query = query.filter(Transaction.coach_id == coach_id)
+        values = []
+        for row_coach_id, row_day, currency, gross_cents, fee_cents, count in query.group_by(
+                Transaction.coach_id, day, Transaction.currency):
+            if isinstance(row_day, str):
+                row_day = datetime.strptime(row_day, "%Y-%m-%d").date()
+            values.append({"coach_id": row_coach_id, "day": row_day, "currency": currency,
+                           "gross_cents": int(gross_cents), "fee_cents": int(fee_cents),
+                           "net_cents": int(gross_cents) - int(fee_cents), "transaction_count": count})
+        _upsert(values)
+        db.session.commit()
+        rebuilt += len(values)
+        log(f"Rebuilt {start} .. {batch_end}: {len(values)} rollup row(s)")
+        start = batch_end
+    return rebuilt
+
+def summarize(coach_id=None, since=None, until=None, by_day=False):
+    """Gross/fee/net/count from the rollups, optionally per day; O(days), not O(transactions)."""
+    columns = [CoachEarningsDaily.currency,
+               func.sum(CoachEarningsDaily.gross_cents), func.sum(CoachEarningsDaily.fee_cents),
+               func.sum(CoachEarningsDaily.net_cents), func.sum(CoachEarningsDaily.transaction_count)]
+    group_by = [CoachEarningsDaily.currency]
+    if by_day:
+        columns.insert(0, CoachEarningsDaily.day)
+        group_by.insert(0, CoachEarningsDaily.day)
+    query = db.session.query(*columns)
+    if coach_id:
+        query = query.filter(CoachEarningsDaily.coach_id == coach_id)
+    if since:
+        query = query.filter(CoachEarningsDaily.day >= since)
+    if until:
+        query = query.filter(CoachEarningsDaily.day < until)
+    result = []
+    for row in query.group_by(*group_by).order_by(*group_by):
+        row = list(row)
+        entry = {"day": row.pop(0).isoformat()} if by_day else {}
+        currency, gross, fee, net, count = row
+        entry.update({"currency": currency, "gross_cents": int(gross or 0), "fee_cents": int(fee or 0),
+                      "net_cents": int(net or 0), "transaction_count": int(count or 0)})
+        result.append(entry)
+    return result
+
+def report(coach_id=None):
+    """Totals (and, unless ?daily=false, the per-day series) for the since/until query args."""
+    since = parse_datetime_arg("since")
+    until = parse_datetime_arg("until")
+    since = since.date() if since else None
+    until = until.date() if until else None
+    result = {
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat() if until else None,
+        "totals": summarize(coach_id, since, until)
+    }
+    if request.args.get("daily", "true").lower() != "false":
+        result["daily"] = summarize(coach_id, since, until, by_day=True)
+    return result
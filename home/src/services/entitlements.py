@@ -0,0 +1,285 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from src.models.user import User, db
+from src.models.content import Content
+from src.models.monetization import Subscription, PayPerViewPurchase
+from src.services.db_routing import primary
+
+# Entitlement lookups always go to the primary, even from replica-routed views: a fan who
+# has just paid must not be denied by replica lag (and the answers are cached anyway).
+
+class LRUTTLCache:
+    """Bounded, thread-safe LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, max_size=10000, ttl=60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def delete_where(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+# One cache per worker process; entries are (answer, fan generation). Granting access deletes
+# the local entry and bumps the fan's generation in the response cache's shared tier
+# (RESPONSE_CACHE_URL), which every worker reads before trusting a cached denial, so a grant
+# made in one process (web worker, webhook worker, sweeper) reaches them all. Without a shared
+# tier only the local worker is invalidated, and the short negative TTL bounds the staleness.
+ENTITLEMENT_CACHE_SIZE = int(os.getenv("ENTITLEMENT_CACHE_SIZE", 50000))
+ENTITLEMENT_CACHE_TTL = float(os.getenv("ENTITLEMENT_CACHE_TTL", 300))
+ENTITLEMENT_NEGATIVE_TTL = float(os.getenv("ENTITLEMENT_NEGATIVE_TTL", 10))
+
+entitlement_cache = LRUTTLCache(max_size=ENTITLEMENT_CACHE_SIZE, ttl=ENTITLEMENT_CACHE_TTL)
+
+def _subscription_key(fan_id, coach_id):
+    return ("sub", int(fan_id), int(coach_id))
+
+def _purchase_key(fan_id, content_id):
+    return ("ppv", int(fan_id), int(content_id))
+
+def fan_generation(fan_id):
+    """The fan's generation in the shared tier, or None without one."""
+    from src.services.response_cache import get_response_cache, fan_key # It imports LRUTTLCache from here
+    return get_response_cache().generation(fan_key(fan_id))
+
+def _bump(fan_id):
+    from src.services.response_cache import get_response_cache, fan_key
+    get_response_cache().invalidate(fan_key(fan_id))
+
+def active_subscription_end(fan_id, coach_id):
+    """End date of the fan's active subscription to the coach, or None."""
+    key = _subscription_key(fan_id, coach_id)
+    cached = entitlement_cache.get(key)
+    now = datetime.utcnow()
+    if cached is not None and cached[0]:
+        return cached[0] if cached[0] > now else None
+    # Read before the query, so a grant racing it leaves a denial that no longer matches
+    generation = fan_generation(fan_id)
+    if cached is not None and cached[1] == generation:
+        return None
+
+    with primary():
+        subscription = Subscription.query.filter_by(
+            fan_id=fan_id,
+            coach_id=coach_id,
+            is_active=True
+        ).filter(Subscription.end_date > now).order_by(Subscription.end_date.desc()).first()
+
+    if subscription:
+        # Never cache a subscription past its own end date
+        ttl = min(ENTITLEMENT_CACHE_TTL, (subscription.end_date - now).total_seconds())
+        entitlement_cache.set(key, (subscription.end_date, generation), ttl)
+        return subscription.end_date
+    entitlement_cache.set(key, (None, generation), ENTITLEMENT_NEGATIVE_TTL)
+    return None
+
+def has_purchased(fan_id, content_id):
+    key = _purchase_key(fan_id, content_id)
+    cached = entitlement_cache.get(key)
+    if cached is not None and cached[0]:
+        return True
+    generation = fan_generation(fan_id)
+    if cached is not None and cached[1] == generation:
+        return False
+    with primary():
+        purchased = PayPerViewPurchase.query.filter_by(fan_id=fan_id, content_id=content_id).first() is not None
+    entitlement_cache.set(key, (purchased, generation), None if purchased else ENTITLEMENT_NEGATIVE_TTL)
+    return purchased
+
+def check_access(fan_id, content):
+    """Decide whether `fan_id` may view `content` (a Content instance or id).
+
+    Returns (allowed, reason). Shared by the content and monetization blueprints.
+    """
+    if not isinstance(content, Content):
+        content = Content.query.get(content)
+    if not content or content.deleted_at:
+        return False, "Content not found"
+
+    if content.access_setting == "free":
+        return True, "Content is free"
+
+    if not fan_id:
+        return False, "User not identified for paid content"
+
+    if active_subscription_end(fan_id, content.coach_id):
+        return True, "Active subscription to coach"
+
+    if has_purchased(fan_id, content.id):
+        return True, "Content purchased (pay-per-view)"
+
+    # Only pay for the fan lookup when access is being denied anyway
+    if not User.query.get(fan_id):
+        return False, "Fan not found"
+
+    return False, "No active subscription or purchase"
+
+def check_access_batch(fan_id, contents):
+    """Resolve access for many Content instances with at most two set-based queries.
+
+    Returns {content_id: (allowed, reason)}. Cached answers are reused and every
+    answer fetched here is written back to the cache.
+    """
+    results = {}
+    paid = []
+    for content in contents:
+        if content.access_setting == "free":
+            results[content.id] = (True, "Content is free")
+        elif not fan_id:
+            results[content.id] = (False, "User not identified for paid content")
+        else:
+            paid.append(content)
+    if not paid:
+        return results
+
+    now = datetime.utcnow()
+    generation = fan_generation(fan_id)
+    subscribed = set()
+    unknown_coaches = set()
+    for coach_id in {content.coach_id for content in paid}:
+        cached = entitlement_cache.get(_subscription_key(fan_id, coach_id))
+        if cached is None or (not cached[0] and cached[1] != generation):
+            unknown_coaches.add(coach_id)
+        elif cached[0] and cached[0] > now:
+            subscribed.add(coach_id)
+
+    if unknown_coaches:
+        with primary():
+            rows = Subscription.query.with_entities(Subscription.coach_id, db.func.max(Subscription.end_date)).filter(
+                Subscription.fan_id == fan_id,
+                Subscription.coach_id.in_(unknown_coaches),
+                Subscription.is_active == True,
+                Subscription.end_date > now
+            ).group_by(Subscription.coach_id).all()
+        found = dict(rows)
+        for coach_id in unknown_coaches:
+            end_date = found.get(coach_id)
+            if end_date:
+                subscribed.add(coach_id)
+                ttl = min(ENTITLEMENT_CACHE_TTL, (end_date - now).total_seconds())
+                entitlement_cache.set(_subscription_key(fan_id, coach_id), (end_date, generation), ttl)
+            else:
+                entitlement_cache.set(_subscription_key(fan_id, coach_id), (None, generation), ENTITLEMENT_NEGATIVE_TTL)
+
+    purchased = set()
+    unknown_content = set()
+    for content in paid:
+        if content.coach_id in subscribed:
+            continue
+        cached = entitlement_cache.get(_purchase_key(fan_id, content.id))
+        if cached is None or (not cached[0] and cached[1] != generation):
+            unknown_content.add(content.id)
+        elif cached[0]:
+            purchased.add(content.id)
+
+    if unknown_content:
+        with primary():
+            rows = PayPerViewPurchase.query.with_entities(PayPerViewPurchase.content_id).filter(
+                PayPerViewPurchase.fan_id == fan_id,
+                PayPerViewPurchase.content_id.in_(unknown_content)
+            ).all()
+        found = {row.content_id for row in rows}
+        for content_id in unknown_content:
+            entitlement_cache.set(_purchase_key(fan_id, content_id), (content_id in found, generation),
+                                  None if content_id in found else ENTITLEMENT_NEGATIVE_TTL)
+        purchased |= found
+
+    for content in paid:
+        if content.coach_id in subscribed:
+            results[content.id] = (True, "Active subscription to coach")
+        elif content.id in purchased:
+            results[content.id] = (True, "Content purchased (pay-per-view)")
+        else:
+            results[content.id] = (False, "No active subscription or purchase")
+    return results
+
+def remember_subscriptions(fan_id, end_dates):
+    """Cache {coach_id: end_date} of active subscriptions a caller has already read from the primary."""
+    now = datetime.utcnow()
+    for coach_id, end_date in end_dates.items():
+        if end_date and end_date > now:
+            ttl = min(ENTITLEMENT_CACHE_TTL, (end_date - now).total_seconds())
+            entitlement_cache.set(_subscription_key(fan_id, coach_id), (end_date, None), ttl)
+
+def invalidate_subscription(fan_id, coach_id):
+    entitlement_cache.delete(_subscription_key(fan_id, coach_id))
+    _bump(fan_id)
+
+def invalidate_purchase(fan_id, content_id):
+    entitlement_cache.delete(_purchase_key(fan_id, content_id))
+    _bump(fan_id)
+
+def invalidate_fan(fan_id):
+    fan_id = int(fan_id)
+    entitlement_cache.delete_where(lambda key: key[1] == fan_id)
+    _bump(fan_id)
+
+def cache_stats():
+    return entitlement_cache.stats()
+
+def metric_lines():
+    stats = cache_stats()
+    lines = []
+    for name in ("hits", "misses", "evictions", "invalidations"):
+        lines += [f"# TYPE entitlement_cache_{name}_total counter", f"entitlement_cache_{name}_total {stats[name]}"]
+    lines += ["# TYPE entitlement_cache_size gauge", f"entitlement_cache_size {stats['size']}"]
+    return lines
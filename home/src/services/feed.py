@@ -0,0 +1,121 @@
+import heapq
+import os
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import select, union_all, bindparam, func, Integer
+from src.models.user import db
+from src.models.content import Content
+from src.models.monetization import Subscription
+from src.services import entitlements
+from src.services.db_routing import primary
+from src.services.entitlements import LRUTTLCache
+from src.services.pagination import after_cursor, ordered
+
+# A fan's feed is the newest content of every coach they actively subscribe to, newest first.
+# Each coach contributes at most one page of rows read from ix_content_coach_created (one
+# UNION ALL branch per coach, so every branch is a short index range read), and the per-coach
+# lists are k-way merged. Cost follows subscriptions x page size, never a coach's full history.
+
+COACHES_PER_QUERY = 50
+
+# Head (first page) per fan and page size; refreshes within the TTL skip the merge queries.
+# Subscribing invalidates it (in every worker, through the fan's generation in the shared
+# tier; see entitlements.py), new uploads show up within the TTL.
+FEED_CACHE_SIZE = int(os.getenv("FEED_CACHE_SIZE", 10000))
+FEED_CACHE_TTL = float(os.getenv("FEED_CACHE_TTL", 30))
+
+feed_cache = LRUTTLCache(max_size=FEED_CACHE_SIZE, ttl=FEED_CACHE_TTL)
+
+def followed_coaches(fan_id):
+    """{coach_id: end_date} of the fan's active subscriptions, read from the primary."""
+    with primary():
+        rows = db.session.query(Subscription.coach_id, func.max(Subscription.end_date)).filter(
+            Subscription.fan_id == fan_id,
+            Subscription.is_active == True,
+            Subscription.end_date > datetime.utcnow()
+        ).group_by(Subscription.coach_id).all()
+    return dict(rows)
+
+_statements = {}
+
+def newest_query(branch_count, with_after=False, with_floor=False):
+    """UNION ALL of the newest :limit (created_at, id, coach_id) rows of coaches :coach_0.. :coach_N-1.
+
+    Built once per shape with bound parameters, so SQLAlchemy compiles each shape only once.
+    """
+    key = (branch_count, with_after, with_floor)
+    statement = _statements.get(key)
+    if statement is None:
+        content = Content.__table__
+        branches = []
+        for i in range(branch_count):
+            branch = select(content.c.created_at, content.c.id, content.c.coach_id).where(
+                content.c.coach_id == bindparam(f"coach_{i}"), content.c.deleted_at.is_(None))
+            if with_after:
+                # The extra bound turns the OR of the keyset condition into an index range
+                after_created_at = bindparam("after_created_at", type_=content.c.created_at.type)
+                branch = after_cursor(branch, content.c.created_at, content.c.id, after_created_at,
+                                      bindparam("after_id")).where(content.c.created_at <= after_created_at)
+            if with_floor:
+                # Rows older than the page merged so far cannot make the page
+                branch = branch.where(content.c.created_at >= bindparam("floor", type_=content.c.created_at.type))
+            branch = ordered(branch, content.c.created_at, content.c.id).limit(bindparam("limit", type_=Integer))
+            branches.append(select(branch.subquery()))
+        statement = _statements[key] = union_all(*branches)
+    return statement
+
+def _newest_per_coach(coach_ids, after, floor, limit):
+    # Pad to a full chunk (id 0 matches nothing) so every chunk reuses one compiled statement
+    padded = list(coach_ids) + [0] * (COACHES_PER_QUERY - len(coach_ids))
+    params = {f"coach_{i}": coach_id for i, coach_id in enumerate(padded)}
+    params["limit"] = limit
+    if after:
+        params["after_created_at"], params["after_id"] = after
+    if floor is not None:
+        params["floor"] = floor
+    per_coach = {}
+    for created_at, content_id, coach_id in db.session.execute(
+            newest_query(len(padded), after is not None, floor is not None), params):
+        per_coach.setdefault(coach_id, []).append((created_at, content_id))
+    return [sorted(rows, reverse=True) for rows in per_coach.values()]
+
+def merge_newest(coach_ids, after=None, limit=20):
+    """The newest `limit` + 1 (created_at, id) pairs across `coach_ids`, newest first."""
+    coach_ids = sorted(coach_ids)
+    head = []
+    for start in range(0, len(coach_ids), COACHES_PER_QUERY):
+        floor = head[-1][0] if len(head) > limit else None
+        streams = _newest_per_coach(coach_ids[start:start + COACHES_PER_QUERY], after, floor, limit + 1)
+        head = list(islice(heapq.merge(head, *streams, reverse=True), limit + 1))
+    return head
+
+def feed_page(fan_id, after=None, limit=20):
+    """Return ([(Content, (allowed, reason))], next (created_at, id) or None) for one page."""
+    cache_key = (int(fan_id), limit)
+    cached = None
+    if after is None:
+        generation = entitlements.fan_generation(fan_id)
+        cached = feed_cache.get(cache_key)
+        if cached is not None and cached[2] != generation:
+            cached = None
+    if cached is None:
+        subscriptions = followed_coaches(fan_id)
+        entitlements.remember_subscriptions(fan_id, subscriptions) # Saves the access check a query
+        head = merge_newest(subscriptions, after, limit)
+        next_after = head[limit - 1] if len(head) > limit else None
+        ids = [content_id for _, content_id in head[:limit]]
+        if after is None:
+            feed_cache.set(cache_key, (ids, next_after, generation))
+    else:
+        ids, next_after, _ = cached
+
+    # Cached heads may name items deleted since
+    contents = {content.id: content for content in Content.query.filter(
+        Content.id.in_(ids), Content.deleted_at.is_(None))} if ids else {}
+    page = [contents[content_id] for content_id in ids if content_id in contents]
+    access = entitlements.check_access_batch(fan_id, page)
+    return [(content, access[content.id]) for content in page], next_after
+
+def invalidate_fan(fan_id):
+    fan_id = int(fan_id)
+    feed_cache.delete_where(lambda key: key[0] == fan_id)
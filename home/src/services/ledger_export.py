@@ -0,0 +1,109 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, date
+from sqlalchemy import select, and_, or_
+from src.models.user import db
+from src.models.finance import Transaction, Payout
+
+# Ledger exports for finance reconciliation: every column of Transaction or Payout for a date
+# range (and optionally one coach), oldest first, as CSV or NDJSON, optionally gzipped.
+#
+# Memory stays flat however many rows match. Rows are read in keyset chunks of CHUNK_SIZE;
+# each chunk is streamed from a server-side cursor (stream_results) FETCH_SIZE rows at a
+# time and written out as it arrives. Every chunk is its own short read transaction, so a
+# 20M-row export never pins one snapshot or connection for its whole run. Behind
+# @read_replica (the admin endpoint) the chunks are read from a replica.
+
+CHUNK_SIZE = 10000
+FETCH_SIZE = 1000 # Rows per cursor fetch, and per piece of output
+
+# kind -> (model, column the date range and the order apply to)
+EXPORTS = {
+    "transactions": (Transaction, "created_at"),
+    "payouts": (Payout, "requested_at"),
+}
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+def columns(kind):
+    model, _ = EXPORTS[kind]
+    return [column.key for column in model.__table__.columns]
+
+def chunk_query(kind, since=None, until=None, coach_id=None, after=None, chunk_size=CHUNK_SIZE):
+    """SELECT of one chunk: the next `chunk_size` rows after `after`, the (timestamp, id) of the last row read."""
+    model, time_key = EXPORTS[kind]
+    table = model.__table__
+    time_col, id_col = table.c[time_key], table.c.id
+    query = select(*table.columns)
+    if since:
+        query = query.where(time_col >= since)
+    if until:
+        query = query.where(time_col < until)
+    if coach_id:
+        query = query.where(table.c.coach_id == coach_id)
+    if after is not None:
+        # The extra bound keeps the OR from defeating the index range
+        query = query.where(or_(time_col > after[0], and_(time_col == after[0], id_col > after[1])),
+                            time_col >= after[0])
+    return query.order_by(time_col, id_col).limit(chunk_size)
+
+def export_rows(kind, since=None, until=None, coach_id=None, chunk_size=CHUNK_SIZE):
+    """Yield lists of row tuples (columns(kind) order), oldest first, at most FETCH_SIZE per list."""
+    time_index = columns(kind).index(EXPORTS[kind][1])
+    after = None
+    while True:
+        result = db.session.execute(chunk_query(kind, since, until, coach_id, after, chunk_size).execution_options(
+            stream_results=True, yield_per=FETCH_SIZE))
+        count = 0
+        for rows in result.partitions():
+            count += len(rows)
+            after = (rows[-1][time_index], rows[-1].id)
+            yield rows
+        db.session.commit() # End the chunk's read transaction before starting the next
+        if count < chunk_size:
+            return
+
+def _value(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+def _csv(header, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for rows in batches:
+        writer.writerows([_value(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue() # Just the header when nothing matched
+
+def _ndjson(header, batches):
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(header, map(_value, row)))) + "\n" for row in rows)
+
+def _gzipped(pieces):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits 31: gzip container
+    for piece in pieces:
+        data = compressor.compress(piece)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export(kind, fmt="csv", compress=False, since=None, until=None, coach_id=None, chunk_size=CHUNK_SIZE):
+    """The export as an iterable of bytes, produced as rows are read."""
+    if kind not in EXPORTS:
+        raise ValueError(f"Unknown export {kind!r}. Must be one of: {', '.join(EXPORTS)}.")
+    if fmt not in FORMATS:
+        raise ValueError(f"Invalid format {fmt!r}. Must be one of: {', '.join(FORMATS)}.")
+    batches = export_rows(kind, since, until, coach_id, chunk_size)
+    pieces = (piece.encode() for piece in (_csv if fmt == "csv" else _ndjson)(columns(kind), batches) if piece)
+    return _gzipped(pieces) if compress else pieces
+
+def filename(kind, fmt, compress, since=None, until=None, coach_id=None):
+    parts = [kind]
+    if coach_id:
+        parts.append(f"coach{coach_id}")
+    if since or until:
+        parts.append(f"{since.date() if since else 'start'}_{until.date() if until else 'now'}")
+    return "-".join(parts) + f".{fmt}" + (".gz" if compress else "")
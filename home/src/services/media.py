@@ -0,0 +1,101 @@
+import mimetypes
+import re
+import time
+from datetime import datetime
+from flask import current_app, url_for, send_file, Response
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+DEFAULT_MEDIA_URL_TTL = 300 # seconds
+
+_DIGEST_KEY = re.compile(r"^sha256/../../([0-9a-f]{64})")
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"], salt="content-media")
+
+def media_token(content, file_key=None):
+    """Short-lived token proving the holder was entitled to `content` when it was issued.
+
+    It carries everything needed to serve the bytes (the original file or one of its
+    variants), so requests presenting it, e.g. every seek in a video player, need no
+    database access at all.
+    """
+    return _serializer().dumps({
+        "c": content.id,
+        "k": file_key or content.file_url,
+        "u": content.updated_at.isoformat() if content.updated_at else None
+    })
+
+def read_media_token(token, content_id):
+    """Return (file_key, updated_at) from a valid token for `content_id`, or None."""
+    max_age = current_app.config.get("MEDIA_URL_TTL", DEFAULT_MEDIA_URL_TTL)
+    try:
+        data = _serializer().loads(token, max_age=max_age)
+    except (SignatureExpired, BadSignature):
+        return None
+    if data.get("c") != content_id:
+        return None
+    updated_at = datetime.fromisoformat(data["u"]) if data.get("u") else None
+    return data["k"], updated_at
+
+def signed_media_url(content, file_key=None):
+    return url_for("content.get_content_media", content_id=content.id, token=media_token(content, file_key))
+
+def variant_urls(content, accessible):
+    """URLs of generated variants: thumbnails of free content are public previews, everything else is gated.
+
+    A thumbnail is a downscaled copy of the media itself, so a paid item's one is only
+    handed out, signed, to those who may see the item.
+    """
+    urls = {}
+    if content.thumbnail_key and content.access_setting == "free":
+        urls["thumbnail_url"] = url_for("content.get_content_media", content_id=content.id, variant="thumbnail")
+    elif content.thumbnail_key and accessible:
+        urls["thumbnail_url"] = signed_media_url(content, content.thumbnail_key)
+    if content.web_key and accessible:
+        urls["web_url"] = signed_media_url(content, content.web_key)
+    return urls
+
+def signed_url_epoch():
+    """Start of the current half-TTL window, for validators of bodies that embed signed URLs.
+
+    Such a body is only revalidated within one window, so a cached URL always has at least
+    half of its lifetime left.
+    """
+    step = max(1, current_app.config.get("MEDIA_URL_TTL", DEFAULT_MEDIA_URL_TTL) // 2)
+    return datetime.utcfromtimestamp(int(time.time()) // step * step)
+
+def media_etag(content_id, file_key, updated_at):
+    match = _DIGEST_KEY.match(file_key)
+    if match:
+        return match.group(1) # Content-addressed: the key already is a strong validator
+    stamp = int(updated_at.timestamp()) if updated_at else 0
+    return f"{content_id}-{stamp}"
+
+def send_media(storage, content_id, file_key, updated_at, public=False):
+    """Serve a stored file with Range, ETag and Last-Modified support.
+
+    With MEDIA_ACCEL_REDIRECT_PREFIX configured the front proxy (nginx `internal` location)
+    serves the bytes itself; otherwise the file is handed to the WSGI server's sendfile.
+    """
+    mimetype = mimetypes.guess_type(file_key)[0] or "application/octet-stream"
+    etag = media_etag(content_id, file_key, updated_at)
+    max_age = current_app.config.get("MEDIA_URL_TTL", DEFAULT_MEDIA_URL_TTL)
+
+    accel_prefix = current_app.config.get("MEDIA_ACCEL_REDIRECT_PREFIX")
+    if accel_prefix:
+        response = Response(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + file_key.lstrip("/")
+        response.set_etag(etag)
+        if updated_at:
+            response.last_modified = updated_at
+    else:
+        path = storage.local_path(file_key)
+        if path is None:
+            return None
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=etag,
+                             last_modified=updated_at, max_age=max_age)
+    # Entitlement-gated bytes: browsers may cache them, shared caches must not
+    response.cache_control.public = public
+    response.cache_control.private = not public
+    response.cache_control.max_age = max_age
+    return response
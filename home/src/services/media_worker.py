@@ -0,0 +1,209 @@
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, or_
+from src.models.user import db
+from src.models.content import Content
+from src.services.storage import get_storage
+from src.services.response_cache import invalidate_coach_content
+
+# Uploads are queued by setting Content.processing_status = "pending"; `flask process-media`
+# claims them in batches and runs the CPU-heavy part in a process pool so request workers
+# never decode images or probe videos. A claim is a lease (processing_claimed_at) that the
+# dispatcher renews while items are still being processed: items whose lease ran out, because
+# their dispatcher died, are claimed again by the next one.
+
+PENDING = "pending"
+PROCESSING = "processing"
+READY = "ready"
+FAILED = "failed"
+
+THUMBNAIL_SIZE = (320, 320)
+WEB_SIZE = (1280, 1280)
+DEFAULT_BATCH_SIZE = 50
+LEASE_SECONDS = 900
+RENEW_SECONDS = LEASE_SECONDS // 3 # Leases of items still in the pool are extended this often
+
+# --- Runs inside the pool: plain paths in, plain data out, no app or DB access ---
+
+def _resize(image, size, work_dir, quality):
+    variant = image.copy()
+    variant.thumbnail(size)
+    if variant.mode not in ("RGB", "L"):
+        variant = variant.convert("RGB")
+    fd, path = tempfile.mkstemp(dir=work_dir, prefix="variant-", suffix=".jpg")
+    with os.fdopen(fd, "wb") as f:
+        variant.save(f, "JPEG", quality=quality, optimize=True, progressive=True)
+    return path
+
+def _image_variants(path, work_dir, result, web=True):
+    from PIL import Image, ImageOps
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        result.setdefault("width", image.width)
+        result.setdefault("height", image.height)
+        result["variants"]["thumbnail"] = _resize(image, THUMBNAIL_SIZE, work_dir, 80)
+        if web and (image.width > WEB_SIZE[0] or image.height > WEB_SIZE[1]):
+            result["variants"]["web"] = _resize(image, WEB_SIZE, work_dir, 85)
+
+def _probe_video(path):
+    if not shutil.which("ffprobe"):
+        return {}
+    output = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height:format=duration",
+         "-of", "json", path],
+        capture_output=True, timeout=60, check=True
+    ).stdout
+    info = json.loads(output)
+    stream = (info.get("streams") or [{}])[0]
+    duration = info.get("format", {}).get("duration")
+    return {
+        "width": stream.get("width"),
+        "height": stream.get("height"),
+        "duration_seconds": float(duration) if duration else None
+    }
+
+def _video_frame(path, work_dir, at_seconds):
+    if not shutil.which("ffmpeg"):
+        return None
+    fd, frame = tempfile.mkstemp(dir=work_dir, prefix="frame-", suffix=".jpg")
+    os.close(fd)
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-ss", str(at_seconds), "-i", path, "-frames:v", "1", frame],
+                   capture_output=True, timeout=120, check=True)
+    return frame
+
+def process_media_file(path, content_type, work_dir):
+    """Extract metadata and build variants for one stored file. Returns a plain dict."""
+    result = {"file_size": os.path.getsize(path), "variants": {}}
+    if content_type == "image":
+        _image_variants(path, work_dir, result)
+    elif content_type == "video":
+        result.update(_probe_video(path))
+        duration = result.get("duration_seconds") or 0
+        frame = _video_frame(path, work_dir, min(1.0, duration / 2))
+        if frame:
+            try:
+                _image_variants(frame, work_dir, result, web=False)
+            finally:
+                os.remove(frame)
+    return result
+
+# --- Runs in the dispatcher process ---
+
+def _fail(item, error):
+    item.processing_status = FAILED
+    item.processing_error = str(error)[:255]
+
+def _apply(storage, item, result):
+    for name, variant_path in result.pop("variants").items():
+        setattr(item, f"{name}_key", storage.save_path(variant_path, "jpg"))
+    for column in ("file_size", "width", "height", "duration_seconds"):
+        if result.get(column) is not None:
+            setattr(item, column, result[column])
+    item.processing_status = READY
+    item.processing_error = None
+
+def _claimable(stale_before):
+    # A NULL lease is a row claimed before leases were recorded
+    return or_(Content.processing_status == PENDING,
+               and_(Content.processing_status == PROCESSING,
+                    or_(Content.processing_claimed_at.is_(None), Content.processing_claimed_at < stale_before)))
+
+def claim_batch(batch_size, lease_seconds=LEASE_SECONDS):
+    """Lease up to `batch_size` pending items (or items whose lease expired after a crash)."""
+    now = datetime.utcnow().replace(microsecond=0) # Round-trips through DATETIME columns unchanged
+    claimable = _claimable(now - timedelta(seconds=lease_seconds))
+    ids = [content_id for (content_id,) in db.session.query(Content.id).filter(
+        claimable, Content.deleted_at.is_(None)).order_by(Content.id).limit(batch_size)]
+    if not ids:
+        db.session.commit()
+        return []
+    # The guard keeps a concurrent dispatcher from taking the same items
+    claimed = Content.query.filter(Content.id.in_(ids), claimable).update(
+        {Content.processing_status: PROCESSING, Content.processing_claimed_at: now}, synchronize_session=False)
+    db.session.commit()
+    query = Content.query.filter(Content.id.in_(ids))
+    if claimed != len(ids):
+        query = query.filter(Content.processing_status == PROCESSING, Content.processing_claimed_at == now)
+    return query.order_by(Content.id).all()
+
+def renew_lease(ids, lease):
+    """Extend the lease on `ids`, claimed at `lease`. Returns (new lease, the ids still ours)."""
+    now = datetime.utcnow().replace(microsecond=0)
+    Content.query.filter(Content.id.in_(ids), Content.processing_status == PROCESSING,
+                         Content.processing_claimed_at == lease).update(
+        {Content.processing_claimed_at: now}, synchronize_session=False)
+    ours = {content_id for (content_id,) in db.session.query(Content.id).filter(
+        Content.id.in_(ids), Content.processing_status == PROCESSING, Content.processing_claimed_at == now)}
+    db.session.commit()
+    return now, ours
+
+def requeue_stalled(lease_seconds=LEASE_SECONDS):
+    """Items whose lease expired (their dispatcher died) go back to the queue; live leases are left alone."""
+    stale_before = datetime.utcnow() - timedelta(seconds=lease_seconds)
+    count = Content.query.filter(
+        Content.processing_status == PROCESSING,
+        or_(Content.processing_claimed_at.is_(None), Content.processing_claimed_at < stale_before)
+    ).update({Content.processing_status: PENDING}, synchronize_session=False)
+    db.session.commit()
+    return count
+
+def process_batch(executor, batch_size=DEFAULT_BATCH_SIZE):
+    """Process one batch of pending uploads. Returns the number of items handled."""
+    items = claim_batch(batch_size)
+    if not items:
+        return 0
+    lease = items[0].processing_claimed_at
+    coach_ids = [item.coach_id for item in items]
+    storage = get_storage()
+    work_dir = getattr(storage, "staging", tempfile.gettempdir())
+
+    futures = {}
+    for item in items:
+        path = storage.local_path(item.file_url) if item.file_url else None
+        if not path or not os.path.exists(path):
+            _fail(item, "Stored file not available locally")
+            continue
+        futures[executor.submit(process_media_file, path, item.content_type, work_dir)] = (item.id, item)
+    db.session.commit()
+
+    # Items are saved as they finish; the rest keep their lease for as long as the pool works on them
+    pending = set(futures)
+    while pending:
+        renew_at = lease + timedelta(seconds=RENEW_SECONDS)
+        done, pending = wait(pending, timeout=max((renew_at - datetime.utcnow()).total_seconds(), 0),
+                             return_when=FIRST_COMPLETED)
+        for future in done:
+            content_id, item = futures[future]
+            try:
+                _apply(storage, item, future.result())
+            except Exception as e:
+                current_app.logger.warning("Media processing failed for content %s: %s", content_id, e)
+                _fail(item, e)
+        db.session.commit()
+        if pending and datetime.utcnow() >= renew_at:
+            lease, ours = renew_lease([futures[future][0] for future in pending], lease)
+            for future in [future for future in pending if futures[future][0] not in ours]:
+                # Taken over (or deleted) meanwhile: the result is dropped, whoever holds it now saves theirs
+                current_app.logger.warning("Lost the media lease on content %s", futures[future][0])
+                pending.discard(future)
+    invalidate_coach_content(*coach_ids) # Listings show the new variants
+    return len(items)
+
+def make_executor(workers=None):
+    # spawn: children must not inherit the dispatcher's open database connections
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def run_worker(workers=None, batch_size=DEFAULT_BATCH_SIZE, poll_interval=2.0, stop=None):
+    requeue_stalled()
+    with make_executor(workers) as executor:
+        while not (stop and stop()):
+            if process_batch(executor, batch_size) == 0:
+                time.sleep(poll_interval)
@@ -0,0 +1,137 @@
+import base64
+import json
+from datetime import datetime
+from flask import request, jsonify, Response, stream_with_context
+from sqlalchemy import and_, or_
+from src.services.conditional import make_etag, conditional_response
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+# Cursors are opaque to clients: base64 of [sort value, id] of the last row returned.
+def encode_cursor(sort_value, row_id):
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor, sort_is_datetime=True):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if sort_is_datetime and sort_value is not None:
+            sort_value = datetime.fromisoformat(sort_value)
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def parse_datetime_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}, expected an ISO 8601 date or datetime")
+
+def apply_date_range(query, column):
+    since = parse_datetime_arg("since")
+    until = parse_datetime_arg("until")
+    if since:
+        query = query.filter(column >= since)
+    if until:
+        query = query.filter(column < until)
+    return query
+
+def after_cursor(query, sort_col, id_col, sort_value, row_id):
+    # Newest first: continue strictly below (sort_value, row_id)
+    if sort_col is None:
+        return query.filter(id_col < row_id)
+    return query.filter(or_(
+        sort_col < sort_value,
+        and_(sort_col == sort_value, id_col < row_id)
+    ))
+
+def ordered(query, sort_col, id_col):
+    if sort_col is None:
+        return query.order_by(id_col.desc())
+    return query.order_by(sort_col.desc(), id_col.desc())
+
+def row_cursor(row, sort_col, id_col):
+    sort_value = getattr(row, sort_col.key) if sort_col is not None else None
+    return encode_cursor(sort_value, getattr(row, id_col.key))
+
+def fetch_page(query, sort_col, id_col, cursor, limit):
+    """Return (rows, next_cursor) for one keyset page of `query`."""
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor, sort_is_datetime=sort_col is not None)
+        query = after_cursor(query, sort_col, id_col, sort_value, row_id)
+    rows = ordered(query, sort_col, id_col).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = row_cursor(rows[-1], sort_col, id_col)
+    return rows, next_cursor
+
+def iter_rows(query, sort_col, id_col, batch_size=STREAM_BATCH_SIZE, cursor=None):
+    """Walk the whole result set in keyset batches so only one batch is held in memory."""
+    while True:
+        rows, cursor = fetch_page(query, sort_col, id_col, cursor, batch_size)
+        for row in rows:
+            yield row
+        if not cursor:
+            return
+
+def _stream_ndjson(rows, serialize):
+    for row in rows:
+        yield json.dumps(serialize(row)) + "\n"
+
+def _stream_json_array(rows, serialize):
+    yield "["
+    first = True
+    for row in rows:
+        yield ("" if first else ",") + json.dumps(serialize(row))
+        first = False
+    yield "]"
+
+def paginated_response(query, sort_col, id_col, serialize, version=None, private=False, vary=()):
+    """Serve `query` according to the request's pagination arguments.
+
+    ?format=json (default) returns one page as a JSON list plus an X-Next-Cursor header.
+    ?format=ndjson and ?format=stream stream every matching row (from ?cursor onwards)
+    as newline-delimited JSON or a single JSON array, in constant memory.
+
+    With `version(row)` (e.g. id and updated_at) JSON pages get an ETag built from the
+    page's rows and answer a matching If-None-Match with a 304 (see conditional.py).
+    """
+    fmt = request.args.get("format", "json")
+    cursor = request.args.get("cursor")
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+
+    try:
+        if cursor:
+            decode_cursor(cursor, sort_is_datetime=sort_col is not None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if fmt == "json":
+        rows, next_cursor = fetch_page(query, sort_col, id_col, cursor, limit)
+        def build():
+            response = jsonify([serialize(row) for row in rows])
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            return response
+        if version is None:
+            return build(), 200
+        etag = make_etag(next_cursor, [version(row) for row in rows])
+        return conditional_response(build, etag, private=private, vary=vary)
+
+    rows = iter_rows(query, sort_col, id_col, cursor=cursor)
+    if fmt == "ndjson":
+        return Response(stream_with_context(_stream_ndjson(rows, serialize)), mimetype="application/x-ndjson")
+    if fmt == "stream":
+        return Response(stream_with_context(_stream_json_array(rows, serialize)), mimetype="application/json")
+    return jsonify({"error": "Invalid format. Must be 'json', 'ndjson' or 'stream'."}), 400
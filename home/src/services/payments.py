@@ -0,0 +1,133 @@
+import threading
+import time
+from flask import current_app
+from src.models.finance import Transaction
+
+# The stripe SDK takes about a second to import. It is loaded (and configured from the app
+# config) on first use, so pre-forked workers and CLI commands that never call Stripe start fast.
+_stripe = None
+_stripe_lock = threading.Lock()
+
+def get_stripe():
+    """The stripe module, imported and configured for the current app on first call."""
+    global _stripe
+    if _stripe is None:
+        with _stripe_lock:
+            if _stripe is None:
+                import stripe
+                configure_stripe(current_app, stripe)
+                _stripe = stripe
+    return _stripe
+
+def _transient_errors():
+    import stripe
+    return (stripe.error.APIConnectionError, stripe.error.RateLimitError, stripe.error.APIError)
+
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+    """Stop calling a dependency after repeated failures, then probe it again after a cool-down."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def call(self, f, *args, **kwargs):
+        with self._lock:
+            if self.opened_at is not None:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError("Circuit open")
+                # Half-open: let this call through as a probe, keep others out until it resolves
+                self.opened_at = time.monotonic()
+        try:
+            result = f(*args, **kwargs)
+        except Exception as e:
+            if isinstance(e, _transient_errors()):
+                self._record_failure()
+            else:
+                # It answered (e.g. no such payment intent), so it is up; this also closes a
+                # half-open circuit, which would otherwise stay open for another reset_timeout
+                self._record_success()
+            raise
+        self._record_success()
+        return result
+
+    def _record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    def _record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+class LedgerPaymentIntent:
+    """The subset of a Stripe PaymentIntent the routes need, read from a succeeded Transaction."""
+
+    def __init__(self, transaction):
+        self.id = transaction.stripe_payment_intent_id
+        self.status = "succeeded"
+        self.amount = int(round(transaction.amount * 100)) # Stripe amounts are in cents
+        self.currency = transaction.currency
+        self.source = "ledger"
+
+stripe_breaker = CircuitBreaker()
+
+def configure_stripe(app, stripe):
+    """Give the Stripe SDK a pooled keep-alive session with strict timeouts."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    config = app.config
+    stripe.api_key = config["STRIPE_SECRET_KEY"]
+    if config.get("STRIPE_API_BASE"):
+        stripe.api_base = config["STRIPE_API_BASE"]
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.get("STRIPE_POOL_SIZE", 10))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    timeout = (config.get("STRIPE_CONNECT_TIMEOUT", 2.0), config.get("STRIPE_READ_TIMEOUT", 5.0))
+    stripe.default_http_client = stripe.http_client.RequestsClient(timeout=timeout, session=session)
+    stripe.max_network_retries = config.get("STRIPE_MAX_NETWORK_RETRIES", 0)
+    stripe_breaker.failure_threshold = config.get("STRIPE_BREAKER_THRESHOLD", 5)
+    stripe_breaker.reset_timeout = config.get("STRIPE_BREAKER_RESET_SECONDS", 30.0)
+
+def retrieve_payment_intent(payment_intent_id, fan_id, item_type, item_id):
+    """Look up the fan's payment intent for an item in the webhook-populated ledger, falling back to Stripe.
+
+    Returns None if the intent was made by another fan or for another item (`item_type` and
+    `item_id` as in create_payment_intent's metadata). Whether the intent was already spent is
+    up to the caller: subscriptions and purchases record theirs under a unique index.
+    Raises CircuitOpenError while Stripe is considered down, and stripe.error.StripeError
+    for errors from Stripe itself.
+    """
+    query = Transaction.query.filter_by(stripe_payment_intent_id=payment_intent_id, status="succeeded",
+                                        user_id=int(fan_id))
+    if item_type == "content_ppv":
+        query = query.filter_by(transaction_type="ppv_purchase", content_id=int(item_id))
+    else:
+        query = query.filter_by(transaction_type="subscription_payment", coach_id=int(item_id))
+    transaction = query.first()
+    if transaction:
+        return LedgerPaymentIntent(transaction)
+    # Not in the ledger yet, or not this fan's payment for this item: ask Stripe, which has the metadata
+    payment_intent = stripe_breaker.call(get_stripe().PaymentIntent.retrieve, payment_intent_id)
+    metadata = payment_intent.get("metadata") or {}
+    if (metadata.get("user_id"), metadata.get("item_type"), metadata.get("item_id")) != (
+            str(fan_id), item_type, str(item_id)):
+        return None
+    return payment_intent
@@ -0,0 +1,275 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, insert, update, delete, select, and_, or_
+from sqlalchemy.exc import IntegrityError
+from src.models.user import User, db
+from src.models.finance import Transaction, Payout, RollupWatermark
+from src.services.payments import get_stripe, stripe_breaker, CircuitOpenError
+from src.services.earnings import cents_sql, to_cents
+
+# Payouts run in two restartable phases:
+#
+# 1. compute_payouts() aggregates every coach's unpaid succeeded transactions in one GROUP BY,
+#    bulk-inserts a pending Payout per (coach, currency) and points the transactions at it,
+#    all in a single DB transaction. A crash leaves either nothing or a complete run behind.
+#    Runs are serialized on the "payouts" watermark row; a payout that still ends up with no
+#    transactions linked is dropped before the run commits.
+# 2. execute_payouts() sends the transfers with bounded concurrency. Each payout has a fixed
+#    idempotency key and transfer group and is marked "processing" before its transfer is
+#    sent, so a retry after a crash finds or replays the original transfer instead of paying twice.
+#
+# Payouts from before the engine are adopted by `flask upgrade-schema` (adopt_legacy_payouts),
+# which also marks the transactions they settled as paid.
+
+DEFAULT_CONCURRENCY = 10 # Keep at or below STRIPE_POOL_SIZE so every transfer reuses a pooled connection
+DEFAULT_MINIMUM_CENTS = 100
+DEFAULT_CHUNK_SIZE = 500
+INSERT_CHUNK_SIZE = 1000
+STALE_CLAIM_SECONDS = 600 # A "processing" payout older than this belongs to a crashed run
+COMPUTE_LOCK = "payouts" # RollupWatermark row; covered_until is the start of the last compute run
+
+class TransferDeclined(Exception):
+    """The transfer was rejected outright; retrying it unchanged will not help."""
+
+class StripeTransferClient:
+    """Creates Stripe Connect transfers. Anything with the same two methods can replace it."""
+
+    def __init__(self):
+        # Resolved here, inside the app context: the methods run on pool threads
+        self.stripe = get_stripe()
+
+    def create_transfer(self, amount_cents, currency, destination, idempotency_key, transfer_group, metadata=None):
+        stripe = self.stripe
+        try:
+            transfer = stripe_breaker.call(stripe.Transfer.create, amount=amount_cents, currency=currency,
+                                           destination=destination, transfer_group=transfer_group,
+                                           metadata=metadata or {}, idempotency_key=idempotency_key)
+        except (stripe.error.InvalidRequestError, stripe.error.PermissionError) as e:
+            raise TransferDeclined(e.user_message or str(e))
+        return transfer.id
+
+    def find_transfer(self, transfer_group):
+        """Id of an existing transfer in `transfer_group`, or None."""
+        transfers = stripe_breaker.call(self.stripe.Transfer.list, transfer_group=transfer_group, limit=1)
+        return transfers.data[0].id if transfers.data else None
+
+def get_transfer_client(app=None):
+    app = app or current_app
+    client = app.extensions.get("payout_transfer_client")
+    if client is None:
+        client = app.extensions["payout_transfer_client"] = StripeTransferClient()
+    return client
+
+def transfer_group(payout_id):
+    return f"payout_{payout_id}"
+
+def _unpaid():
+    return (Transaction.status == "succeeded", Transaction.payout_id.is_(None), Transaction.coach_id.isnot(None))
+
+def _net_cents():
+    # Gross and fee rounded separately, exactly as the earnings rollups count them
+    return func.sum(cents_sql(Transaction.amount)) - func.sum(cents_sql(func.coalesce(Transaction.platform_fee, 0)))
+
+def _lock_compute_runs(now):
+    """Hold the compute lock until the current DB transaction ends.
+
+    The row is written, not just read, so SQLite takes its write lock here too, before the
+    balances are read: a second run then only sees what the first one left unpaid.
+    """
+    while True:
+        if db.session.execute(update(RollupWatermark).where(RollupWatermark.name == COMPUTE_LOCK).values(
+                covered_until=now)).rowcount:
+            return
+        db.session.add(RollupWatermark(name=COMPUTE_LOCK, covered_until=now))
+        try:
+            db.session.flush()
+            return
+        except IntegrityError:
+            db.session.rollback() # Another run created it first: wait on the row like any later run
+
+def adopt_legacy_payouts(log=print):
+    """Bring payouts created before the payout engine under it. Safe to run repeatedly.
+
+    Legacy payouts were never linked to transactions. A coach's unpaid succeeded transactions
+    created up to their latest legacy payout that did not fail (per currency) are linked to it,
+    so compute_payouts() does not pay them again. Every legacy payout then gets an idempotency
+    key and amount_cents, and pending ones are sent like any other.
+    Returns (payouts adopted, transactions linked).
+    """
+    legacy = db.session.query(Payout.id, Payout.coach_id, Payout.currency, Payout.status, Payout.requested_at,
+                              Payout.amount).filter(Payout.idempotency_key.is_(None)).order_by(Payout.id).all()
+    if not legacy:
+        return 0, 0
+    latest = {}
+    for payout in legacy:
+        if payout.status == "failed" or payout.requested_at is None:
+            continue
+        current = latest.get((payout.coach_id, payout.currency))
+        if current is None or payout.requested_at >= current.requested_at:
+            latest[(payout.coach_id, payout.currency)] = payout
+    linked = 0
+    for (coach_id, currency), payout in latest.items():
+        linked += db.session.execute(update(Transaction).where(
+            *_unpaid(), Transaction.coach_id == coach_id, Transaction.currency == currency,
+            Transaction.created_at <= payout.requested_at
+        ).values(payout_id=payout.id).execution_options(synchronize_session=False)).rowcount
+    counts = dict(db.session.query(Transaction.payout_id, func.count()).filter(
+        Transaction.payout_id.in_(list(payout.id for payout in latest.values()))).group_by(Transaction.payout_id).all()) \
+        if latest else {}
+    db.session.execute(update(Payout), [{
+        "id": payout.id,
+        "idempotency_key": f"legacy-payout-{payout.id}",
+        "amount_cents": to_cents(payout.amount),
+        "transaction_count": counts.get(payout.id, 0),
+        "attempts": 0
+    } for payout in legacy])
+    db.session.commit()
+    log(f"Adopted {len(legacy)} legacy payout(s), linked {linked} settled transaction(s)")
+    return len(legacy), linked
+
+def compute_payouts(minimum_cents=None):
+    """Create pending payouts for every coach owed at least `minimum_cents`. Returns (run_id, count)."""
+    if minimum_cents is None:
+        minimum_cents = current_app.config.get("PAYOUT_MINIMUM_CENTS", DEFAULT_MINIMUM_CENTS)
+    run_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    _lock_compute_runs(now)
+    high_water = db.session.query(func.max(Transaction.id)).scalar()
+    if high_water is None:
+        db.session.commit()
+        return run_id, 0
+
+    balances = db.session.query(Transaction.coach_id, Transaction.currency).filter(
+        *_unpaid(), Transaction.id <= high_water
+    ).group_by(Transaction.coach_id, Transaction.currency).having(_net_cents() >= minimum_cents)
+    rows = [{
+        "coach_id": coach_id,
+        "currency": currency,
+        "amount": 0.0,
+        "status": "pending",
+        "requested_at": now,
+        "run_id": run_id,
+        "idempotency_key": f"payout-{run_id}-{coach_id}-{currency}",
+        "attempts": 0
+    } for coach_id, currency in balances]
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        db.session.execute(insert(Payout), rows[start:start + INSERT_CHUNK_SIZE])
+
+    # Link the transactions, then total the payouts from what was actually linked, so a
+    # transaction committed between the two statements can never be marked paid but unpaid for.
+    payout_for_row = select(Payout.id).where(
+        Payout.run_id == run_id, Payout.coach_id == Transaction.coach_id, Payout.currency == Transaction.currency
+    ).scalar_subquery()
+    in_run = select(Payout.coach_id).where(Payout.run_id == run_id)
+    db.session.execute(update(Transaction).where(*_unpaid(), Transaction.id <= high_water, Transaction.coach_id.in_(in_run))
+                       .values(payout_id=payout_for_row).execution_options(synchronize_session=False))
+    linked = select(Transaction.payout_id).where(Transaction.payout_id == Payout.id)
+    db.session.execute(update(Payout).where(Payout.run_id == run_id).values(
+        amount_cents=linked.with_only_columns(_net_cents()).scalar_subquery(),
+        transaction_count=linked.with_only_columns(func.count()).scalar_subquery()
+    ).execution_options(synchronize_session=False))
+    # Balances whose transactions were paid or changed since the GROUP BY have nothing to send
+    empty = db.session.execute(delete(Payout).where(Payout.run_id == run_id, Payout.transaction_count == 0)
+                               .execution_options(synchronize_session=False)).rowcount
+    db.session.execute(update(Payout).where(Payout.run_id == run_id).values(amount=Payout.amount_cents / 100.0)
+                       .execution_options(synchronize_session=False))
+    db.session.commit()
+    return run_id, len(rows) - empty
+
+def _send(client, payout):
+    """Runs on a pool thread: no database access here."""
+    import stripe # Only for the error classes; already loaded unless a fake client is in use
+    payout_id, amount_cents, currency, idempotency_key, attempts, destination = payout
+    if not amount_cents or amount_cents <= 0:
+        # Nothing linked to pay out (e.g. left behind by an older, unserialized compute run)
+        return payout_id, None, "No transactions linked to this payout", False
+    group = transfer_group(payout_id)
+    try:
+        if attempts > 1:
+            # A previous attempt may have gone through; idempotency keys alone expire after a day
+            existing = client.find_transfer(group)
+            if existing:
+                return payout_id, existing, None, False
+        transfer_id = client.create_transfer(int(amount_cents), currency, destination, idempotency_key, group,
+                                             {"payout_id": str(payout_id)})
+        return payout_id, transfer_id, None, False
+    except TransferDeclined as e:
+        return payout_id, None, str(e)[:255], False
+    except (CircuitOpenError, stripe.error.StripeError) as e:
+        return payout_id, None, str(e)[:255] or type(e).__name__, True
+
+def _claimable(stale_before):
+    return or_(Payout.status == "pending",
+               and_(Payout.status == "processing", Payout.claimed_at < stale_before))
+
+def execute_payouts(client=None, concurrency=None, chunk_size=DEFAULT_CHUNK_SIZE, payout_ids=None, log=print):
+    """Send transfers for pending payouts (and ones a crashed run left behind).
+
+    Returns counts by outcome. Payouts whose coach has no connected account stay pending.
+    """
+    client = client or get_transfer_client()
+    concurrency = concurrency or current_app.config.get("PAYOUT_CONCURRENCY", DEFAULT_CONCURRENCY)
+    totals = {"completed": 0, "failed": 0, "retry": 0, "skipped": 0}
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="payout") as pool:
+        while True:
+            now = datetime.utcnow().replace(microsecond=0) # Round-trips through DATETIME columns unchanged
+            query = db.session.query(Payout.id, Payout.amount_cents, Payout.currency, Payout.idempotency_key,
+                                     Payout.attempts, User.stripe_account_id).join(User, User.id == Payout.coach_id).filter(
+                _claimable(now - timedelta(seconds=STALE_CLAIM_SECONDS)), Payout.id > last_id,
+                Payout.idempotency_key.isnot(None))
+            if payout_ids is not None:
+                query = query.filter(Payout.id.in_(payout_ids))
+            chunk = query.order_by(Payout.id).limit(chunk_size).all()
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+            ready = [row for row in chunk if row[5]]
+            totals["skipped"] += len(chunk) - len(ready)
+            if not ready:
+                continue
+
+            # Claim before sending: the guard on status keeps a concurrent run from taking the same payouts
+            claimed = db.session.execute(update(Payout).where(
+                Payout.id.in_([row[0] for row in ready]), _claimable(now - timedelta(seconds=STALE_CLAIM_SECONDS))
+            ).values(status="processing", claimed_at=now, attempts=func.coalesce(Payout.attempts, 0) + 1)
+             .execution_options(synchronize_session=False)).rowcount
+            db.session.commit()
+            if claimed != len(ready):
+                # Lost a race with another run; only keep the rows that are now ours
+                ours = {payout_id for (payout_id,) in db.session.query(Payout.id).filter(
+                    Payout.id.in_([row[0] for row in ready]), Payout.status == "processing", Payout.claimed_at == now)}
+                ready = [row for row in ready if row[0] in ours]
+            ready = [row[:4] + ((row[4] or 0) + 1,) + row[5:] for row in ready]
+
+            results = list(pool.map(lambda payout: _send(client, payout), ready))
+            _record_results(results, totals)
+            log(f"Payouts up to #{last_id}: {totals}")
+    return totals
+
+def _record_results(results, totals):
+    now = datetime.utcnow()
+    updates = []
+    failed_ids = []
+    for payout_id, transfer_id, error, transient in results:
+        if transfer_id:
+            updates.append({"id": payout_id, "status": "completed", "stripe_transfer_id": transfer_id,
+                            "processed_at": now, "failure_reason": None})
+            totals["completed"] += 1
+        elif transient:
+            # Safe to retry later: the same idempotency key / transfer group is reused
+            updates.append({"id": payout_id, "status": "pending", "failure_reason": error})
+            totals["retry"] += 1
+        else:
+            updates.append({"id": payout_id, "status": "failed", "processed_at": now, "failure_reason": error})
+            failed_ids.append(payout_id)
+            totals["failed"] += 1
+    if updates:
+        db.session.execute(update(Payout), updates)
+    if failed_ids:
+        # Nothing was paid: release the transactions so the next compute run includes them again
+        db.session.execute(update(Transaction).where(Transaction.payout_id.in_(failed_ids)).values(payout_id=None)
+                           .execution_options(synchronize_session=False))
+    db.session.commit()
@@ -0,0 +1,110 @@
+import re
+from datetime import datetime
+from sqlalchemy import select, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from src.models.user import db
+from src.models.content import Content
+from src.models.monetization import Subscription, PayPerViewPurchase
+from src.models.finance import Transaction, Payout, RevenueBucket
+from src.services.pagination import after_cursor, ordered
+from src.services import search, feed, ledger_export, subscription_expiry, content_purge
+
+class explain(Executable, ClauseElement):
+    """EXPLAIN wrapper so statements keep their bound parameters."""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = "EXPLAIN QUERY PLAN " if compiler.dialect.name == "sqlite" else "EXPLAIN "
+    sql = prefix + compiler.process(element.statement, **kw)
+    # The plan's rows are not the statement's: don't type them with its column types
+    compiler._result_columns = []
+    return sql
+
+def hot_query_shapes():
+    """The filters the routes run on every request, built the same way the routes build them.
+
+    Maps name -> (statement, ordered_scan_ok). Keyset page queries legitimately walk an
+    index in order; every other shape must be an index seek.
+    """
+    now = datetime.utcnow()
+    return {
+        "access: active subscription": (Subscription.query.filter_by(
+            fan_id=1, coach_id=2, is_active=True).filter(Subscription.end_date > now).statement, False),
+        "access: batch subscriptions": (select(Subscription.coach_id, func.max(Subscription.end_date)).where(
+            Subscription.fan_id == 1, Subscription.coach_id.in_([2, 3]),
+            Subscription.is_active == True, Subscription.end_date > now).group_by(Subscription.coach_id), False),
+        "sweeper: overdue subscriptions": (subscription_expiry.overdue_query(now).statement, False),
+        "access: ppv purchase": (PayPerViewPurchase.query.filter_by(fan_id=1, content_id=2).statement, False),
+        "access: batch ppv purchases": (select(PayPerViewPurchase.content_id).where(
+            PayPerViewPurchase.fan_id == 1, PayPerViewPurchase.content_id.in_([2, 3])), False),
+        "content: coach listing": (Content.query.filter_by(coach_id=1, deleted_at=None).order_by(
+            Content.created_at.desc()).statement, False),
+        "admin: content page": (ordered(after_cursor(Content.query.filter(Content.deleted_at.is_(None)),
+                                                     Content.created_at, Content.id, now, 10),
+                                        Content.created_at, Content.id).limit(101).statement, True),
+        "admin: transactions page": (ordered(after_cursor(Transaction.query, Transaction.created_at, Transaction.id, now, 10),
+                                             Transaction.created_at, Transaction.id).limit(101).statement, True),
+        "admin: coach transactions by status": (Transaction.query.filter_by(coach_id=1, status="succeeded").statement, False),
+        "admin: payouts page": (ordered(after_cursor(Payout.query, Payout.requested_at, Payout.id, now, 10),
+                                        Payout.requested_at, Payout.id).limit(101).statement, True),
+        "admin: transaction export chunk": (ledger_export.chunk_query(
+            "transactions", since=now, until=now, after=(now, 10)), True),
+        "admin: coach transaction export chunk": (ledger_export.chunk_query(
+            "transactions", since=now, until=now, coach_id=1, after=(now, 10)), True),
+        "analytics: revenue buckets": (select(RevenueBucket.currency, func.sum(RevenueBucket.gross_cents)).where(
+            RevenueBucket.grain == "month", RevenueBucket.coach_id == 0, RevenueBucket.period >= now.date(),
+            RevenueBucket.period < now.date()).group_by(RevenueBucket.currency), False),
+        "analytics: coach revenue buckets": (select(RevenueBucket.currency, func.sum(RevenueBucket.gross_cents)).where(
+            RevenueBucket.grain == "day", RevenueBucket.coach_id == 1, RevenueBucket.period >= now.date(),
+            RevenueBucket.period < now.date()).group_by(RevenueBucket.currency), False),
+        "analytics: revenue tail": (select(Transaction.currency, func.count()).where(
+            Transaction.status == "succeeded", Transaction.created_at >= now).group_by(Transaction.currency), False),
+        "purger: deleted content": (content_purge.pending_query(10).statement, False),
+        "purger: content transactions": (select(Transaction.id).where(Transaction.content_id == 1).limit(500), False),
+        "purger: content purchases": (select(PayPerViewPurchase.id).where(PayPerViewPurchase.content_id == 1).limit(500),
+                                      False),
+        "purger: shared file": (select(Content.id).where(Content.file_url == "x", Content.id != 1), False),
+        "webhook: payment intent lookup": (Transaction.query.filter_by(stripe_payment_intent_id="pi_x").statement, False),
+        "content: feed": (feed.newest_query(2, with_after=True).params(
+            coach_0=1, coach_1=2, after_created_at=now, after_id=10, limit=21), True),
+        "content: search one term": (search.ranked_query(["yoga"], {"yoga": 10}, 100,
+                                                         after=(500, 10))[0].limit(21).statement, True),
+        "content: search": (search.ranked_query(["yoga", "flow"], {"yoga": 10, "flow": 5}, 100,
+                                                content_type="video", after=(500, 10))[0].statement, False),
+    }
+
+_SQLITE_SCAN = re.compile(r"^SCAN (\S+)( USING (COVERING )?INDEX \S+)?$")
+
+def _full_scans(dialect, rows, ordered_scan_ok):
+    # Only base tables count: reading a derived table (a UNION branch's bounded result) is cheap
+    tables = set(db.metadata.tables)
+    scans = []
+    for row in rows:
+        row = row._mapping
+        if dialect == "sqlite":
+            match = _SQLITE_SCAN.match(row["detail"])
+            if match and match.group(1) in tables and not (match.group(2) and ordered_scan_ok):
+                scans.append(match.group(1))
+        elif row.get("table") in tables and (row.get("type") == "ALL" or (row.get("type") == "index" and not ordered_scan_ok)):
+            scans.append(row["table"])
+    return scans
+
+def check_query_plans():
+    """EXPLAIN every hot query shape; returns {name: [tables fully scanned]} for the failures.
+
+    MySQL may legitimately prefer a table scan on nearly empty tables, so run this
+    against a database with representative row counts (SQLite plans from schema alone).
+    """
+    dialect = db.engine.dialect.name
+    failures = {}
+    with db.engine.connect() as conn:
+        for name, (statement, ordered_scan_ok) in hot_query_shapes().items():
+            scans = _full_scans(dialect, conn.execute(explain(statement)).fetchall(), ordered_scan_ok)
+            if scans:
+                failures[name] = scans
+    return failures
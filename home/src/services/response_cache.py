@@ -0,0 +1,251 @@
+import json
+import threading
+import time
+import uuid
+from datetime import datetime
+from flask import current_app
+from src.services.entitlements import LRUTTLCache
+
+# Two-tier cache for hot read views (coach listings, profiles). Values are JSON-able
+# objects built from the database, not HTTP responses, so per-fan annotation and signed
+# URLs are still applied per request.
+#
+# - Local tier: an LRU in each worker process. Its TTL is short because invalidation only
+#   reaches the local tier of the worker that made the change.
+# - Shared tier (optional, RESPONSE_CACHE_URL): anything speaking the Redis protocol, so
+#   every worker reuses a value loaded once. Every key has a generation counter there: writes
+#   increment it and delete the entry, and a value is stored tagged with the generation read
+#   before it was loaded, so a load that raced a write is never served. Only the tier's own
+#   counter is compared, never clocks of different hosts.
+#
+# A miss is loaded once: threads of one worker wait on a per-key lock, and workers wait on a
+# short-lived lock key in the shared tier, so a popular entry expiring triggers one query
+# instead of one per waiting request. If the shared tier is unreachable it is skipped.
+
+DEFAULT_LOCAL_SIZE = 10000
+DEFAULT_LOCAL_TTL = 5.0
+DEFAULT_SHARED_TTL = 300
+DEFAULT_LOCK_TIMEOUT = 2.0
+LOCK_STRIPES = 256
+POLL_INTERVAL = 0.02
+SHARED_RETRY_SECONDS = 5 # After a shared tier error, run on the local tier alone this long
+
+def _encode(value):
+    def default(obj):
+        if isinstance(obj, datetime):
+            return {"$dt": obj.isoformat()}
+        raise TypeError(f"Cannot cache {type(obj).__name__}")
+    return json.dumps(value, default=default, separators=(",", ":"))
+
+def _decode(data):
+    def object_hook(obj):
+        if len(obj) == 1 and "$dt" in obj:
+            return datetime.fromisoformat(obj["$dt"])
+        return obj
+    return json.loads(data, object_hook=object_hook)
+
+class SharedTier:
+    """The shared tier over a Redis client (redis-py, or anything with get/mget/set/delete/incr)."""
+
+    def __init__(self, client, prefix="rc:", errors=(OSError,), retry_seconds=SHARED_RETRY_SECONDS):
+        self.client = client
+        self.prefix = prefix
+        self.errors = errors
+        self.retry_seconds = retry_seconds
+        self.failures = 0
+        self._down_until = 0
+
+    def available(self):
+        return time.monotonic() >= self._down_until
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            return getattr(self.client, method)(*args, **kwargs)
+        except self.errors as e:
+            self.failures += 1
+            if self.available():
+                current_app.logger.warning("Response cache shared tier unavailable: %s", e)
+            self._down_until = time.monotonic() + self.retry_seconds
+            return None
+
+    def get(self, key):
+        """(data, generation) for `key`; data may be None, both are None if the tier failed."""
+        result = self._call("mget", [self.prefix + key, self.prefix + "gen:" + key])
+        if not result:
+            return None, None
+        data, generation = result
+        return data, int(generation or 0)
+
+    def generation(self, key):
+        """Current generation of `key` (0 if never invalidated), or None if the tier failed."""
+        result = self._call("mget", [self.prefix + "gen:" + key])
+        return int(result[0] or 0) if result else None
+
+    def set(self, key, data, ttl):
+        self._call("set", self.prefix + key, data, ex=int(ttl))
+
+    def invalidate(self, keys):
+        # Generations never expire: one small counter per key ever written
+        for key in keys:
+            self._call("incr", self.prefix + "gen:" + key)
+        if keys:
+            self._call("delete", *[self.prefix + key for key in keys])
+
+    def lock(self, key, timeout):
+        """Try to become the one loader of `key`; returns a token, or None if another holds it."""
+        token = uuid.uuid4().hex
+        acquired = self._call("set", self.prefix + "lock:" + key, token, nx=True, px=int(timeout * 1000))
+        return token if acquired else None
+
+    def unlock(self, key, token):
+        current = self._call("get", self.prefix + "lock:" + key)
+        if current is not None and (current.decode() if isinstance(current, bytes) else current) == token:
+            self._call("delete", self.prefix + "lock:" + key)
+
+class ResponseCache:
+    def __init__(self, local_size=DEFAULT_LOCAL_SIZE, local_ttl=DEFAULT_LOCAL_TTL, shared=None,
+                 shared_ttl=DEFAULT_SHARED_TTL, lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        self.local = LRUTTLCache(max_size=local_size, ttl=local_ttl)
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self.lock_timeout = lock_timeout
+        self._stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._counts_lock = threading.Lock()
+        self.counts = {"shared_hits": 0, "loads": 0, "lock_waits": 0}
+
+    def _count(self, name):
+        with self._counts_lock:
+            self.counts[name] += 1
+
+    def get_or_load(self, key, loader):
+        """Cached value of `key`, calling `loader()` at most once across waiting requests on a miss.
+
+        A loader returning None is not cached (e.g. not found), so the caller sees None.
+        """
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        with self._stripes[hash(key) % LOCK_STRIPES]:
+            value = self.local.get(key) # Filled while this thread waited for the lock
+            if value is not None:
+                return value
+            if self.shared is None or not self.shared.available():
+                return self._load(key, loader)
+            value, generation = self._from_shared(key)
+            if value is not None:
+                return value
+            token = self.shared.lock(key, self.lock_timeout)
+            if token is not None:
+                return self._load_locked(key, loader, generation, token)
+
+        # Another worker is loading it: wait for its result, or take over once its lock is
+        # released without a result (e.g. not found); give up after lock_timeout. Polled
+        # without the stripe lock, which would otherwise stall every key hashed to the stripe.
+        self._count("lock_waits")
+        deadline = time.monotonic() + self.lock_timeout
+        while token is None and self.shared.available() and time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            value, generation = self._from_shared(key)
+            if value is not None:
+                return value
+            token = self.shared.lock(key, self.lock_timeout)
+        return self._load_locked(key, loader, generation, token)
+
+    def _load_locked(self, key, loader, generation, token):
+        try:
+            return self._load(key, loader, generation)
+        finally:
+            if token is not None:
+                self.shared.unlock(key, token)
+
+    def _from_shared(self, key):
+        """(value, generation) of `key` in the shared tier; the value is None on a miss."""
+        data, generation = self.shared.get(key)
+        if data is None:
+            return None, generation
+        stored_generation, value = _decode(data)
+        if stored_generation != generation:
+            return None, generation # Loaded from data that a write has since replaced
+        self._count("shared_hits")
+        self.local.set(key, value)
+        return value, generation
+
+    def _load(self, key, loader, generation=None):
+        # `generation` was read before loading; None (no shared tier, or it failed) skips the store
+        self._count("loads")
+        value = loader()
+        if value is not None:
+            if generation is not None and self.shared.available():
+                self.shared.set(key, _encode([generation, value]), self.shared_ttl)
+            self.local.set(key, value)
+        return value
+
+    def generation(self, key):
+        """Shared generation of `key`, or None without a reachable shared tier."""
+        if self.shared is None or not self.shared.available():
+            return None
+        return self.shared.generation(key)
+
+    def invalidate(self, *keys):
+        for key in keys:
+            self.local.delete(key)
+        if self.shared is not None:
+            # Attempted even while the tier looks down: a missed delete would outlive the outage
+            self.shared.invalidate(keys)
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        stats = dict(self.local.stats(), **self.counts)
+        stats["shared"] = self.shared is not None
+        stats["shared_failures"] = self.shared.failures if self.shared is not None else 0
+        return stats
+
+def _shared_tier(url):
+    import redis # Optional dependency, only needed with RESPONSE_CACHE_URL
+    client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return SharedTier(client, errors=(redis.exceptions.RedisError, OSError))
+
+def get_response_cache(app=None):
+    app = app or current_app
+    cache = app.extensions.get("response_cache")
+    if cache is None:
+        config = app.config
+        url = config.get("RESPONSE_CACHE_URL")
+        cache = app.extensions["response_cache"] = ResponseCache(
+            local_size=config.get("RESPONSE_CACHE_LOCAL_SIZE", DEFAULT_LOCAL_SIZE),
+            local_ttl=config.get("RESPONSE_CACHE_LOCAL_TTL", DEFAULT_LOCAL_TTL),
+            shared=_shared_tier(url) if url else None,
+            shared_ttl=config.get("RESPONSE_CACHE_TTL", DEFAULT_SHARED_TTL),
+            lock_timeout=config.get("RESPONSE_CACHE_LOCK_TIMEOUT", DEFAULT_LOCK_TIMEOUT))
+    return cache
+
+def coach_content_key(coach_id):
+    return f"coach-content:{int(coach_id)}"
+
+def profile_key(user_id):
+    return f"profile:{int(user_id)}"
+
+def fan_key(fan_id):
+    # Never cached itself: only its generation is used, by the entitlement and feed caches
+    return f"fan:{int(fan_id)}"
+
+def invalidate_coach_content(*coach_ids):
+    get_response_cache().invalidate(*[coach_content_key(coach_id) for coach_id in set(coach_ids)])
+
+def invalidate_profile(user_id):
+    get_response_cache().invalidate(profile_key(user_id))
+
+def metric_lines():
+    cache = current_app.extensions.get("response_cache")
+    if cache is None:
+        return []
+    stats = cache.stats()
+    lines = []
+    for name in ("hits", "misses", "evictions", "invalidations"):
+        lines += [f"# TYPE response_cache_local_{name}_total counter", f"response_cache_local_{name}_total {stats[name]}"]
+    for name in ("shared_hits", "loads", "lock_waits", "shared_failures"):
+        lines += [f"# TYPE response_cache_{name}_total counter", f"response_cache_{name}_total {stats[name]}"]
+    lines += ["# TYPE response_cache_local_size gauge", f"response_cache_local_size {stats['size']}"]
+    return lines
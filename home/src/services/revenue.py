@@ -0,0 +1,244 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db
+from src.models.finance import Transaction, RevenueBucket, RollupWatermark
+from src.services.earnings import add_to_rollup, cents_sql
+
+# Revenue analytics (/api/admin/analytics/revenue): gross/fee/net/count of succeeded
+# transactions by day, week or month and by coach, type and currency.
+#
+# RevenueBucket holds the totals at two grains, day and month, each both per coach and
+# platform-wide. A query reads the coarsest rows that fit: month rows for the whole months of
+# the range, day rows for the edge days and for day/week series, and platform rows unless a
+# coach is asked for. Two years of platform revenue is a few hundred rows, whatever the size
+# of the ledger.
+#
+# The buckets cover the ledger up to a watermark. `flask refresh-revenue` (run it from cron
+# every few minutes) folds in the rows created since, a batch of days at a time, leaving out the
+# last REFRESH_LAG so transactions still being committed are not skipped. Rows past the
+# watermark, the recent tail, are aggregated exactly from Transaction by each query, a short
+# range read on ix_transaction_created. Rows changed or backdated behind the watermark are
+# picked up by `flask rebuild-revenue`.
+
+WATERMARK = "revenue"
+ALL_COACHES = 0
+NO_COACH = -1 # Stands in for a NULL coach_id in per-coach rows
+REFRESH_LAG = timedelta(minutes=5)
+REFRESH_DAYS_PER_BATCH = 31
+BUCKETS = ("day", "week", "month")
+DIMENSIONS = ("coach", "type", "currency")
+
+def _month(day):
+    return day.replace(day=1)
+
+def _next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+def _period(bucket, day):
+    if bucket == "week":
+        return day - timedelta(days=day.weekday()) # Weeks start on Monday
+    if bucket == "month":
+        return _month(day)
+    return day if bucket == "day" else None
+
+def _as_date(value):
+    # func.date() comes back as a string on SQLite
+    return datetime.strptime(value, "%Y-%m-%d").date() if isinstance(value, str) else value
+
+def _midnight(day):
+    return datetime.combine(day, datetime.min.time())
+
+def covered_until():
+    watermark = db.session.get(RollupWatermark, WATERMARK)
+    return watermark.covered_until if watermark else None
+
+def _ledger_totals(start, end, keys, filters=()):
+    """Succeeded transactions created in [start, end) grouped by `keys`, plus gross, fee and count in cents."""
+    query = db.session.query(*keys, func.sum(cents_sql(Transaction.amount)),
+                             func.sum(cents_sql(func.coalesce(Transaction.platform_fee, 0))),
+                             func.count()).filter(Transaction.status == "succeeded", *filters)
+    if start:
+        query = query.filter(Transaction.created_at >= start)
+    if end:
+        query = query.filter(Transaction.created_at < end)
+    return query.group_by(*keys).all()
+
+def _fold(start, end):
+    """Add the transactions created in [start, end) to the buckets; returns the ledger groups folded."""
+    rows = _ledger_totals(start, end, [func.date(Transaction.created_at), Transaction.coach_id,
+                                       Transaction.transaction_type, Transaction.currency])
+    values = {}
+    for day, coach_id, transaction_type, currency, gross, fee, count in rows:
+        day = _as_date(day)
+        coach_id = NO_COACH if coach_id is None else coach_id
+        for grain, period in (("day", day), ("month", _month(day))):
+            for coach in (coach_id, ALL_COACHES):
+                total = values.setdefault((grain, period, coach, transaction_type, currency), [0, 0, 0])
+                total[0] += int(gross)
+                total[1] += int(fee)
+                total[2] += count
+    add_to_rollup(RevenueBucket.__table__, [
+        {"grain": grain, "period": period, "coach_id": coach, "transaction_type": transaction_type,
+         "currency": currency, "gross_cents": gross, "fee_cents": fee, "net_cents": gross - fee,
+         "transaction_count": count}
+        for (grain, period, coach, transaction_type, currency), (gross, fee, count) in values.items()])
+    return len(rows)
+
+def _advance(previous, covered):
+    """Move the watermark from `previous` to `covered`; False if another refresh moved it first."""
+    if previous is None:
+        db.session.add(RollupWatermark(name=WATERMARK, covered_until=covered))
+        try:
+            db.session.flush()
+        except IntegrityError:
+            return False
+        return True
+    result = db.session.execute(update(RollupWatermark).where(
+        RollupWatermark.name == WATERMARK, RollupWatermark.covered_until == previous).values(covered_until=covered))
+    return result.rowcount == 1
+
+def refresh(now=None, log=print):
+    """Fold the ledger rows created since the watermark (up to now - REFRESH_LAG) into the buckets."""
+    target = (now or datetime.utcnow()) - REFRESH_LAG
+    covered = covered_until()
+    if covered is None:
+        first = db.session.query(func.min(Transaction.created_at)).scalar()
+        covered = _midnight(first.date()) if first else target
+        previous = None
+    else:
+        previous = covered
+    folded = 0
+    while covered < target or previous is None:
+        end = min(covered + timedelta(days=REFRESH_DAYS_PER_BATCH), target)
+        groups = _fold(covered, end) if covered < end else 0
+        # Buckets and watermark move in one transaction; a concurrent refresh makes this one back off
+        if not _advance(previous, max(end, covered)):
+            db.session.rollback()
+            log("Another refresh advanced the watermark first, stopping")
+            return folded
+        db.session.commit()
+        folded += groups
+        log(f"Folded {covered} .. {end}: {groups} group(s)")
+        previous = covered = max(end, covered)
+    return folded
+
+def rebuild(since=None, log=print):
+    """Recompute the buckets behind the watermark from the month of `since` (default: all), a month at a time."""
+    first = db.session.query(func.min(Transaction.created_at)).scalar()
+    covered = covered_until()
+    db.session.commit() # So the first month's read takes a fresh snapshot on MySQL, after the watermark lock
+    if covered is None or first is None:
+        return 0
+    month = _month(since or first.date())
+    rebuilt = 0
+    while True:
+        # Locks the watermark, so a concurrent refresh cannot fold into the month being redone
+        covered = db.session.query(RollupWatermark).filter_by(name=WATERMARK).with_for_update().populate_existing() \
+            .one().covered_until
+        if _midnight(month) >= covered:
+            db.session.rollback()
+            return rebuilt
+        next_month = _next_month(month)
+        RevenueBucket.query.filter(RevenueBucket.grain == "day", RevenueBucket.period >= month,
+                                   RevenueBucket.period < next_month).delete(synchronize_session=False)
+        RevenueBucket.query.filter(RevenueBucket.grain == "month",
+                                   RevenueBucket.period == month).delete(synchronize_session=False)
+        groups = _fold(_midnight(month), min(_midnight(next_month), covered))
+        db.session.commit()
+        rebuilt += groups
+        log(f"Rebuilt {month:%Y-%m}: {groups} group(s)")
+        month = next_month
+
+def _bucket_totals(grain, start, end, keys, filters):
+    b = RevenueBucket
+    query = db.session.query(*keys, func.sum(b.gross_cents), func.sum(b.fee_cents),
+                             func.sum(b.transaction_count)).filter(b.grain == grain, *filters)
+    if start:
+        query = query.filter(b.period >= start)
+    if end:
+        query = query.filter(b.period < end)
+    return query.group_by(*keys).all()
+
+def _ranges(since, until, bucket):
+    """[(grain, start, end)] of bucket rows that exactly tile [since, until) (dates, None = open)."""
+    if bucket in ("day", "week"):
+        return [("day", since, until)]
+    first_full = since if since is None or since.day == 1 else _next_month(since)
+    last_full = until if until is None or until.day == 1 else _month(until)
+    if first_full is not None and last_full is not None and first_full >= last_full:
+        return [("day", since, until)]
+    ranges = [("month", first_full, last_full)]
+    if first_full != since:
+        ranges.append(("day", since, first_full))
+    if last_full != until:
+        ranges.append(("day", last_full, until))
+    return ranges
+
+def revenue(since=None, until=None, bucket=None, group_by=(), coach_id=None, transaction_type=None, currency=None):
+    """Totals for [since, until) (dates) per `bucket` period and `group_by` dimensions.
+
+    Currency is always a dimension: amounts in different currencies are never added up.
+    Returns (rows, covered_until); rows are dicts sorted by period and dimensions.
+    """
+    per_coach = "coach" in group_by or coach_id is not None
+    results = {}
+    def add(row):
+        row = list(row)
+        day = _as_date(row.pop(0)) if bucket else None
+        coach = row.pop(0) if "coach" in group_by else None
+        kind = row.pop(0) if "type" in group_by else None
+        row_currency, gross, fee, count = row
+        key = (_period(bucket, day), None if coach in (NO_COACH, None) else coach, kind, row_currency)
+        total = results.setdefault(key, [0, 0, 0])
+        total[0] += int(gross or 0)
+        total[1] += int(fee or 0)
+        total[2] += int(count or 0)
+
+    def keys(period, coach, kind, row_currency):
+        return ([period] if bucket else []) + ([coach] if "coach" in group_by else []) + \
+            ([kind] if "type" in group_by else []) + [row_currency]
+
+    covered = covered_until()
+    if covered is not None:
+        b = RevenueBucket
+        filters = [b.coach_id == coach_id if coach_id is not None else
+                   (b.coach_id != ALL_COACHES if per_coach else b.coach_id == ALL_COACHES)]
+        if transaction_type:
+            filters.append(b.transaction_type == transaction_type)
+        if currency:
+            filters.append(b.currency == currency)
+        for grain, start, end in _ranges(since, until, bucket):
+            for row in _bucket_totals(grain, start, end, keys(b.period, b.coach_id, b.transaction_type, b.currency),
+                                      filters):
+                add(row)
+
+    # The tail past the watermark (everything, before the first refresh), exactly from the ledger
+    t = Transaction
+    filters = []
+    if coach_id is not None:
+        filters.append(t.coach_id == coach_id)
+    if transaction_type:
+        filters.append(t.transaction_type == transaction_type)
+    if currency:
+        filters.append(t.currency == currency)
+    start = max(filter(None, [covered, _midnight(since) if since else None]), default=None)
+    end = _midnight(until) if until else None
+    if start is None or end is None or start < end:
+        # Grouping on an expression keeps SQLite off walking a coach_id index in full to skip the sort
+        for row in _ledger_totals(start, end, keys(func.date(t.created_at), func.coalesce(t.coach_id, NO_COACH),
+                                                   t.transaction_type, t.currency), filters):
+            add(row)
+
+    rows = []
+    for (period, coach, kind, row_currency), (gross, fee, count) in sorted(
+            results.items(), key=lambda item: tuple((value is None, value) for value in item[0])):
+        row = {"period": period.isoformat()} if bucket else {}
+        if "coach" in group_by:
+            row["coach_id"] = coach
+        if "type" in group_by:
+            row["transaction_type"] = kind
+        row.update({"currency": row_currency, "gross_cents": gross, "fee_cents": fee, "net_cents": gross - fee,
+                    "transaction_count": count})
+        rows.append(row)
+    return rows, covered
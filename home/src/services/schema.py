@@ -0,0 +1,115 @@
+from sqlalchemy import inspect, func, text
+from src.models.user import db
+from src.models.monetization import PayPerViewPurchase
+from src.models.finance import Transaction
+
+# db.create_all() only creates missing tables, so databases created before a column or an
+# index was declared on a model never get it. ensure_columns() and ensure_indexes() bring
+# them up to date in place.
+
+def remove_duplicate_purchases():
+    """Collapse duplicate (fan_id, content_id) purchases so the unique index can be built.
+
+    Keeps the oldest purchase and repoints any Transaction.purchase_id at it.
+    Returns the number of rows removed.
+    """
+    keepers = db.session.query(
+        PayPerViewPurchase.fan_id, PayPerViewPurchase.content_id, func.min(PayPerViewPurchase.id)
+    ).group_by(PayPerViewPurchase.fan_id, PayPerViewPurchase.content_id).having(func.count() > 1).all()
+
+    removed = 0
+    for fan_id, content_id, keep_id in keepers:
+        duplicate_ids = [row.id for row in PayPerViewPurchase.query.with_entities(PayPerViewPurchase.id).filter(
+            PayPerViewPurchase.fan_id == fan_id,
+            PayPerViewPurchase.content_id == content_id,
+            PayPerViewPurchase.id != keep_id
+        )]
+        Transaction.query.filter(Transaction.purchase_id.in_(duplicate_ids)).update(
+            {Transaction.purchase_id: keep_id}, synchronize_session=False)
+        removed += PayPerViewPurchase.query.filter(PayPerViewPurchase.id.in_(duplicate_ids)).delete(
+            synchronize_session=False)
+    db.session.commit()
+    return removed
+
+def ensure_columns(log=print):
+    """Add nullable columns declared on the models that the live tables are missing.
+
+    Returns the "table.column" names it added. Columns that need a NOT NULL backfill
+    are out of scope and must be migrated by hand.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            log(f"Adding column {table.name}.{column.name} {column_type}")
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {engine.dialect.identifier_preparer.quote(table.name)} "
+                                  f"ADD COLUMN {engine.dialect.identifier_preparer.quote(column.name)} {column_type}"))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+def ensure_collations(log=print):
+    """On MySQL, convert columns declared with a collation the live table does not have yet.
+
+    Returns the "table.column" names it converted.
+    """
+    engine = db.engine
+    if engine.dialect.name != "mysql":
+        return []
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    changed = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        for column in table.columns:
+            collation = getattr(column.type.dialect_impl(engine.dialect), "collation", None)
+            if not collation:
+                continue
+            with engine.begin() as conn:
+                current = conn.execute(text(
+                    "SELECT COLLATION_NAME FROM information_schema.COLUMNS "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND COLUMN_NAME = :column"),
+                    {"table": table.name, "column": column.name}).scalar()
+                if current is None or current == collation:
+                    continue
+                log(f"Converting {table.name}.{column.name} from {current} to {collation}")
+                quote = engine.dialect.identifier_preparer.quote
+                conn.execute(text(f"ALTER TABLE {quote(table.name)} MODIFY {quote(column.name)} "
+                                  f"{column.type.compile(dialect=engine.dialect)}"
+                                  f"{'' if column.nullable else ' NOT NULL'}"))
+            changed.append(f"{table.name}.{column.name}")
+    return changed
+
+def ensure_indexes(log=print):
+    """Create every index declared on the models that the live database is missing.
+
+    Safe to run repeatedly; returns the names of the indexes it created.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if index.name in existing:
+                continue
+            if index.name == "uq_ppv_fan_content":
+                removed = remove_duplicate_purchases()
+                if removed:
+                    log(f"Removed {removed} duplicate pay-per-view purchases")
+            log(f"Creating index {index.name} on {table.name}")
+            index.create(bind=engine)
+            created.append(index.name)
+    return created
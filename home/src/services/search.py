@@ -0,0 +1,170 @@
+import math
+import re
+from collections import Counter
+from sqlalchemy import and_, or_, insert, func
+from sqlalchemy.orm import aliased
+from src.models.user import db
+from src.models.content import Content, ContentSearchTerm
+from src.services.entitlements import LRUTTLCache
+
+# Ranked full-text search over Content.title/description backed by ContentSearchTerm, an
+# inverted index kept in the database. Every query term must match. Scoring is BM25-style:
+# the term weight per item (title hits count 3x) times the term's IDF, as integers so
+# (score, id) cursors are exact. Multi-term queries start from the rarest term's postings
+# and probe the others by primary key, so cost follows the rarest term, not the table size.
+
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+MAX_TERM_WEIGHT = 30
+TITLE_WEIGHT = 3
+REBUILD_BATCH_SIZE = 1000
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has how i in is it its my of on or our that the this to
+was what when with you your
+""".split())
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# term -> number of indexed items containing it; counts drift by at most the TTL
+document_frequencies = LRUTTLCache(max_size=50000, ttl=60.0)
+
+def tokenize(text):
+    if not text:
+        return []
+    return [token[:MAX_TERM_LENGTH] for token in _TOKEN.findall(text.lower())
+            if len(token) > 1 and token not in STOPWORDS]
+
+def term_weights(title, description):
+    weights = Counter()
+    for term in tokenize(title):
+        weights[term] += TITLE_WEIGHT
+    for term in tokenize(description):
+        weights[term] += 1
+    return {term: min(weight, MAX_TERM_WEIGHT) for term, weight in weights.items()}
+
+def _postings(content):
+    return [{"term": term, "content_id": content.id, "weight": weight}
+            for term, weight in term_weights(content.title, content.description).items()]
+
+def index_content(content):
+    """(Re)index one item inside the caller's transaction."""
+    if content.id is None:
+        db.session.flush() # New item: nothing to remove first
+    else:
+        remove_content(content.id)
+    rows = _postings(content)
+    if rows:
+        db.session.execute(insert(ContentSearchTerm), rows)
+
+def remove_content(content_id):
+    ContentSearchTerm.query.filter(ContentSearchTerm.content_id == content_id).delete(synchronize_session=False)
+
+def rebuild_index(batch_size=REBUILD_BATCH_SIZE, log=print):
+    """Reindex every Content row in id order, one committed batch at a time."""
+    last_id = 0
+    indexed = 0
+    while True:
+        batch = db.session.query(Content.id, Content.title, Content.description, Content.deleted_at).filter(
+            Content.id > last_id).order_by(Content.id).limit(batch_size).all()
+        if not batch:
+            break
+        ids = [row.id for row in batch]
+        ContentSearchTerm.query.filter(ContentSearchTerm.content_id.in_(ids)).delete(synchronize_session=False)
+        rows = [posting for row in batch if row.deleted_at is None for posting in _postings(row)]
+        if rows:
+            db.session.execute(insert(ContentSearchTerm), rows)
+        db.session.commit()
+        indexed += len(batch)
+        last_id = ids[-1]
+        log(f"Indexed {indexed} item(s) up to #{last_id}")
+    document_frequencies.clear()
+    return indexed
+
+def _document_frequencies(terms):
+    result = {}
+    missing = []
+    for term in terms:
+        cached = document_frequencies.get(term)
+        if cached is None:
+            missing.append(term)
+        else:
+            result[term] = cached
+    if missing:
+        counts = dict(db.session.query(ContentSearchTerm.term, func.count()).filter(
+            ContentSearchTerm.term.in_(missing)).group_by(ContentSearchTerm.term).all())
+        for term in missing:
+            result[term] = counts.get(term, 0)
+            document_frequencies.set(term, result[term])
+    return result
+
+def _total_documents():
+    cached = document_frequencies.get(("__total__",))
+    if cached is None:
+        cached = db.session.query(func.count(Content.id)).filter(Content.deleted_at.is_(None)).scalar() or 0
+        document_frequencies.set(("__total__",), cached)
+    return cached
+
+def idf(df, total):
+    return int(round(100 * math.log(1 + (total - df + 0.5) / (df + 0.5)))) + 1
+
+def ranked_query(terms, frequencies, total, content_type=None, access_setting=None, coach_id=None, after=None):
+    """Build the ranked query for `terms`; returns (query, score expression)."""
+    terms = sorted(terms, key=lambda term: frequencies[term])
+    if len(terms) == 1:
+        # The score is weight * a constant, so ix_content_search_term_rank yields the top
+        # results already in order: reading a page costs O(limit) even for common terms
+        term_idf = idf(frequencies[terms[0]], total)
+        query = db.session.query(ContentSearchTerm.content_id).filter(ContentSearchTerm.term == terms[0])
+        query = _filtered(query, ContentSearchTerm.content_id, content_type, access_setting, coach_id)
+        if after:
+            after_weight, after_id = after[0] // term_idf, after[1]
+            query = query.filter(or_(ContentSearchTerm.weight < after_weight,
+                                     and_(ContentSearchTerm.weight == after_weight, ContentSearchTerm.content_id < after_id)))
+        score = ContentSearchTerm.weight * term_idf
+        return query.order_by(ContentSearchTerm.weight.desc(), ContentSearchTerm.content_id.desc()), score
+
+    # Drive from the rarest term; every other term is a primary-key probe per candidate
+    driver = aliased(ContentSearchTerm)
+    score = driver.weight * idf(frequencies[terms[0]], total)
+    query = db.session.query(driver.content_id)
+    for term in terms[1:]:
+        posting = aliased(ContentSearchTerm)
+        query = query.join(posting, and_(posting.term == term, posting.content_id == driver.content_id))
+        score = score + posting.weight * idf(frequencies[term], total)
+    query = _filtered(query.filter(driver.term == terms[0]), driver.content_id, content_type, access_setting, coach_id)
+    if after:
+        after_score, after_id = after
+        query = query.filter(or_(score < after_score, and_(score == after_score, driver.content_id < after_id)))
+    return query.order_by(score.desc(), driver.content_id.desc()), score
+
+def _filtered(query, content_id_col, content_type, access_setting, coach_id):
+    if content_type or access_setting or coach_id:
+        query = query.join(Content, Content.id == content_id_col)
+        if content_type:
+            query = query.filter(Content.content_type == content_type)
+        if access_setting:
+            query = query.filter(Content.access_setting == access_setting)
+        if coach_id:
+            query = query.filter(Content.coach_id == coach_id)
+    return query
+
+def search(query_text, content_type=None, access_setting=None, coach_id=None, after=None, limit=20):
+    """Return ([(Content, score)], next (score, id) or None) for one page of results."""
+    terms = list(dict.fromkeys(tokenize(query_text)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return [], None
+    frequencies = _document_frequencies(terms)
+    if not all(frequencies.values()):
+        return [], None # Every term must match somewhere
+    total = max(_total_documents(), max(frequencies.values()))
+    query, score = ranked_query(terms, frequencies, total, content_type, access_setting, coach_id, after)
+    rows = query.add_columns(score.label("score")).limit(limit + 1).all()
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = (int(rows[-1].score), rows[-1].content_id)
+
+    contents = {content.id: content for content in Content.query.filter(
+        Content.id.in_([row.content_id for row in rows]), Content.deleted_at.is_(None))} if rows else {}
+    return [(contents[row.content_id], int(row.score)) for row in rows if row.content_id in contents], next_after
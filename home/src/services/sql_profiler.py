@@ -0,0 +1,119 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Counts queries, DB time and repeated statement shapes per request (or per `profile()`
+# block) using SQLAlchemy engine events. Repeating one shape many times in a request is
+# the signature of an N+1: a lazy relationship or a Model.query.get inside a loop.
+
+DEFAULT_N_PLUS_ONE_THRESHOLD = 5
+
+_active_profiles = ContextVar("sql_profiles", default=())
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|%s|%\(\w+\)s)\s*,)+\s*(?:\?|%s|%\(\w+\)s)\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+def statement_shape(statement):
+    """Normalize SQL so one query issued with different IN-list lengths counts as one shape."""
+    return _WHITESPACE.sub(" ", _PLACEHOLDER_LIST.sub("(?...)", statement)).strip()
+
+class SQLProfile:
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.total_time += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold=2):
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+    def max_repeat(self):
+        return max(self.shapes.values(), default=0)
+
+    def summary(self):
+        return f"{self.count} queries, {self.total_time * 1000:.1f} ms, {len(self.shapes)} shapes"
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active_profiles.get():
+        conn.info.setdefault("sql_profiler_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profiles = _active_profiles.get()
+    if not profiles:
+        return
+    started = conn.info.get("sql_profiler_started")
+    seconds = time.perf_counter() - started.pop() if started else 0.0
+    for profile in profiles:
+        profile.record(statement, seconds)
+
+_listening = False
+
+def _listen():
+    global _listening
+    if not _listening:
+        # On the Engine class so every engine (and bind) is covered
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _listening = True
+
+@contextmanager
+def profile():
+    """Collect an SQLProfile for the queries issued inside the block (nests with requests)."""
+    _listen()
+    sql_profile = SQLProfile()
+    token = _active_profiles.set(_active_profiles.get() + (sql_profile,))
+    try:
+        yield sql_profile
+    finally:
+        _active_profiles.reset(token)
+
+@contextmanager
+def assert_query_budget(max_queries, label="block"):
+    """Fail if the block issues more than `max_queries` queries, e.g. around a test client call."""
+    with profile() as sql_profile:
+        yield sql_profile
+    if sql_profile.count > max_queries:
+        details = "\n".join(f"  {n}x {shape}" for shape, n in sql_profile.shapes.most_common(5))
+        raise AssertionError(f"{label}: {sql_profile.count} queries, budget is {max_queries}\n{details}")
+
+def init_app(app):
+    _listen()
+    threshold = app.config.get("SQL_N_PLUS_ONE_THRESHOLD", DEFAULT_N_PLUS_ONE_THRESHOLD)
+
+    @app.before_request
+    def start_sql_profile():
+        g.sql_profile = SQLProfile()
+        g.sql_profile_token = _active_profiles.set(_active_profiles.get() + (g.sql_profile,))
+
+    @app.after_request
+    def report_sql_profile(response):
+        sql_profile = g.get("sql_profile")
+        if sql_profile is None:
+            return response
+        suspects = sql_profile.repeated(threshold)
+        for shape, n in suspects.items():
+            app.logger.warning("Possible N+1 on %s %s: %d x %s", request.method, request.path, n, shape[:200])
+        if app.config.get("SQL_PROFILER_HEADERS"):
+            response.headers["X-SQL-Queries"] = str(sql_profile.count)
+            response.headers["X-SQL-Time-Ms"] = f"{sql_profile.total_time * 1000:.2f}"
+            response.headers["X-SQL-Max-Repeat"] = str(sql_profile.max_repeat())
+            if suspects:
+                response.headers["X-SQL-N-Plus-One"] = "true"
+        return response
+
+    @app.teardown_request
+    def end_sql_profile(exc):
+        token = g.pop("sql_profile_token", None)
+        if token is not None:
+            try:
+                _active_profiles.reset(token)
+            except ValueError:
+                _active_profiles.set(()) # Torn down from another context (e.g. a streamed response)
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from flask import current_app
+from flask import Request
+
+CHUNK_SIZE = 1024 * 1024
+HASH_NAME = "sha256"
+
+class StorageBackend(ABC):
+    """Where uploaded media lives. `Content.file_url` stores the key returned by save()."""
+
+    @abstractmethod
+    def save(self, file_storage, extension):
+        pass
+
+    @abstractmethod
+    def save_path(self, path, extension):
+        """Store a finished local file (e.g. a generated variant), consuming it."""
+
+    @abstractmethod
+    def open(self, key):
+        pass
+
+    @abstractmethod
+    def exists(self, key):
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    @abstractmethod
+    def size(self, key):
+        pass
+
+    def local_path(self, key):
+        """Filesystem path for `key`, or None for backends that are not on local disk."""
+        return None
+
+    def age(self, key):
+        """Seconds since `key` was last saved (a save of identical bytes counts), or None if unknown."""
+        return None
+
+class HashingFile:
+    """Write-through temp file that hashes bytes as Werkzeug streams an upload into it."""
+
+    def __init__(self, directory):
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix="upload-", delete=False)
+        self.name = self._file.name
+        self.hash = hashlib.new(HASH_NAME)
+        self.size = 0
+        self._hashing = True
+
+    def write(self, data):
+        if self._hashing:
+            self.hash.update(data)
+            self.size += len(data)
+        return self._file.write(data)
+
+    def seek(self, *args):
+        # Werkzeug rewinds once the part is complete; anything after that is a read
+        self._hashing = False
+        return self._file.seek(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+class LocalStorage(StorageBackend):
+    """Content-addressed files on local disk: <root>/sha256/ab/cd/<digest>.<ext>.
+
+    Identical uploads share one file. Uploads are streamed into <root>/.staging while
+    being hashed and then renamed into place, so large videos are written exactly once.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.staging = os.path.join(root, ".staging")
+        os.makedirs(self.staging, exist_ok=True)
+
+    def new_upload_stream(self):
+        return HashingFile(self.staging)
+
+    def _key(self, digest, extension):
+        name = f"{digest}.{extension}" if extension else digest
+        return "/".join([HASH_NAME, digest[:2], digest[2:4], name])
+
+    def local_path(self, key):
+        if os.path.isabs(key):
+            return key # Legacy rows stored absolute paths
+        return os.path.join(self.root, *key.split("/"))
+
+    def _commit(self, temp_path, digest, extension):
+        key = self._key(digest, extension)
+        final_path = self.local_path(key)
+        if os.path.exists(final_path):
+            try:
+                os.utime(final_path) # Same bytes already stored; mark them as just saved, see age()
+                os.remove(temp_path)
+                return key
+            except FileNotFoundError:
+                pass # Purged in between: store this copy instead
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(temp_path, final_path)
+        return key
+
+    def save(self, file_storage, extension):
+        stream = file_storage.stream
+        if isinstance(stream, HashingFile) and os.path.dirname(stream.name) == self.staging:
+            stream.close()
+            return self._commit(stream.name, stream.hash.hexdigest(), extension)
+
+        # Not spooled by UploadRequest (e.g. small in-memory parts): copy in chunks while hashing
+        digest = hashlib.new(HASH_NAME)
+        with tempfile.NamedTemporaryFile(dir=self.staging, prefix="upload-", delete=False) as temp:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                temp.write(chunk)
+        return self._commit(temp.name, digest.hexdigest(), extension)
+
+    def save_path(self, path, extension):
+        digest = hashlib.new(HASH_NAME)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return self._commit(path, digest.hexdigest(), extension)
+
+    def open(self, key):
+        return open(self.local_path(key), "rb")
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def delete(self, key):
+        path = self.local_path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def size(self, key):
+        return os.path.getsize(self.local_path(key))
+
+    def age(self, key):
+        return time.time() - os.path.getmtime(self.local_path(key))
+
+# name -> factory(app); an object-store adapter registers itself here
+STORAGE_BACKENDS = {
+    "local": lambda app: LocalStorage(app.config["UPLOAD_FOLDER"]),
+}
+
+def register_storage_backend(name, factory):
+    STORAGE_BACKENDS[name] = factory
+
+def get_storage(app=None):
+    app = app or current_app
+    storage = app.extensions.get("storage")
+    if storage is None:
+        backend = app.config.get("STORAGE_BACKEND", "local")
+        storage = STORAGE_BACKENDS[backend](app)
+        app.extensions["storage"] = storage
+    return storage
+
+class UploadRequest(Request):
+    """Request class that spools multipart file parts straight into the storage staging area."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        storage = get_storage()
+        if not hasattr(storage, "new_upload_stream"):
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        stream = storage.new_upload_stream()
+        self.__dict__.setdefault("_staged_uploads", []).append(stream)
+        return stream
+
+    def close(self):
+        super().close()
+        # Staged parts that were never saved (rejected or ignored uploads) are removed
+        for stream in self.__dict__.get("_staged_uploads", []):
+            stream.close()
+            if os.path.exists(stream.name):
+                os.remove(stream.name)
@@ -0,0 +1,109 @@
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func, update
+from sqlalchemy.exc import SQLAlchemyError
+from src.models.user import db
+from src.models.monetization import Subscription
+from src.services import entitlements, feed
+from src.services.db_routing import primary
+
+# Subscriptions are created with is_active=True and nothing used to clear it once end_date
+# passed, so the "active" rows every access check reads kept growing with expired ones.
+# `flask expire-subscriptions` flips overdue rows to inactive in batches of batch_size, oldest
+# first, reading them off ix_subscription_active_end (partial on is_active where the database
+# supports it, so it only ever holds the live set).
+#
+# Access checks still compare end_date with now: between sweeps a subscription can be past its
+# end and not yet expired. The sweep lag (age of the oldest such row) is exported as
+# subscription_expiry_lag_seconds.
+#
+# Other processes learn of an expiry through the shared response cache tier: invalidating a
+# subscription bumps the fan's generation there (see entitlements.py), which every web
+# worker's entitlement and feed caches check before trusting an entry.
+
+DEFAULT_BATCH_SIZE = 1000
+
+# handler(expired) for every swept batch, after it is committed. `expired` is a list of
+# {"id", "fan_id", "coach_id", "end_date"} dicts. Register more with @expiry_handler.
+EXPIRY_HANDLERS = []
+
+def expiry_handler(f):
+    if f not in EXPIRY_HANDLERS:
+        EXPIRY_HANDLERS.append(f)
+    return f
+
+@expiry_handler
+def invalidate_caches(expired):
+    # Drops the sweeper's own entries and bumps each fan's shared generation for the web workers
+    for subscription in expired:
+        entitlements.invalidate_subscription(subscription["fan_id"], subscription["coach_id"])
+        feed.invalidate_fan(subscription["fan_id"])
+
+def overdue_query(now, batch_size=DEFAULT_BATCH_SIZE):
+    return db.session.query(Subscription.id, Subscription.fan_id, Subscription.coach_id, Subscription.end_date).filter(
+        Subscription.is_active == True, Subscription.end_date <= now
+    ).order_by(Subscription.end_date).limit(batch_size)
+
+def expire_batch(now=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Expire up to `batch_size` overdue subscriptions and notify the handlers. Returns how many."""
+    now = now or datetime.utcnow()
+    rows = overdue_query(now, batch_size).all()
+    if not rows:
+        db.session.commit()
+        return 0
+    # Re-checked in the UPDATE, so a row renewed since the read is left alone and not reported
+    statement = update(Subscription).where(
+        Subscription.id.in_([row.id for row in rows]), Subscription.is_active == True, Subscription.end_date <= now
+    ).values(is_active=False).execution_options(synchronize_session=False)
+    if db.session.get_bind().dialect.update_returning:
+        rows = db.session.execute(statement.returning(Subscription.id, Subscription.fan_id, Subscription.coach_id,
+                                                      Subscription.end_date)).all()
+    elif db.session.execute(statement).rowcount != len(rows):
+        # No RETURNING (MySQL): keep the rows that are inactive now, still inside the transaction
+        ids = {subscription_id for (subscription_id,) in db.session.query(Subscription.id).filter(
+            Subscription.id.in_([row.id for row in rows]), Subscription.is_active == False)}
+        rows = [row for row in rows if row.id in ids]
+    db.session.commit()
+
+    expired = [{"id": row.id, "fan_id": row.fan_id, "coach_id": row.coach_id, "end_date": row.end_date}
+               for row in rows]
+    for handler in EXPIRY_HANDLERS:
+        try:
+            handler(expired)
+        except Exception as e:
+            current_app.logger.warning("Subscription expiry handler %s failed: %s", handler.__name__, e)
+    return len(rows)
+
+def expire_overdue(now=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Expire everything overdue at `now`, a batch at a time. Returns the number expired."""
+    now = now or datetime.utcnow()
+    total = 0
+    while True:
+        count = expire_batch(now, batch_size)
+        total += count
+        if count < batch_size:
+            return total
+
+def run_sweeper(batch_size=DEFAULT_BATCH_SIZE, poll_interval=60.0, stop=None):
+    """Expire overdue subscriptions until `stop()` returns True, sleeping once caught up."""
+    while not (stop and stop()):
+        if expire_batch(batch_size=batch_size) < batch_size:
+            time.sleep(poll_interval)
+
+def lag_seconds(now=None):
+    """Seconds since the end of the oldest subscription still marked active, 0 when caught up."""
+    now = now or datetime.utcnow()
+    with primary():
+        oldest = db.session.query(func.min(Subscription.end_date)).filter(
+            Subscription.is_active == True, Subscription.end_date <= now).scalar()
+    return (now - oldest).total_seconds() if oldest else 0.0
+
+def metric_lines():
+    try:
+        lag = lag_seconds()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return []
+    return ["# HELP subscription_expiry_lag_seconds Age of the oldest overdue subscription still marked active.",
+            "# TYPE subscription_expiry_lag_seconds gauge", f"subscription_expiry_lag_seconds {lag:.3f}"]
@@ -0,0 +1,143 @@
+import random
+import threading
+import time
+from flask import request, g
+
+# Per-process request metrics rendered in the Prometheus text format. Nothing here reads
+# request or response bodies: sizes come from Content-Length headers.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_LOGGED_BODY = 16 * 1024
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{str(value).replace(chr(34), chr(39))}"' for key, value in labels.items()) + "}"
+
+class Metrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.requests = {} # (endpoint, method, status) -> count
+        self.latency = {} # (endpoint, method) -> [bucket counts..., sum, count]
+        self.request_bytes = {} # (endpoint, method) -> [sum, count]
+        self.response_bytes = {}
+        self.in_flight = {} # endpoint -> gauge
+        self.startup = {} # phase -> seconds, for this process
+        self.collectors = []
+
+    def started(self, endpoint):
+        with self._lock:
+            self.in_flight[endpoint] = self.in_flight.get(endpoint, 0) + 1
+
+    def finished(self, endpoint):
+        with self._lock:
+            self.in_flight[endpoint] = self.in_flight.get(endpoint, 0) - 1
+
+    def observe(self, endpoint, method, status, seconds, request_size, response_size):
+        key = (endpoint, method)
+        with self._lock:
+            status_key = (endpoint, method, status)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+            for sizes, size in ((self.request_bytes, request_size), (self.response_bytes, response_size)):
+                if size is not None:
+                    total = sizes.setdefault(key, [0, 0])
+                    total[0] += size
+                    total[1] += 1
+
+    def register_collector(self, collector):
+        """Add a callable returning extra exposition lines (e.g. cache or queue gauges)."""
+        with self._lock:
+            if collector not in self.collectors:
+                self.collectors.append(collector)
+
+    def record_startup(self, phase, seconds):
+        with self._lock:
+            self.startup[phase] = seconds
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines += ["# HELP http_requests_total Requests handled, by endpoint, method and status.",
+                      "# TYPE http_requests_total counter"]
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}")
+
+            lines += ["# HELP http_request_duration_seconds Time spent producing the response.",
+                      "# TYPE http_request_duration_seconds histogram"]
+            for (endpoint, method), histogram in sorted(self.latency.items()):
+                for bound, count in zip(self.buckets, histogram):
+                    lines.append(f"http_request_duration_seconds_bucket"
+                                 f"{_labels(endpoint=endpoint, method=method, le=bound)} {count}")
+                lines.append(f"http_request_duration_seconds_bucket"
+                             f"{_labels(endpoint=endpoint, method=method, le='+Inf')} {histogram[-1]}")
+                lines.append(f"http_request_duration_seconds_sum{_labels(endpoint=endpoint, method=method)} {histogram[-2]:.6f}")
+                lines.append(f"http_request_duration_seconds_count{_labels(endpoint=endpoint, method=method)} {histogram[-1]}")
+
+            for name, sizes, help_text in (("http_request_size_bytes", self.request_bytes, "Request body sizes (Content-Length)."),
+                                           ("http_response_size_bytes", self.response_bytes, "Response body sizes, when known.")):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+                for (endpoint, method), (total, count) in sorted(sizes.items()):
+                    lines.append(f"{name}_sum{_labels(endpoint=endpoint, method=method)} {total}")
+                    lines.append(f"{name}_count{_labels(endpoint=endpoint, method=method)} {count}")
+
+            lines += ["# HELP http_requests_in_flight Requests currently being handled.",
+                      "# TYPE http_requests_in_flight gauge"]
+            for endpoint, gauge in sorted(self.in_flight.items()):
+                lines.append(f"http_requests_in_flight{_labels(endpoint=endpoint)} {gauge}")
+
+            lines += ["# HELP app_startup_seconds Time this process spent importing and creating the app.",
+                      "# TYPE app_startup_seconds gauge"]
+            for phase, seconds in sorted(self.startup.items()):
+                lines.append(f"app_startup_seconds{_labels(phase=phase)} {seconds:.6f}")
+            collectors = list(self.collectors)
+
+        for collector in collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def _endpoint():
+    # The route template keeps label cardinality bounded (/api/content/<int:content_id>)
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+def _should_log_bodies(app):
+    rate = app.config.get("LOG_BODIES_SAMPLE_RATE", 0.0)
+    return rate > 0 and random.random() < rate
+
+def init_app(app):
+    @app.before_request
+    def start_request_timer():
+        g.telemetry_started = time.perf_counter()
+        g.telemetry_endpoint = _endpoint()
+        metrics.started(g.telemetry_endpoint)
+        g.log_bodies = _should_log_bodies(app)
+        # Headers only: touching request.files would parse (and spool) a whole upload first,
+        # and a chunked body has no length to check
+        if g.log_bodies and request.content_length is not None and request.content_length <= MAX_LOGGED_BODY \
+                and request.mimetype != "multipart/form-data":
+            app.logger.info("Request %s %s body: %r", request.method, request.path, request.get_data())
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop("telemetry_started", None)
+        if started is not None:
+            metrics.observe(g.telemetry_endpoint, request.method, response.status_code,
+                            time.perf_counter() - started, request.content_length, response.content_length)
+        if g.get("log_bodies") and not response.is_streamed and not response.direct_passthrough \
+                and (response.content_length or 0) <= MAX_LOGGED_BODY:
+            app.logger.info("Response %s %s body: %r", request.method, request.path, response.get_data())
+        return response
+
+    @app.teardown_request
+    def end_request(exc):
+        endpoint = g.pop("telemetry_endpoint", None)
+        if endpoint is not None:
+            metrics.finished(endpoint)
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+import time
+from flask import current_app
+
+# Verified Stripe events are appended here by the webhook endpoint and drained by
+# src/services/webhook_worker.py. The outbox is a local SQLite file in WAL mode, so
+# appends are durable, cheap and safe from several gunicorn workers at once, and the
+# event id primary key makes Stripe's redeliveries a no-op.
+
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+IGNORED = "ignored"
+DEAD = "dead"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_event (
+    event_id TEXT PRIMARY KEY,
+    event_type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    platform_fee_percentage REAL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    received_at REAL NOT NULL,
+    claimed_at REAL,
+    processed_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_webhook_event_status_received ON webhook_event (status, received_at);
+"""
+
+class SQLiteOutbox:
+    def __init__(self, path, lease_seconds=300):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL: an append is acknowledged to Stripe, which will not resend it, so it must survive a power cut
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, event_id, event_type, payload, platform_fee_percentage=None):
+        """Store an event once. Returns False if the event id was already recorded."""
+        cursor = self._connect().execute(
+            "INSERT OR IGNORE INTO webhook_event (event_id, event_type, payload, platform_fee_percentage, received_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (event_id, event_type, payload, platform_fee_percentage, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def claim_batch(self, limit):
+        """Lease up to `limit` pending events (or events whose lease expired after a crash)."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT * FROM webhook_event WHERE status = ? OR (status = ? AND claimed_at < ?) "
+                "ORDER BY received_at LIMIT ?",
+                (PENDING, PROCESSING, now - self.lease_seconds, limit)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE webhook_event SET status = ?, claimed_at = ?, attempts = attempts + 1 WHERE event_id = ?",
+                    [(PROCESSING, now, row["event_id"]) for row in rows]
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def mark(self, event_ids, status, error=None):
+        if not event_ids:
+            return
+        self._connect().executemany(
+            "UPDATE webhook_event SET status = ?, last_error = ?, processed_at = ? WHERE event_id = ?",
+            [(status, error, time.time(), event_id) for event_id in event_ids]
+        )
+
+    def release(self, event_id, error, max_attempts):
+        """Return a failed event to the queue, or park it as dead once it has used its attempts."""
+        self._connect().execute(
+            "UPDATE webhook_event SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, last_error = ? "
+            "WHERE event_id = ?",
+            (max_attempts, DEAD, PENDING, error, event_id)
+        )
+
+    def counts(self):
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM webhook_event GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def oldest_pending_age(self):
+        row = self._connect().execute(
+            "SELECT MIN(received_at) AS oldest FROM webhook_event WHERE status IN (?, ?)", (PENDING, PROCESSING)
+        ).fetchone()
+        return time.time() - row["oldest"] if row["oldest"] else 0.0
+
+def get_outbox(app=None):
+    app = app or current_app
+    outbox = app.extensions.get("webhook_outbox")
+    if outbox is None:
+        path = app.config.get("WEBHOOK_OUTBOX_PATH") or os.path.join(os.getcwd(), "webhook_outbox.sqlite3")
+        outbox = SQLiteOutbox(path)
+        app.extensions["webhook_outbox"] = outbox
+    return outbox
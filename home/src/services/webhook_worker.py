@@ -0,0 +1,188 @@
+import json
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert
+from src.models.user import db
+from src.models.content import Content
+from src.models.finance import Transaction
+from src.services import entitlements, earnings, feed
+from src.services.webhook_outbox import get_outbox, DONE, IGNORED
+
+DEFAULT_BATCH_SIZE = 500
+MAX_ATTEMPTS = 8
+
+# event type -> handler(events) returning a list of Transaction row dicts to insert.
+# Each event is the decoded Stripe event dict plus a "platform_fee_percentage" captured
+# when it was received. Register extra handlers with @event_handler("type").
+EVENT_HANDLERS = {}
+
+def event_handler(event_type):
+    def register(f):
+        EVENT_HANDLERS[event_type] = f
+        return f
+    return register
+
+def ignore_event(events):
+    for event in events:
+        current_app.logger.info("Unhandled webhook event type %s (%s)", event["type"], event["id"])
+    return []
+
+# Called for event types without a registered handler
+fallback_handler = ignore_event
+
+def set_fallback_handler(f):
+    global fallback_handler
+    fallback_handler = f
+
+@event_handler("payment_intent.succeeded")
+def payment_intent_succeeded(events):
+    # Resolve PPV content -> coach for the whole batch in one query
+    ppv_content_ids = set()
+    for event in events:
+        metadata = event["data"]["object"].get("metadata") or {}
+        if metadata.get("item_type") == "content_ppv" and metadata.get("item_id"):
+            ppv_content_ids.add(int(metadata["item_id"]))
+    content_coaches = {}
+    if ppv_content_ids:
+        content_coaches = dict(db.session.query(Content.id, Content.coach_id).filter(Content.id.in_(ppv_content_ids)).all())
+
+    rows = []
+    for event in events:
+        payment_intent = event["data"]["object"]
+        metadata = payment_intent.get("metadata") or {}
+        item_id = metadata.get("item_id")
+        item_type = metadata.get("item_type")
+        fan_id = metadata.get("user_id") # This is the fan's ID
+
+        gross_amount = payment_intent["amount"] / 100.0 # Convert from cents
+        platform_fee_percentage = event["platform_fee_percentage"] / 100.0
+        platform_fee_amount = gross_amount * platform_fee_percentage
+        net_amount_for_coach = gross_amount - platform_fee_amount
+
+        coach_id_for_transaction = None
+        content_id_for_transaction = None
+        transaction_type_str = "unknown_payment"
+
+        if item_type in ["subscription_monthly", "subscription_yearly"]:
+            coach_id_for_transaction = int(item_id) if item_id else None # item_id is coach_id for subscriptions
+            transaction_type_str = "subscription_payment"
+        elif item_type == "content_ppv":
+            content_id_for_transaction = int(item_id) if item_id else None # item_id is content_id for PPV
+            coach_id_for_transaction = content_coaches.get(content_id_for_transaction)
+            if content_id_for_transaction not in content_coaches:
+                content_id_for_transaction = None # Purged since the payment started; the charge is still recorded
+            transaction_type_str = "ppv_purchase"
+
+        rows.append({
+            "transaction_type": transaction_type_str,
+            "user_id": int(fan_id) if fan_id else None,
+            "coach_id": coach_id_for_transaction,
+            "content_id": content_id_for_transaction,
+            "amount": gross_amount,
+            "platform_fee": platform_fee_amount,
+            "net_amount": net_amount_for_coach,
+            "currency": payment_intent["currency"],
+            "stripe_payment_intent_id": payment_intent["id"],
+            "status": "succeeded"
+        })
+    return rows
+
+@event_handler("payment_method.attached")
+def payment_method_attached(events):
+    return []
+
+def _decode(row):
+    event = json.loads(row["payload"])
+    fee_percentage = row["platform_fee_percentage"]
+    if fee_percentage is None:
+        fee_percentage = current_app.config.get("PLATFORM_FEE_PERCENTAGE", 15.0)
+    event["platform_fee_percentage"] = fee_percentage
+    return event
+
+def _invalidate_entitlements(rows):
+    for row in rows:
+        if not row["user_id"]:
+            continue
+        if row["transaction_type"] == "subscription_payment" and row["coach_id"]:
+            entitlements.invalidate_subscription(row["user_id"], row["coach_id"])
+            feed.invalidate_fan(row["user_id"])
+        elif row["transaction_type"] == "ppv_purchase" and row["content_id"]:
+            entitlements.invalidate_purchase(row["user_id"], row["content_id"])
+
+def after_insert(rows):
+    """Hook run after a batch of Transaction rows has been committed."""
+    _invalidate_entitlements(rows)
+
+def _insert_transactions(rows):
+    """Insert rows, skipping payment intents already in the ledger. Returns the rows inserted."""
+    intent_ids = [row["stripe_payment_intent_id"] for row in rows]
+    existing = {intent_id for (intent_id,) in db.session.query(Transaction.stripe_payment_intent_id).filter(
+        Transaction.stripe_payment_intent_id.in_(intent_ids))}
+    fresh = {}
+    for row in rows:
+        if row["stripe_payment_intent_id"] not in existing:
+            fresh.setdefault(row["stripe_payment_intent_id"], row)
+    new_rows = list(fresh.values())
+    if new_rows:
+        now = datetime.utcnow()
+        for row in new_rows:
+            row.setdefault("created_at", now)
+            row.setdefault("updated_at", now)
+        db.session.execute(insert(Transaction), new_rows)
+    return new_rows
+
+def _handle(events_by_type):
+    """Run handlers for one group of events and insert their rows in a single transaction."""
+    rows = []
+    for event_type, events in events_by_type.items():
+        handler = EVENT_HANDLERS.get(event_type, fallback_handler)
+        rows.extend(handler(events))
+    inserted = _insert_transactions(rows) if rows else []
+    # Same DB transaction as the ledger rows, so the rollups never drift from them
+    earnings.record_transactions(inserted)
+    db.session.commit()
+    after_insert(inserted)
+    return inserted
+
+def process_batch(outbox=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Drain one batch from the outbox. Returns the number of events taken off the queue."""
+    outbox = outbox or get_outbox()
+    claimed = outbox.claim_batch(batch_size)
+    if not claimed:
+        return 0
+
+    events_by_type = {}
+    event_ids_by_type = {}
+    try:
+        for row in claimed:
+            events_by_type.setdefault(row["event_type"], []).append(_decode(row))
+            event_ids_by_type.setdefault(row["event_type"], []).append(row["event_id"])
+        _handle(events_by_type)
+    except Exception:
+        db.session.rollback()
+        # Fall back to one event at a time so a single bad event cannot block the batch
+        for row in claimed:
+            try:
+                _handle({row["event_type"]: [_decode(row)]})
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.warning("Webhook event %s failed: %s", row["event_id"], e)
+                outbox.release(row["event_id"], str(e), MAX_ATTEMPTS)
+            else:
+                outbox.mark([row["event_id"]], _final_status(row["event_type"]))
+        return len(claimed)
+
+    for event_type, event_ids in event_ids_by_type.items():
+        outbox.mark(event_ids, _final_status(event_type))
+    return len(claimed)
+
+def _final_status(event_type):
+    return DONE if event_type in EVENT_HANDLERS else IGNORED
+
+def run_worker(batch_size=DEFAULT_BATCH_SIZE, poll_interval=1.0, stop=None):
+    """Process the outbox until `stop()` returns True, sleeping when it is empty."""
+    outbox = get_outbox()
+    while not (stop and stop()):
+        if process_batch(outbox, batch_size) == 0:
+            time.sleep(poll_interval)